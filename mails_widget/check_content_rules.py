@@ -0,0 +1,109 @@
+from datetime import date, datetime, timedelta, timezone
+
+from test7 import extract_local_events, find_date_mentions, strip_quoted_content, summary_cache_key
+
+# Regression checks for the content rules in test7.py that are easy to break
+# while tuning them. Run directly; every case prints and a failure stops with
+# an AssertionError.
+
+
+def check_signature_stripping():
+    """Sign-off blocks are stripped, but P.S. lines and other content after them are kept."""
+    plain = "Can you review the draft?\nThanks,\nJane Doe\nProduct Manager\n+1 555 010 2030"
+    stripped, removed = strip_quoted_content(plain)
+    assert stripped == "Can you review the draft?\nThanks,", stripped
+    assert removed > 0
+
+    postscript = "Can you review the draft?\nBest,\nJane\nP.S. The review moved to Sept 24 at 3pm."
+    stripped, _ = strip_quoted_content(postscript)
+    assert stripped == "Can you review the draft?\nBest,\nP.S. The review moved to Sept 24 at 3pm.", stripped
+
+    dated = "See you there.\nThanks,\nJane\nDinner is tomorrow at 7pm"
+    stripped, _ = strip_quoted_content(dated)
+    assert stripped.endswith("Dinner is tomorrow at 7pm"), stripped
+
+    action = "Notes attached.\nCheers,\nSam\nPlease send the signed copy back by email."
+    stripped, _ = strip_quoted_content(action)
+    assert stripped.endswith("Please send the signed copy back by email."), stripped
+
+    # A "thanks" line in the middle of the message is not a sign-off
+    for text in (
+        "Hello,\nThank you.\nThe server is down again\nPlease call me",
+        "Hi Bob\nCheers\nAgenda:\n- budget review\n- hiring plan",
+        "Hi team,\nThanks!\nThe budget is approved\nWe start Monday",
+    ):
+        stripped, removed = strip_quoted_content(text)
+        assert stripped == text and removed == 0, stripped
+
+    contact = "Report attached.\nBest regards,\nJane Doe\nVP of Sales, Acme Corp\njane@acme.com | www.acme.com"
+    stripped, _ = strip_quoted_content(contact)
+    assert stripped == "Report attached.\nBest regards,", stripped
+
+
+def check_past_weekdays():
+    """Weekdays that may refer to the past are left to the model instead of resolved forward."""
+    monday = datetime(2025, 9, 22, 9, 0, tzinfo=timezone(timedelta(hours=-7)))
+    for sentence in (
+        "Last Friday at 3pm we discussed the plan.",
+        "As discussed on Friday at 3pm, the plan stands.",
+        "The past Tuesday at 10am session was recorded.",
+        "We met on Wednesday at 2pm.",
+    ):
+        events, confident = extract_local_events(sentence, monday)
+        assert not confident, (sentence, events)
+
+    events, confident = extract_local_events("Let's meet Friday at 3pm in Room 201.", monday)
+    assert confident and events[0]['date'] == date(2025, 9, 26).isoformat(), events
+
+
+def check_explicit_dates():
+    """Explicit dates in the past, or without a time or event keyword, don't become local events."""
+    monday = datetime(2025, 9, 22, 9, 0, tzinfo=timezone(timedelta(hours=-7)))
+    for sentence in (
+        "Your order placed on Sept 3, 2025 has shipped.",
+        "Payment received on 2025-09-01.",
+        "We met on Sept 15 at 2pm.",
+        "The webinar recording from Sept 10 at 11am is online.",
+        "Version 2025-09-01 of the report is attached.",
+        "Your package shipped and arrives Oct 2.",
+        "I may 5 minutes late.",
+    ):
+        events, confident = extract_local_events(sentence, monday)
+        assert not confident, (sentence, events)
+
+    mentions, _ = find_date_mentions("I may 5 minutes late, it may 10 more.", monday)
+    assert not mentions, mentions
+    mentions, _ = find_date_mentions("The launch is on May 5.", monday)
+    assert [mention[2] for mention in mentions] == [date(2025, 5, 5)], mentions
+
+    events, confident = extract_local_events("The report deadline is Oct 3.", monday)
+    assert confident and events[0]['date'] == date(2025, 10, 3).isoformat(), events
+    events, confident = extract_local_events("Team meeting on Sept 30 at 2pm in Room 4.", monday)
+    assert confident and events[0]['time'] == '14:00', events
+
+
+def check_summary_cache_key():
+    """Summaries made with locally extracted events are cached apart from the others."""
+    key = summary_cache_key("Meet Friday at 3pm", "Plan", "a@example.com")
+    assert key == summary_cache_key("meet  friday at 3pm", "plan", "A@example.com ")
+    assert key != summary_cache_key("Meet Friday at 3pm", "Plan", "a@example.com", events_local=True)
+    assert key != summary_cache_key("Meet Friday at 3pm", "Other plan", "a@example.com")
+
+
+CHECKS = [
+    check_signature_stripping,
+    check_past_weekdays,
+    check_explicit_dates,
+    check_summary_cache_key,
+]
+
+
+def main():
+    for check in CHECKS:
+        check()
+        print(f"✅ {check.__name__}")
+    print(f"All {len(CHECKS)} checks passed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,272 @@
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the Cerebras (OpenAI-compatible) chat completions API.
+# Point the monitor at it with CEREBRAS_BASE_URL=http://localhost:8080 (see
+# CONFIG['cerebras_base_url'] in test7.py) to benchmark or load-test the
+# summary path without Cerebras access. Latency, server errors, 429s and
+# malformed JSON can be injected; responses are canned or echo the email.
+
+DEFAULT_PORT = 8080
+ECHO_WORDS = 40
+
+_EMAIL_ID_RE = re.compile(r'^### Email ID: (.+)$', re.MULTILINE)
+_EMAIL_CONTENT_RE = re.compile(r'Email Content:\n(.*?)(?:\n\nRemember:|\Z)', re.DOTALL)
+
+
+class LatencyModel:
+    """Samples response latency in seconds from a configurable distribution.
+
+    The sampled base latency stands for time to first token; ms_per_token is
+    added for each completion token to model generation time.
+    """
+
+    def __init__(self, distribution, mean_ms, jitter_ms, ms_per_token):
+        self.distribution = distribution
+        self.mean_ms = mean_ms
+        self.jitter_ms = jitter_ms
+        self.ms_per_token = ms_per_token
+
+    def sample(self, completion_tokens):
+        if self.distribution == 'uniform':
+            base_ms = random.uniform(self.mean_ms - self.jitter_ms, self.mean_ms + self.jitter_ms)
+        elif self.distribution == 'normal':
+            base_ms = random.gauss(self.mean_ms, self.jitter_ms)
+        elif self.distribution == 'lognormal':
+            # Long-tailed, like real LLM latency; jitter_ms is the standard deviation
+            if self.mean_ms > 0:
+                sigma = math.sqrt(math.log(1 + (self.jitter_ms / self.mean_ms) ** 2))
+                base_ms = random.lognormvariate(math.log(self.mean_ms) - sigma ** 2 / 2, sigma)
+            else:
+                base_ms = 0
+        else:
+            base_ms = self.mean_ms
+        return max(0.0, base_ms + completion_tokens * self.ms_per_token) / 1000
+
+
+class MockStats:
+    """Thread-safe request counters and latencies, served at GET /stats."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.latencies = []
+        self.request_times = []
+
+    def record(self, outcome, latency=None):
+        with self.lock:
+            self.counts[outcome] = self.counts.get(outcome, 0) + 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def admit(self, requests_per_minute):
+        """Sliding-window quota check. Returns seconds until a slot frees up, or 0."""
+        with self.lock:
+            now = time.monotonic()
+            self.request_times = [t for t in self.request_times if now - t < 60]
+            if requests_per_minute and len(self.request_times) >= requests_per_minute:
+                return 60 - (now - self.request_times[0])
+            self.request_times.append(now)
+            return 0
+
+    def snapshot(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        summary = {'counts': dict(self.counts), 'completed': len(latencies)}
+        if latencies:
+            summary['latency_ms'] = {
+                'p50': round(latencies[len(latencies) // 2] * 1000, 1),
+                'p95': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                'max': round(latencies[-1] * 1000, 1)
+            }
+        return summary
+
+
+def estimate_tokens(text):
+    """Rough token count, about 4 characters per token."""
+    return max(1, len(text) // 4)
+
+
+def echo_summary(text):
+    words = ' '.join(text.split()).split(' ')
+    return ' '.join(words[:ECHO_WORDS]) + (' ...' if len(words) > ECHO_WORDS else '')
+
+
+def build_result(email_content, mode):
+    """A summary result for one email: canned, or echoing the start of its content."""
+    if mode == 'echo':
+        summary = echo_summary(email_content)
+    else:
+        summary = 'Mock summary: the sender shares an update and asks for a reply.'
+    return {'summary': summary, 'priority': 5, 'events': []}
+
+
+def build_completion_content(request, mode):
+    """JSON text answering a summary, thread summary or batched summary prompt."""
+    messages = request.get('messages', [])
+    user_message = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+    email_ids = _EMAIL_ID_RE.findall(user_message)
+    if email_ids:
+        # Batched prompt: one result per Email ID block
+        blocks = re.split(r'^### Email ID: .+$', user_message, flags=re.MULTILINE)[1:]
+        results = [
+            dict(build_result(block.split('Content:', 1)[-1], mode), id=email_id.strip())
+            for email_id, block in zip(email_ids, blocks)
+        ]
+        return json.dumps({'emails': results})
+    match = _EMAIL_CONTENT_RE.search(user_message)
+    result = build_result(match.group(1) if match else user_message, mode)
+    if '"thread_summary"' in user_message:
+        result['thread_summary'] = result['summary']
+    return json.dumps(result)
+
+
+def make_handler(args, stats, latency_model):
+    """Request handler class bound to the command line options."""
+
+    class MockCerebrasHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *log_args):
+            if args.verbose:
+                super().log_message(format, *log_args)
+
+        def _send_json(self, status, body, headers=None):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _send_error(self, status, error_type, message, headers=None):
+            self._send_json(status, {'message': message, 'type': error_type, 'param': None, 'code': error_type}, headers)
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith('/stats'):
+                self._send_json(200, stats.snapshot())
+            elif self.path.rstrip('/').endswith('/models'):
+                self._send_json(200, {'object': 'list', 'data': [
+                    {'id': model, 'object': 'model', 'owned_by': 'mock'} for model in args.models
+                ]})
+            else:
+                # The Cerebras SDK warms its TCP connection with a GET on start-up
+                self._send_json(200, {})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b'{}')
+            except json.JSONDecodeError:
+                stats.record('bad_request')
+                self._send_error(400, 'invalid_request_error', 'Request body is not valid JSON')
+                return
+
+            if not self.path.rstrip('/').endswith('/chat/completions'):
+                stats.record('not_found')
+                self._send_error(404, 'not_found_error', f'Unknown path {self.path}')
+                return
+            if request.get('model') not in args.models:
+                stats.record('bad_model')
+                self._send_error(404, 'model_not_found', f"Model {request.get('model')} does not exist")
+                return
+
+            quota_wait = stats.admit(args.rpm)
+            if quota_wait or random.random() < args.rate_limit_rate:
+                stats.record('rate_limited')
+                retry_after = max(1, round(quota_wait)) if quota_wait else args.retry_after
+                self._send_error(429, 'too_many_requests_error', 'Requests per minute limit exceeded',
+                                 {'Retry-After': str(retry_after)})
+                return
+
+            content = build_completion_content(request, args.mode)
+            completion_tokens = min(estimate_tokens(content), request.get('max_tokens') or 4096)
+            latency = latency_model.sample(completion_tokens)
+            time.sleep(latency)
+
+            if random.random() < args.error_rate:
+                stats.record('server_error', latency)
+                self._send_error(random.choice([500, 502, 503]), 'server_error', 'Injected server error')
+                return
+
+            finish_reason = 'stop'
+            if random.random() < args.malformed_rate:
+                # Cut-off JSON, as when max_tokens runs out mid-answer
+                content = content[:max(1, len(content) // 2)]
+                finish_reason = 'length'
+                stats.record('malformed', latency)
+            else:
+                stats.record('ok', latency)
+
+            prompt_tokens = sum(estimate_tokens(str(m.get('content', ''))) for m in request.get('messages', []))
+            self._send_json(200, {
+                'id': f'chatcmpl-{uuid.uuid4().hex}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request['model'],
+                'system_fingerprint': 'mock',
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': finish_reason
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': completion_tokens,
+                    'total_tokens': prompt_tokens + completion_tokens
+                },
+                'time_info': {'queue_time': 0, 'prompt_time': 0, 'completion_time': latency, 'total_time': latency}
+            })
+
+    return MockCerebrasHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local OpenAI/Cerebras-compatible chat completions server for benchmarks and offline testing.')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--mode', choices=['canned', 'echo'], default='canned', help='Fixed summaries, or summaries echoing the start of each email')
+    parser.add_argument('--models', nargs='+', default=['gpt-oss-120b', 'llama3.1-8b'], help='Model names the server accepts')
+    parser.add_argument('--latency', choices=['fixed', 'uniform', 'normal', 'lognormal'], default='lognormal', help='Latency distribution')
+    parser.add_argument('--latency-ms', type=float, default=400, help='Mean time to first token in ms')
+    parser.add_argument('--jitter-ms', type=float, default=200, help='Spread of the latency distribution in ms')
+    parser.add_argument('--ms-per-token', type=float, default=0.5, help='Generation time per completion token in ms')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with a 5xx')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction of requests answered with a 429')
+    parser.add_argument('--retry-after', type=int, default=2, help='Retry-After seconds sent with injected 429s')
+    parser.add_argument('--rpm', type=int, default=0, help='Enforce a requests-per-minute quota with 429s (0 = none)')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Fraction of responses with cut-off JSON')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for reproducible runs')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    stats = MockStats()
+    latency_model = LatencyModel(args.latency, args.latency_ms, args.jitter_ms, args.ms_per_token)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args, stats, latency_model))
+    server.daemon_threads = True
+
+    print(f"🧪 Mock Cerebras server on http://{args.host}:{args.port} ({args.mode} responses, {args.latency} latency ~{args.latency_ms:.0f}ms)")
+    print(f"   Errors: {args.error_rate:.0%} 5xx, {args.rate_limit_rate:.0%} 429, {args.malformed_rate:.0%} malformed" + (f", {args.rpm} RPM quota" if args.rpm else ""))
+    print(f"   Use with: CEREBRAS_BASE_URL=http://{args.host}:{args.port} python test7.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\n📊 {json.dumps(stats.snapshot())}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+import argparse
+import base64
+import json
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+# Local stand-in for Google Pub/Sub push delivery. Posts fake Gmail
+# notifications to the monitor's /gmail_push route so the wake-up path can be
+# exercised without a real Pub/Sub subscription.
+
+DEFAULT_URL = 'http://localhost:5004/gmail_push'
+
+
+def build_push_envelope(email_address, history_id, message_id):
+    """Build a Pub/Sub push envelope carrying a Gmail notification."""
+    notification = {
+        'emailAddress': email_address,
+        'historyId': history_id
+    }
+    return {
+        'message': {
+            'data': base64.b64encode(json.dumps(notification).encode('utf-8')).decode('ascii'),
+            'messageId': str(message_id),
+            'publishTime': datetime.now(timezone.utc).isoformat()
+        },
+        'subscription': 'projects/local/subscriptions/gmail-push-local'
+    }
+
+
+def send_notification(url, envelope, token=None):
+    """POST one envelope and return (status code, response body, seconds taken)."""
+    if token:
+        url += ('&' if '?' in url else '?') + f'token={token}'
+
+    req = urllib.request.Request(
+        url,
+        data=json.dumps(envelope).encode('utf-8'),
+        headers={'Content-Type': 'application/json'},
+        method='POST'
+    )
+
+    started = time.time()
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, response.read().decode('utf-8'), time.time() - started
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode('utf-8'), time.time() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Send fake Gmail Pub/Sub push notifications to the mail monitor.')
+    parser.add_argument('--url', default=DEFAULT_URL, help=f'Push endpoint (default: {DEFAULT_URL})')
+    parser.add_argument('--email', default='me@example.com', help='emailAddress to put in the notification')
+    parser.add_argument('--history-id', type=int, default=int(time.time()), help='historyId of the first notification')
+    parser.add_argument('--count', type=int, default=1, help='Number of notifications to send')
+    parser.add_argument('--interval', type=float, default=1.0, help='Seconds between notifications')
+    parser.add_argument('--token', default=None, help='Verification token (GMAIL_PUSH_TOKEN on the monitor)')
+    args = parser.parse_args()
+
+    for i in range(args.count):
+        history_id = str(args.history_id + i)
+        envelope = build_push_envelope(args.email, history_id, message_id=i + 1)
+        status, body, elapsed = send_notification(args.url, envelope, args.token)
+        print(f"📡 historyId {history_id} -> HTTP {status} in {elapsed * 1000:.0f} ms: {body.strip()}")
+
+        if i < args.count - 1:
+            time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
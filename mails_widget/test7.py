@@ -1,19 +1,25 @@
 import os
 import base64
 from flask_cors import CORS
-from google.auth.transport.requests import Request
+from google.auth.transport.requests import Request, AuthorizedSession
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from cerebras.cloud.sdk import Cerebras
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras, APIConnectionError
 import json
 import time
+import random
+import hashlib
+import mimetypes
 from datetime import datetime, timedelta
 import re
 import html
+from html.parser import HTMLParser
 from dotenv import load_dotenv
 import threading
+import queue
+import asyncio
 import signal
 import sys
 import pytz
@@ -22,10 +28,20 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
 from email import encoders
+from email import message_from_bytes, policy as email_policy
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+from urllib.parse import quote
 import traceback
 
 # Flask imports
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
+
+# Optional: async HTTP transport for the asyncio monitor engine
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 # Load environment variables
 load_dotenv('googleAPIkey.env')
@@ -35,31 +51,129 @@ SCOPES = ['https://www.googleapis.com/auth/gmail.modify', 'https://www.googleapi
 
 # Configuration
 CONFIG = {
-    'poll_interval': 30,  # Check for new emails every 30 seconds
+    'poll_interval': 30,  # Initial seconds between checks for new emails (adapted at runtime)
+    'poll_min_interval': 5,  # Shortest poll interval, used while new mail keeps arriving
+    'poll_max_interval': 300,  # Longest poll interval after backing off on an idle inbox
+    'poll_backoff_factor': 1.5,  # Interval multiplier for each idle cycle
+    'poll_quota_backoff': 60,  # Seconds to wait after a Gmail quota error (doubles per repeat)
+    'poll_quota_max_backoff': 900,  # Upper bound for quota error backoff
+    'gmail_push_topic': os.getenv('GMAIL_PUSH_TOPIC'),  # Pub/Sub topic for users.watch (None = polling only)
+    'push_verification_token': os.getenv('GMAIL_PUSH_TOKEN'),  # Required ?token= on push requests if set
+    'push_poll_interval': 300,  # Safety-net poll interval while push notifications are arriving
+    'push_active_window': 86400,  # Seconds since the last push for push to count as active
+    'triage_enabled': True,  # Fetch metadata first and skip full bodies for bulk mail
+    'triage_metadata_headers': ['From', 'To', 'Subject', 'Date', 'List-Unsubscribe', 'List-Id', 'Precedence', 'Auto-Submitted'],
+    'summarize_bulk_mail': False,  # Summarize bulk mail from its snippet instead of storing the snippet as is
+    'bulk_priority': 2,  # Priority given to bulk mail that isn't summarized
+    # 'full' (Gmail JSON parts) or 'raw' (MIME parsed in a process pool). 'raw' is not a speed-up:
+    # it downloads attachment bodies inline (~2.75x the bytes) and parses ~25x slower per message
+    # (benchmark_mime_parsing.py); only use it when JSON part walking is measured to be the bottleneck
+    'fetch_format': 'full',
+    'raw_parse_workers': None,  # Processes parsing raw MIME (None = one per CPU)
+    'monitor_engine': 'threads',  # 'threads' (EmailPipeline) or 'asyncio' (AsyncEmailEngine, needs aiohttp)
+    'async_max_http_requests': 100,  # Max in-flight Gmail/Calendar requests for the asyncio engine
     'enable_summary': True,  # Set to False to disable AI summaries
+    'cerebras_base_url': os.getenv('CEREBRAS_BASE_URL'),  # e.g. http://localhost:8080 for mock_cerebras_server.py (None = Cerebras cloud)
+    'summary_model': 'gpt-oss-120b',  # Large Cerebras model, used for long or high-stakes mail and for retries
+    'summary_small_model': 'llama3.1-8b',  # Small fast model for short, low-signal mail (None = always use summary_model)
+    'small_model_max_input_tokens': 600,  # Mail longer than this (est. tokens) goes to the large model
+    'small_model_reasoning_tokens': 0,  # Reasoning headroom for the small model (llama3.1-8b doesn't reason)
+    'model_escalation_keywords': ['urgent', 'asap', 'contract', 'invoice', 'payment', 'overdue', 'legal', 'offer letter', 'interview', 'password', 'security', 'deadline'],  # Always use the large model for these (compiled at startup)
+    'summary_response_format': 'json_schema',  # 'json_schema', 'json_object' or None (plain text prompt only)
+    'summary_cache_enabled': True,  # Reuse summaries of emails whose cleaned content was seen before
+    'summary_cache_file': 'summary_cache.json',  # Persistent summary cache
+    'summary_cache_max_entries': 5000,  # Least recently used entries are evicted past this
+    'summary_cache_ttl': 7 * 24 * 3600,  # Seconds a cached summary stays valid
+    'summary_cache_save_interval': 60,  # Min seconds between cache file writes (also saved at shutdown)
     'processed_label': 'processed',  # Gmail label for processed emails
     'json_file': 'emails_monitor.json',  # Output JSON file
     'events_json_file': 'email_events.json',  # Separate events database
+    'threads_json_file': 'email_threads.json',  # Latest summary per Gmail thread
+    'thread_summaries': True,  # Summarize replies on known threads as a delta against the thread summary
     'userinfo_file': 'userinfo.json',  # User information file
-    'max_content_length': 30000,  # Max content length for AI processing
+    'max_content_length': 30000,  # Max characters of text extracted from an HTML body
+    'summary_input_token_budget': 7500,  # Max estimated tokens of email content sent to the AI
+    'summary_output_base_tokens': 300,  # Output tokens for summary, priority and JSON structure
+    'summary_tokens_per_event': 80,  # Output tokens per expected event
+    'summary_reasoning_tokens': 1024,  # Headroom for the model's reasoning tokens (starting value)
+    'summary_reasoning_adaptive': True,  # Double a model's reasoning headroom for the rest of the run when a first attempt is cut off
+    'summary_max_output_tokens': 4000,  # Upper bound for max_tokens
+    'html_extractor': 'stream',  # 'stream' (HTMLParser, stops at max_content_length) or 'regex' (tag-stripping passes)
+    'content_accept_length': 200,  # Cleaned length at which a source is used without cleaning the others
+    'clean_content_memo_size': 512,  # Cleaned contents kept in memory by message ID (not persisted)
+    'local_event_extraction': True,  # Extract explicit dates/times locally; the model only looks for events in ambiguous mail
+    'local_event_max_events': 5,  # Emails with more events than this are left to the model
+    'strip_quoted_replies': True,  # Send only the new part of replies (no quoted history or signature) to the AI
     'summary_retry_attempts': 3,  # Number of times to retry AI summary generation
     'summary_retry_delay': 2,  # Seconds to wait between retry attempts
+    'summary_batch_enabled': True,  # Summarize short emails several per completion
+    'summary_batch_size': 8,  # Max emails per batched completion
+    'summary_batch_token_threshold': 250,  # Emails with content up to this many tokens (est.) are batched
+    'summary_batch_max_wait': 2,  # Seconds a short email waits for its batch to fill up
+    'llm_max_concurrency': 8,  # Max Cerebras calls in flight across all callers (also the pipeline's summarize workers)
+    'llm_requests_per_minute': 30,  # Cerebras request quota (None = unlimited)
+    'llm_tokens_per_minute': 60000,  # Cerebras token quota, prompt + completion (None = unlimited)
+    'llm_rate_limit_retries': 5,  # Times a call is retried after a 429 before giving up
+    'llm_rate_limit_backoff': 10,  # Seconds to wait after a 429 without a Retry-After header
+    'llm_connection_retries': 2,  # Times a call is retried after a connection error or timeout
+    'llm_breaker_failure_threshold': 5,  # Consecutive Cerebras outage errors that open the circuit breaker
+    'llm_breaker_reset_timeout': 60,  # Seconds the breaker stays open before letting a trial call through
+    'deferred_summaries_file': 'deferred_summaries.json',  # Emails waiting for a summary while Cerebras was down
+    'deferred_retry_base_delay': 30,  # Seconds before the first retry of a deferred summary (doubles per retry, jittered)
+    'deferred_retry_max_delay': 1800,  # Upper bound for the deferred summary retry delay
+    'deferred_max_attempts': 20,  # Deferred summaries are dropped after this many retries
     'api_server_port': 5004,  # Port for Flask API server
     'api_server_host': '0.0.0.0',  # Host for Flask API server
     'google_project_id': None,  # Google Cloud Project ID (auto-detected if None)
+    'attachment_cache_dir': 'attachment_cache',  # On-disk cache of downloaded attachments
+    'attachment_cache_max_bytes': 500 * 1024 * 1024,  # Least recently opened attachments are evicted past this
+    'sync_state_file': 'sync_state.json',  # Gmail historyId checkpoint for incremental sync
+    'history_page_size': 500,  # Max history records per history.list page
+    'fetch_batch_size': 50,  # Messages fetched per Gmail HTTP batch request (Gmail allows up to 100)
+    'pipeline_queue_size': 20,  # Max items waiting between pipeline stages (backpressure)
+    'pipeline_fetch_workers': 2,  # Threads fetching message batches from Gmail
+    'pipeline_clean_workers': 2,  # Threads cleaning email content
+    'pipeline_label_workers': 1,  # Threads handing processed emails to the label coalescer
+    'label_flush_size': 1000,  # Flush queued labels at this many IDs (batchModify max is 1000)
+    'label_flush_interval': 5,  # Flush queued labels at least this often (seconds)
+    'catchup_lookback_days': 7,  # How far back catch-up looks for unprocessed emails (None = no limit)
+    'catchup_page_size': 500,  # Message IDs per messages.list page while listing the backlog
+    'catchup_window_hours': 24,  # Backlog is listed in date windows of this size, newest first
+    'catchup_cycle_messages': 200,  # Max backlog emails processed per monitor cycle
+    'catchup_cycle_seconds': 120,  # Max seconds spent on the backlog per monitor cycle
 }
 
 # Global flags and shared resources
 RUNNING = True
 gmail_service = None
+gmail_credentials = None  # OAuth credentials from authenticate_gmail, shared by the REST helpers
 calendar_service = None
 cerebras_client = None
+poll_scheduler = None
+async_engine = None  # AsyncEmailEngine while the asyncio engine runs; Calendar calls go through it
+attachment_cache = None
+summary_cache = None
+llm_dispatcher = None
+deferred_summary_queue = None
+user_timezone = None
+events_lock = threading.Lock()  # Serializes read-modify-write of the events database
+reasoning_allowances = {}  # Model -> reasoning headroom raised after cut-off answers
+response_format_overrides = {}  # Model -> response_format type it accepted after rejecting a stricter one
+reasoning_lock = threading.Lock()
+threads_lock = threading.Lock()  # Serializes read-modify-write of the thread state store
+data_lock = threading.Lock()  # Serializes changes to the in-memory email data and its JSON file
+attachment_index = None  # Message ID -> stored attachment list, built on first attachment request
+attachment_index_lock = threading.Lock()
+clean_content_memo = OrderedDict()  # Message ID -> (cleaned content, source), most recent last
+clean_content_lock = threading.Lock()
 
 def signal_handler(sig, frame):
     """Handle Ctrl+C gracefully."""
     global RUNNING
     print("\n⏹️  Stopping email monitor and API server...")
     RUNNING = False
+    if poll_scheduler:
+        poll_scheduler.wake()
 
 # Set up signal handler
 signal.signal(signal.SIGINT, signal_handler)
@@ -167,7 +281,12 @@ def get_project_id_from_credentials():
     return None
 
 def authenticate_gmail():
-    """Authenticate and return Gmail service object."""
+    """Authenticate and return Gmail service object.
+
+    The credentials are also kept in gmail_credentials for the Calendar
+    service and the REST clients.
+    """
+    global gmail_credentials
     creds = None
     
     if os.path.exists('token.json'):
@@ -184,6 +303,7 @@ def authenticate_gmail():
         # Use context manager for file writing
         with open('token.json', 'w') as token:
             token.write(creds.to_json())
+    gmail_credentials = creds
     
     # Get project ID for quota management
     project_id = get_project_id_from_credentials()
@@ -215,23 +335,60 @@ def authenticate_calendar(gmail_creds):
     
     return service
 
+def cerebras_client_options():
+    """Keyword arguments for the Cerebras clients, or None without an API key.
+
+    With CONFIG['cerebras_base_url'] set the clients talk to that server
+    instead, e.g. mock_cerebras_server.py, which needs no real API key.
+    """
+    base_url = CONFIG['cerebras_base_url']
+    api_key = os.getenv('CEREBRAS_API_KEY') or ('local' if base_url else None)
+    if not api_key:
+        return None
+    # Retries (429s honoring Retry-After, connection errors) are done by the LLM dispatcher
+    options = {'api_key': api_key, 'max_retries': 0}
+    if base_url:
+        options['base_url'] = base_url
+    return options
+
 def setup_cerebras_client():
     """Setup Cerebras API client using official SDK."""
     try:
-        api_key = os.getenv('CEREBRAS_API_KEY')
-        if not api_key:
+        options = cerebras_client_options()
+        if not options:
             print("⚠️  CEREBRAS_API_KEY not found in googleAPIkey.env")
             return None
         
-        print(f"🔑 Cerebras API Key found: {api_key[:10]}...{api_key[-4:]}")
-        client = Cerebras()
-        print("✅ Cerebras Cloud SDK initialized")
+        api_key = os.getenv('CEREBRAS_API_KEY')
+        if api_key:
+            print(f"🔑 Cerebras API Key found: {api_key[:10]}...{api_key[-4:]}")
+        client = Cerebras(**options)
+        if CONFIG['cerebras_base_url']:
+            print(f"✅ Cerebras Cloud SDK initialized against {CONFIG['cerebras_base_url']}")
+        else:
+            print("✅ Cerebras Cloud SDK initialized")
         return client
         
     except Exception as e:
         print(f"⚠️  Cerebras SDK not available: {e}")
         return None
 
+def setup_async_cerebras_client():
+    """Setup the asyncio Cerebras API client used by the asyncio engine."""
+    try:
+        options = cerebras_client_options()
+        if not options:
+            print("⚠️  CEREBRAS_API_KEY not found in googleAPIkey.env")
+            return None
+        
+        client = AsyncCerebras(**options)
+        print("✅ Async Cerebras Cloud SDK initialized")
+        return client
+        
+    except Exception as e:
+        print(f"⚠️  Async Cerebras SDK not available: {e}")
+        return None
+
 def get_or_create_label(service, label_name):
     """Get or create a Gmail label."""
     try:
@@ -272,112 +429,730 @@ def add_label_to_email(service, message_id, label_id):
         ).execute()
         return True
     except HttpError as error:
+        report_quota_error(error)
         print(f"❌ Error adding label to email {message_id}: {error}")
         return False
 
-def get_unprocessed_emails(service, processed_label_id, since_time=None):
-    """Get emails that haven't been processed yet."""
+def add_label_to_emails(service, message_ids, label_id):
+    """Add a label to up to 1000 emails in one messages.batchModify call."""
+    try:
+        service.users().messages().batchModify(
+            userId='me',
+            body={'ids': message_ids, 'addLabelIds': [label_id]}
+        ).execute()
+        return True
+    except HttpError as error:
+        report_quota_error(error)
+        print(f"❌ Error adding label to {len(message_ids)} emails: {error}")
+        return False
+
+# messages.batchModify accepts at most this many IDs per call
+BATCH_MODIFY_MAX_IDS = 1000
+
+class LabelCoalescer:
+    """Collects processed message IDs and labels them in bulk.
+
+    IDs are flushed with messages.batchModify when CONFIG['label_flush_size']
+    IDs are queued or CONFIG['label_flush_interval'] seconds have passed.
+    A failed batchModify is retried one ID at a time, so a single deleted or
+    invalid ID (dropped on 400/404) can't hold back the rest; IDs that still
+    fail stay queued and go out with the next flush.
+    """
+
+    def __init__(self, service, label_id):
+        self.service = service
+        self.label_id = label_id
+        self.pending_ids = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # One flush in flight at a time
+        self.last_flush = time.time()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Start the background thread that flushes on the time threshold."""
+        self.thread = threading.Thread(target=self._run, name='label-coalescer', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background thread and flush whatever is still queued."""
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def add(self, message_id):
+        """Queue a message for labelling, flushing if the size threshold is hit."""
+        with self.lock:
+            self.pending_ids.append(message_id)
+            size_reached = len(self.pending_ids) >= CONFIG['label_flush_size']
+        if size_reached:
+            self.flush()
+
+    def flush(self):
+        """Label all queued IDs. Returns the number of IDs labelled."""
+        with self.flush_lock:
+            with self.lock:
+                ids, self.pending_ids = self.pending_ids, []
+                self.last_flush = time.time()
+
+            labelled = 0
+            failed = []
+            over_quota = False
+            for start in range(0, len(ids), BATCH_MODIFY_MAX_IDS):
+                chunk = ids[start:start + BATCH_MODIFY_MAX_IDS]
+                if over_quota:
+                    failed.extend(chunk)
+                elif add_label_to_emails(self.service, chunk, self.label_id):
+                    labelled += len(chunk)
+                else:
+                    chunk_labelled, chunk_failed, over_quota = self._label_individually(chunk)
+                    labelled += chunk_labelled
+                    failed.extend(chunk_failed)
+
+            if failed:
+                # Put them back in front so the next flush retries them
+                with self.lock:
+                    self.pending_ids[:0] = failed
+                print(f"   ⚠️  {len(failed)} labels queued for retry on next flush")
+            if labelled:
+                print(f"   🏷️  Added 'processed' label to {labelled} emails in bulk")
+            return labelled
+
+    def _label_individually(self, chunk):
+        """Label a chunk whose batchModify failed one message at a time.
+
+        IDs Gmail rejects as invalid or missing (400/404) are dropped. A quota
+        error stops the retry and keeps the rest for the next flush.
+        Returns (labelled count, IDs to retry, whether a quota error was hit).
+        """
+        labelled = 0
+        retry = []
+        for index, message_id in enumerate(chunk):
+            try:
+                self.service.users().messages().modify(
+                    userId='me',
+                    id=message_id,
+                    body={'addLabelIds': [self.label_id]}
+                ).execute()
+                labelled += 1
+            except HttpError as error:
+                if error.resp.status in (400, 404):
+                    print(f"   ⚠️  Dropping label for {message_id}: {error}")
+                elif report_quota_error(error):
+                    return labelled, retry + chunk[index:], True
+                else:
+                    print(f"❌ Error adding label to email {message_id}: {error}")
+                    retry.append(message_id)
+        return labelled, retry, False
+
+    def _run(self):
+        """Flush on the time threshold until stopped."""
+        while not self.stop_event.wait(timeout=1):
+            with self.lock:
+                due = self.pending_ids and time.time() - self.last_flush >= CONFIG['label_flush_interval']
+            if due:
+                self.flush()
+
+def get_unprocessed_emails(service, processed_label_id, since_time=None, until_time=None, page_token=None, max_results=50):
+    """Get one page of emails that haven't been processed yet, newest first.
+
+    since_time/until_time limit the query to a date range in epoch seconds,
+    rounded outwards so neighbouring windows overlap rather than leave a gap.
+    Returns (messages, next_page_token), or (None, page_token) on error.
+    """
     try:
         # Build query to exclude processed emails
         query = f'in:inbox category:primary -label:{CONFIG["processed_label"]}'
         
         # Add time filter if specified
         if since_time:
-            time_str = since_time.strftime('%Y/%m/%d')
-            query += f' after:{time_str}'
+            query += f' after:{int(since_time.timestamp())}'
+        if until_time:
+            query += f' before:{int(until_time.timestamp()) + 1}'
         
         results = service.users().messages().list(
             userId='me',
             q=query,
-            maxResults=50
+            maxResults=max_results,
+            pageToken=page_token
         ).execute()
         
         messages = results.get('messages', [])
-        return messages
+        return messages, results.get('nextPageToken')
         
     except HttpError as error:
+        report_quota_error(error)
         print(f"❌ Error fetching emails: {error}")
-        return []
+        return None, page_token
+
+# Gmail system labels for the non-primary inbox tabs
+NON_PRIMARY_CATEGORY_LABELS = {
+    'CATEGORY_SOCIAL',
+    'CATEGORY_PROMOTIONS',
+    'CATEGORY_UPDATES',
+    'CATEGORY_FORUMS',
+}
+
+def load_sync_state():
+    """Load the incremental sync checkpoint from JSON file."""
+    if os.path.exists(CONFIG['sync_state_file']):
+        try:
+            with open(CONFIG['sync_state_file'], 'r', encoding='utf-8') as f:
+                state = json.load(f)
+                print(f"🔖 Loaded sync checkpoint: historyId {state.get('history_id')}")
+                return state
+        except Exception as e:
+            print(f"⚠️  Error loading sync state: {e}")
+
+    return {
+        "history_id": None,
+        "retry_message_ids": [],
+        "last_full_sync": None,
+        "last_incremental_sync": None
+    }
+
+def save_sync_state(sync_state):
+    """Save the incremental sync checkpoint to JSON file."""
+    try:
+        sync_state['last_updated'] = datetime.now().isoformat()
+
+        with open(CONFIG['sync_state_file'], 'w', encoding='utf-8') as f:
+            json.dump(sync_state, f, indent=2, default=str)
+
+        return True
+    except Exception as e:
+        print(f"❌ Error saving sync state: {e}")
+        return False
+
+def get_current_history_id(service):
+    """Get the mailbox's current historyId from the user profile."""
+    try:
+        profile = service.users().getProfile(userId='me').execute()
+        return profile.get('historyId')
+    except HttpError as error:
+        report_quota_error(error)
+        print(f"❌ Error fetching mailbox profile: {error}")
+        return None
+
+def is_primary_inbox_message(label_ids, processed_label_id):
+    """Check labels against the 'in:inbox category:primary -label:processed' query."""
+    labels = set(label_ids or [])
+    if 'INBOX' not in labels:
+        return False
+    if processed_label_id and processed_label_id in labels:
+        return False
+    return not (labels & NON_PRIMARY_CATEGORY_LABELS)
+
+def get_history_changes(service, start_history_id, processed_label_id):
+    """Get unprocessed inbox messages changed since a historyId checkpoint.
+
+    Returns (messages, latest_history_id). Returns (None, None) when the
+    checkpoint has expired and a full sync is required.
+    """
+    messages = []
+    seen_ids = set()
+    latest_history_id = start_history_id
+    page_token = None
+
+    def add_candidate(message):
+        if message['id'] in seen_ids:
+            return
+        if is_primary_inbox_message(message.get('labelIds'), processed_label_id):
+            seen_ids.add(message['id'])
+            messages.append({'id': message['id'], 'threadId': message.get('threadId')})
+
+    try:
+        while True:
+            results = service.users().history().list(
+                userId='me',
+                startHistoryId=start_history_id,
+                historyTypes=['messageAdded', 'labelAdded', 'labelRemoved'],
+                maxResults=CONFIG['history_page_size'],
+                pageToken=page_token
+            ).execute()
+
+            for record in results.get('history', []):
+                # New mail delivered to the mailbox
+                for added in record.get('messagesAdded', []):
+                    add_candidate(added['message'])
+
+                # Mail moved back into the inbox
+                for changed in record.get('labelsAdded', []):
+                    if 'INBOX' in changed.get('labelIds', []):
+                        add_candidate(changed['message'])
+
+                # Processed label removed by the user, so reprocess it
+                for changed in record.get('labelsRemoved', []):
+                    if processed_label_id in changed.get('labelIds', []):
+                        add_candidate(changed['message'])
+
+            latest_history_id = results.get('historyId', latest_history_id)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+        # history.list reports changes oldest first; keep the newest-first order of messages.list
+        messages.reverse()
+        return messages, latest_history_id
+
+    except HttpError as error:
+        if error.resp.status == 404:
+            print(f"⚠️  Sync checkpoint {start_history_id} expired, falling back to full sync")
+            return None, None
+        raise
+
+def sync_unprocessed_emails(service, processed_label_id, sync_state, since_time=None):
+    """Get unprocessed emails using the historyId checkpoint when possible.
+
+    Returns (messages, new_history_id). The caller commits new_history_id to
+    sync_state once the messages have been processed. Without a usable
+    checkpoint, the existing backlog is handed to catch-up mode instead.
+    """
+    start_history_id = sync_state.get('history_id')
+
+    if start_history_id:
+        try:
+            messages, latest_history_id = get_history_changes(service, start_history_id, processed_label_id)
+            if messages is not None:
+                sync_state['last_incremental_sync'] = datetime.now().isoformat()
+                # After long downtime the history can be huge; anything over the
+                # cycle budget is drained by catch-up mode instead
+                budget = CONFIG['catchup_cycle_messages']
+                if len(messages) > budget:
+                    defer_to_catchup(sync_state, [message['id'] for message in messages[budget:]])
+                    messages = messages[:budget]
+                return merge_retry_messages(sync_state, messages), latest_history_id
+        except HttpError as error:
+            if is_quota_error(error):
+                raise
+            print(f"❌ Error fetching mailbox history: {error}")
+            return merge_retry_messages(sync_state, []), start_history_id
+
+    # No usable checkpoint: read the historyId before listing so nothing
+    # delivered during the full query falls between the two
+    latest_history_id = get_current_history_id(service)
+    start_catchup(sync_state, since_time)
+    sync_state['last_full_sync'] = datetime.now().isoformat()
+    print(f"🔖 Full sync started, checkpoint historyId {latest_history_id}")
+    return merge_retry_messages(sync_state, []), latest_history_id
+
+def get_catchup_since_time():
+    """Oldest email date catch-up mode will look at, or None for no limit."""
+    if CONFIG['catchup_lookback_days'] is None:
+        return None
+    return datetime.now() - timedelta(days=CONFIG['catchup_lookback_days'])
+
+def start_catchup(sync_state, since_time=None):
+    """Begin catch-up mode: list the whole unprocessed backlog, then drain it."""
+    sync_state['catchup'] = {
+        'started_at': datetime.now().isoformat(),
+        'since': since_time.isoformat() if since_time else None,
+        'listing_done': False,
+        'list_before': time.time(),
+        'pending_ids': []
+    }
+    save_sync_state(sync_state)
+
+def defer_to_catchup(sync_state, message_ids):
+    """Queue already-known message IDs on the catch-up backlog."""
+    if not sync_state.get('catchup'):
+        sync_state['catchup'] = {
+            'started_at': datetime.now().isoformat(),
+            'since': None,
+            'listing_done': True,  # Nothing to list, the IDs are already known
+            'list_before': None,
+            'pending_ids': []
+        }
+    pending_ids = sync_state['catchup']['pending_ids']
+    known_ids = set(pending_ids)
+    pending_ids.extend(message_id for message_id in message_ids if message_id not in known_ids)
+    print(f"⏩ Deferred {len(message_ids)} emails to catch-up mode")
+    save_sync_state(sync_state)
+
+def list_catchup_window(service, processed_label_id, since_time, until_time):
+    """List every unprocessed message in one date window. Returns IDs, or None on error.
+
+    Page tokens are only used within the window: a token kept across cycles
+    would point into a result set that shrinks as the backlog gets labelled.
+    """
+    message_ids = []
+    page_token = None
+    while True:
+        messages, page_token = get_unprocessed_emails(
+            service,
+            processed_label_id,
+            since_time=since_time,
+            until_time=until_time,
+            page_token=page_token,
+            max_results=CONFIG['catchup_page_size']
+        )
+        if messages is None:
+            return None
+        message_ids.extend(message['id'] for message in messages)
+        if not page_token:
+            return message_ids
+
+def find_older_backlog(service, processed_label_id, until_time):
+    """Timestamp just after the newest unprocessed message older than until_time.
+
+    Used without a lookback limit to skip empty windows, or None if nothing
+    older is left.
+    """
+    messages, _ = get_unprocessed_emails(service, processed_label_id, until_time=until_time, max_results=1)
+    if not messages:
+        return None
+    message = service.users().messages().get(userId='me', id=messages[0]['id'], format='minimal').execute()
+    return int(message['internalDate']) / 1000 + 1
+
+def list_catchup_backlog(service, processed_label_id, sync_state, deadline):
+    """List the unprocessed backlog into the catch-up checkpoint, one date window at a time.
+
+    Windows of CONFIG['catchup_window_hours'] are listed newest first; the
+    checkpoint keeps the window edge so a restart resumes the listing.
+    Stops at the deadline; returns True once every window has been listed.
+    """
+    catchup = sync_state['catchup']
+    since_time = datetime.fromisoformat(catchup['since']) if catchup.get('since') else None
+    known_ids = set(catchup['pending_ids'])
+    if not catchup['listing_done'] and not catchup.get('list_before'):
+        catchup['list_before'] = time.time()  # Checkpoint from before windowed listing
+    window = CONFIG['catchup_window_hours'] * 3600
+
+    while not catchup['listing_done'] and time.time() < deadline and RUNNING:
+        until_time = datetime.fromtimestamp(catchup['list_before'])
+        window_start = datetime.fromtimestamp(catchup['list_before'] - window)
+        if since_time and window_start < since_time:
+            window_start = since_time
+
+        message_ids = list_catchup_window(service, processed_label_id, window_start, until_time)
+        if message_ids is None:
+            break  # Listing failed; try again next cycle
+
+        for message_id in message_ids:
+            if message_id not in known_ids:
+                known_ids.add(message_id)
+                catchup['pending_ids'].append(message_id)
+
+        catchup['list_before'] = window_start.timestamp()
+        if since_time:
+            catchup['listing_done'] = window_start <= since_time
+        elif not message_ids:
+            older = find_older_backlog(service, processed_label_id, window_start)
+            catchup['listing_done'] = older is None
+            catchup['list_before'] = older
+        save_sync_state(sync_state)
+
+    return catchup['listing_done']
+
+def start_gmail_watch(service, sync_state):
+    """Register (or renew) Gmail push notifications to CONFIG['gmail_push_topic'].
+
+    Watches expire after 7 days; the expiration is kept in the sync
+    checkpoint and the watch is renewed a day before it runs out.
+    """
+    if not CONFIG['gmail_push_topic']:
+        return False
+
+    expiration = sync_state.get('watch_expiration')
+    if expiration and int(expiration) / 1000 - time.time() > 86400:
+        return True
+
+    try:
+        response = service.users().watch(
+            userId='me',
+            body={
+                'topicName': CONFIG['gmail_push_topic'],
+                'labelIds': ['INBOX'],
+                'labelFilterBehavior': 'include'
+            }
+        ).execute()
+        sync_state['watch_expiration'] = response.get('expiration')
+        save_sync_state(sync_state)
+        print(f"📡 Gmail push notifications active on {CONFIG['gmail_push_topic']}")
+        return True
+    except HttpError as error:
+        report_quota_error(error)
+        print(f"⚠️  Could not start Gmail push notifications, polling only: {error}")
+        return False
+
+def merge_retry_messages(sync_state, messages):
+    """Append messages that failed in an earlier cycle to this cycle's list."""
+    seen_ids = {message['id'] for message in messages}
+    merged = list(messages)
+    for message_id in sync_state.get('retry_message_ids', []):
+        if message_id not in seen_ids:
+            seen_ids.add(message_id)
+            merged.append({'id': message_id})
+    return merged
+
+def commit_sync_checkpoint(sync_state, history_id, failed_ids=None):
+    """Advance the sync checkpoint after a cycle's messages were handled.
 
-def clean_email_content(content):
-    """Clean and normalize email content while preserving structure and newlines."""
+    Messages that failed are kept in the checkpoint and retried next cycle,
+    since the advanced historyId will no longer report them.
+    """
+    failed_ids = list(failed_ids or [])
+    changed = failed_ids != sync_state.get('retry_message_ids', [])
+    sync_state['retry_message_ids'] = failed_ids
+
+    if history_id and history_id != sync_state.get('history_id'):
+        sync_state['history_id'] = history_id
+        changed = True
+
+    if changed:
+        save_sync_state(sync_state)
+
+# Streaming HTML-to-text conversion for HTML bodies
+_HIDDEN_ELEMENTS = {'script', 'style', 'head'}
+_BLOCK_ELEMENTS = {'div', 'p', 'br', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'ul', 'ol'}
+_STREAM_CHUNK_SIZE = 64 * 1024  # Characters fed to the parser at a time
+_STREAM_MAX_PENDING = 1024 * 1024  # Stop if the parser buffers this much of an unterminated tag
+# A '<' whose tag never closes before the next '<' (e.g. "if a<b then"):
+# escaped to text, otherwise HTMLParser rescans it for every later '<'
+_STRAY_TAG_OPEN_RE = re.compile(r'<(?=/?[a-zA-Z][^<>]*<)')
+
+class _ExtractionLimitReached(Exception):
+    """Raised inside HTMLTextExtractor to stop parsing once enough text was produced."""
+
+class HTMLTextExtractor(HTMLParser):
+    """Converts HTML to text as it is fed, using the same layout rules as the regex path.
+
+    script/style/head content and comments are dropped, table rows and block
+    elements become newlines, cells become ' | ' and other tags a space.
+    Parsing stops once max_chars non-whitespace characters have been produced.
+    """
+
+    def __init__(self, max_chars=None):
+        super().__init__(convert_charrefs=True)
+        self.max_chars = max_chars
+        self.parts = []
+        self.text_chars = 0
+        self.hidden_depth = 0
+        self.trailing_newlines = 0
+        self.after_separator = True
+        self.truncated = False
+
+    def _separator(self, separator):
+        # Runs of separators collapse here already, so tag-only markup can't
+        # grow the output; the text normalization would collapse them anyway
+        if separator == '\n':
+            if self.trailing_newlines >= 2:
+                return
+            self.trailing_newlines += 1
+        elif separator == ' ' and self.after_separator:
+            return
+        elif separator == ' | ':
+            self.trailing_newlines = 0
+        self.parts.append(separator)
+        self.after_separator = True
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _HIDDEN_ELEMENTS:
+            self.hidden_depth += 1
+        elif tag == 'body':
+            # An unclosed <head> must not hide the whole body
+            self.hidden_depth = 0
+        elif not self.hidden_depth:
+            self._separator('\n' if tag in _BLOCK_ELEMENTS else ' ')
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/> and friends: one separator, no effect on hidden elements
+        if not self.hidden_depth and tag not in _HIDDEN_ELEMENTS:
+            self._separator('\n' if tag in _BLOCK_ELEMENTS else ' ')
+
+    def handle_endtag(self, tag):
+        if tag in _HIDDEN_ELEMENTS:
+            self.hidden_depth = max(0, self.hidden_depth - 1)
+        elif self.hidden_depth:
+            return
+        elif tag == 'tr' or tag in _BLOCK_ELEMENTS:
+            self._separator('\n')
+        elif tag in ('td', 'th'):
+            self._separator(' | ')
+        else:
+            self._separator(' ')
+
+    def handle_data(self, data):
+        if self.hidden_depth or not data:
+            return
+        self.parts.append(data)
+        self.trailing_newlines = 0
+        self.after_separator = False
+
+        if self.max_chars:
+            self.text_chars += len(data) - sum(data.count(c) for c in ' \t\r\n')
+            if self.text_chars >= self.max_chars:
+                self.truncated = True
+                raise _ExtractionLimitReached()
+
+    def get_text(self):
+        return ''.join(self.parts)
+
+def html_to_text(content, max_chars=None):
+    """Convert HTML to text incrementally, stopping after max_chars characters of text.
+
+    Work and memory are bounded by the amount of text produced, not by the
+    size of the markup, so multi-MB newsletters cost about as much as the
+    part of them that ends up in the prompt.
+    """
+    extractor = HTMLTextExtractor(max_chars)
+    try:
+        for start in range(0, len(content), _STREAM_CHUNK_SIZE):
+            chunk = content[start:start + _STREAM_CHUNK_SIZE]
+            extractor.feed(_STRAY_TAG_OPEN_RE.sub('&lt;', chunk))
+            if len(extractor.rawdata) > _STREAM_MAX_PENDING:
+                # Unterminated tag or comment: keep the text produced so far
+                extractor.truncated = True
+                break
+        else:
+            if len(extractor.rawdata) < _STREAM_CHUNK_SIZE:
+                extractor.close()
+            else:
+                # Closing re-parses a long unterminated construct once per '<'
+                extractor.truncated = True
+    except _ExtractionLimitReached:
+        pass
+    return extractor.get_text()
+
+# Precompiled patterns for clean_email_content, in the order they are applied
+_HIDDEN_ELEMENT_RE = re.compile(r'<(script|style|head)[^>]*>.*?</\1>', re.DOTALL | re.IGNORECASE)
+_HTML_COMMENT_RE = re.compile(r'<!--.*?-->', re.DOTALL)
+# Every tag in one pass: table row/cell closers, block elements (prefix match,
+# like the original per-element patterns), then any other tag
+_TAG_RE = re.compile(
+    r'<(?:(/t[rdh])|(/?(?:div|p|br|h[1-6]|li|ul|ol))|(?=[^>]))[^>]*>',
+    re.IGNORECASE
+)
+# A '<' inside a tag candidate makes the combined pass order-sensitive
+_NESTED_TAG_START_RE = re.compile(r'<[^<>]*<')
+# Sequential fallback used when _NESTED_TAG_START_RE matches
+_TABLE_TAG_RULES = [
+    (re.compile(r'</tr[^>]*>', re.IGNORECASE), '\n'),
+    (re.compile(r'</td[^>]*>', re.IGNORECASE), ' | '),
+    (re.compile(r'</th[^>]*>', re.IGNORECASE), ' | '),
+]
+_BLOCK_TAG_RULES = [
+    rule
+    for element in ['div', 'p', 'br', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'ul', 'ol']
+    for rule in (
+        (re.compile(f'</{element}[^>]*>', re.IGNORECASE), '\n'),
+        (re.compile(f'<{element}[^>]*/?>', re.IGNORECASE), '\n'),
+    )
+]
+_ANY_TAG_RE = re.compile(r'<[^>]+>')
+_LONG_LINK_RE = re.compile(r'https?://[^\s]{100,}')
+_TRACKING_PARAM_RE = re.compile(r'[?&](utm_|bt_|mso-)[^=]*=[^&\s]*')
+# Footer/header phrase groups. Kept as separate passes: a phrase can span a
+# newline, so merging them would change which one wins on a shared line.
+# The leading first-letter lookahead lets the scan skip most positions cheaply
+_BOILERPLATE_RES = [
+    re.compile(r'(?=[uom])(unsubscribe|opt[- ]?out|update preferences|manage subscription).*?(?=\n|$)', re.IGNORECASE),
+    re.compile(r'(?=v)(view\s+in\s+browser|view\s+online|view\s+web\s+version).*?(?=\n|$)', re.IGNORECASE),
+    re.compile(r'(?=[sa])(sponsor\s+content|sponsored\s+by|advertisement|ad\s+by).*?(?=\n|$)', re.IGNORECASE),
+    re.compile(r'(?=[sfc])(share\s+on|follow\s+us|connect\s+with\s+us).*?(?=\n|$)', re.IGNORECASE),
+]
+_MSO_STYLE_RE = re.compile(r'(mso-[^:]*:[^;]*;?)')
+_FONT_FAMILY_RE = re.compile(r'font-family:[^;]*;?')
+_COLOR_STYLE_RE = re.compile(r'color:[^;]*;?')
+_ELLIPSIS_RE = re.compile(r'[.]{3,}')
+_DASHES_RE = re.compile(r'[-]{3,}')
+# Lookbehind: only try a space run from its start, so long runs stay linear
+_SPACE_BEFORE_PUNCT_RE = re.compile(r'(?<![ \t])[ \t]+([,.!?;:])')
+_PUNCT_PAIR_RE = re.compile(r'([,.!?;:])[ \t]*([,.!?;:])')
+# Per-line cleanup, run over the whole text at once
+_LINE_EDGE_SPACE_RE = re.compile(r'^[^\S\n]+|(?<![^\S\n])[^\S\n]+$', re.MULTILINE)
+_INLINE_SPACE_RE = re.compile(r'[ \t]+')
+_STANDALONE_NUMBER_RE = re.compile(r'\b\d+\b(?=\s|$)')
+_STANDALONE_LETTER_RE = re.compile(r'\b[a-zA-Z]\b(?=\s|$)')
+_BLANKED_LINE_RE = re.compile(r'^[^\S\n]+\n', re.MULTILINE)
+_EXCESS_NEWLINES_RE = re.compile(r'\n{3,}')
+
+def _replace_tag(match):
+    """Replacement for _TAG_RE: newline for rows/blocks, pipe for cells, space otherwise."""
+    table_closer, block_tag = match.group(1), match.group(2)
+    if table_closer:
+        return '\n' if table_closer[2].lower() == 'r' else ' | '
+    if block_tag:
+        return '\n'
+    return ' '
+
+def clean_email_content(content, is_html=False):
+    """Clean and normalize email content while preserving structure and newlines.
+
+    HTML bodies (is_html=True) go through the streaming html_to_text converter
+    when CONFIG['html_extractor'] is 'stream'; everything else uses regex passes.
+    """
     if not content:
         return ""
     
-    # Decode HTML entities first
-    content = html.unescape(content)
-    
-    # Remove HTML tags and their contents for certain elements
-    content = re.sub(r'<(script|style|head)[^>]*>.*?</\1>', '', content, flags=re.DOTALL | re.IGNORECASE)
-    
-    # Remove HTML comments
-    content = re.sub(r'<!--.*?-->', '', content, flags=re.DOTALL)
-    
-    # Convert table rows to newlines BEFORE removing other tags
-    # Convert </tr> to newlines to preserve table structure
-    content = re.sub(r'</tr[^>]*>', '\n', content, flags=re.IGNORECASE)
-    
-    # Convert table cells to have some separation
-    content = re.sub(r'</td[^>]*>', ' | ', content, flags=re.IGNORECASE)
-    content = re.sub(r'</th[^>]*>', ' | ', content, flags=re.IGNORECASE)
-    
-    # Convert common block-level elements to newlines
-    block_elements = ['div', 'p', 'br', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'li', 'ul', 'ol']
-    for element in block_elements:
-        # Convert closing tags to newlines
-        content = re.sub(f'</{element}[^>]*>', '\n', content, flags=re.IGNORECASE)
-        # Convert <br> and self-closing tags to newlines
-        content = re.sub(f'<{element}[^>]*/?>', '\n', content, flags=re.IGNORECASE)
-    
-    # Convert remaining HTML tags to spaces (but preserve the newlines we just added)
-    content = re.sub(r'<[^>]+>', ' ', content)
+    if is_html and CONFIG['html_extractor'] == 'stream':
+        # Entities, hidden elements, comments and tags handled while streaming
+        content = html_to_text(content, CONFIG['max_content_length'])
+    else:
+        # Decode HTML entities first
+        content = html.unescape(content)
+        
+        # Remove HTML tags and their contents for certain elements, and comments
+        if '<' in content:
+            content = _HIDDEN_ELEMENT_RE.sub('', content)
+            content = _HTML_COMMENT_RE.sub('', content)
+        
+        # Convert table rows/cells and block elements to newlines, other tags to spaces
+        if '<' in content:
+            if _NESTED_TAG_START_RE.search(content):
+                # Stray '<' (e.g. an unescaped "a &lt; b"): apply the rules one at a time
+                for pattern, replacement in _TABLE_TAG_RULES + _BLOCK_TAG_RULES:
+                    content = pattern.sub(replacement, content)
+                content = _ANY_TAG_RE.sub(' ', content)
+            else:
+                content = _TAG_RE.sub(_replace_tag, content)
     
     # Clean up tracking links and email-specific URLs
-    content = re.sub(r'https?://[^\s]{100,}', '[LINK]', content)
+    if '://' in content:
+        content = _LONG_LINK_RE.sub('[LINK]', content)
     
     # Remove email tracking parameters
-    content = re.sub(r'[?&](utm_|bt_|mso-)[^=]*=[^&\s]*', '', content)
+    if 'utm_' in content or 'bt_' in content or 'mso-' in content:
+        content = _TRACKING_PARAM_RE.sub('', content)
     
     # Normalize different types of line breaks but preserve intentional newlines
     content = content.replace('\r\n', '\n').replace('\r', '\n')
     
     # Remove common email footer/header patterns
-    content = re.sub(r'(unsubscribe|opt[- ]?out|update preferences|manage subscription).*?(?=\n|$)', '', content, flags=re.IGNORECASE)
-    content = re.sub(r'(view\s+in\s+browser|view\s+online|view\s+web\s+version).*?(?=\n|$)', '', content, flags=re.IGNORECASE)
-    content = re.sub(r'(sponsor\s+content|sponsored\s+by|advertisement|ad\s+by).*?(?=\n|$)', '', content, flags=re.IGNORECASE)
-    content = re.sub(r'(share\s+on|follow\s+us|connect\s+with\s+us).*?(?=\n|$)', '', content, flags=re.IGNORECASE)
+    for pattern in _BOILERPLATE_RES:
+        content = pattern.sub('', content)
     
     # Remove common email client artifacts
-    content = re.sub(r'(mso-[^:]*:[^;]*;?)', '', content)
-    content = re.sub(r'font-family:[^;]*;?', '', content)
-    content = re.sub(r'color:[^;]*;?', '', content)
+    if 'mso-' in content:
+        content = _MSO_STYLE_RE.sub('', content)
+    if 'font-family:' in content:
+        content = _FONT_FAMILY_RE.sub('', content)
+    if 'color:' in content:
+        content = _COLOR_STYLE_RE.sub('', content)
     
     # Clean up excessive punctuation
-    content = re.sub(r'[.]{3,}', '...', content)
-    content = re.sub(r'[-]{3,}', '---', content)
+    if '...' in content:
+        content = _ELLIPSIS_RE.sub('...', content)
+    if '---' in content:
+        content = _DASHES_RE.sub('---', content)
     
     # Clean up spacing around punctuation but preserve newlines
-    content = re.sub(r'[ \t]+([,.!?;:])', r'\1', content)
-    content = re.sub(r'([,.!?;:])[ \t]*([,.!?;:])', r'\1 \2', content)
+    content = _SPACE_BEFORE_PUNCT_RE.sub(r'\1', content)
+    content = _PUNCT_PAIR_RE.sub(r'\1 \2', content)
     
-    # Remove excessive whitespace on each line but preserve newlines
-    lines = content.split('\n')
-    cleaned_lines = []
-    for line in lines:
-        # Remove excessive spaces within the line
-        cleaned_line = re.sub(r'[ \t]+', ' ', line.strip())
-        # Remove standalone numbers and isolated characters from each line
-        cleaned_line = re.sub(r'\b\d+\b(?=\s|$)', '', cleaned_line)
-        cleaned_line = re.sub(r'\b[a-zA-Z]\b(?=\s|$)', '', cleaned_line)
-        # Only keep non-empty lines or preserve intentional blank lines
-        if cleaned_line.strip() or len(cleaned_line) == 0:
-            cleaned_lines.append(cleaned_line.strip())
-    
-    # Join lines back and clean up excessive newlines
-    content = '\n'.join(cleaned_lines)
+    # Per line: trim, collapse spaces, drop standalone numbers and letters,
+    # then drop lines that only had those and trim again
+    content = _LINE_EDGE_SPACE_RE.sub('', content)
+    content = _INLINE_SPACE_RE.sub(' ', content)
+    content = _STANDALONE_NUMBER_RE.sub('', content)
+    content = _STANDALONE_LETTER_RE.sub('', content)
+    content = _BLANKED_LINE_RE.sub('', content)
+    content = _LINE_EDGE_SPACE_RE.sub('', content)
     
     # Remove excessive consecutive newlines but keep structure
-    content = re.sub(r'\n{3,}', '\n\n', content)
+    content = _EXCESS_NEWLINES_RE.sub('\n\n', content)
     
     # Final trim
     content = content.strip()
@@ -387,30 +1162,147 @@ def clean_email_content(content):
     
     return content
 
-def extract_meaningful_content(email_info):
-    """Extract and clean the most meaningful content from an email."""
-    content_sources = []
-    
+def rank_content_sources(email_info):
+    """Order the content sources by how cheap they are to clean.
+
+    Returns (source, raw content, is_html, min cleaned length) tuples. Text and
+    HTML bodies usually carry the same message, so the smaller one goes first;
+    the snippet is only a fallback.
+    """
+    bodies = []
     if email_info.get('body_text'):
-        clean_text = clean_email_content(email_info['body_text'])
-        if clean_text and len(clean_text) > 50:
-            content_sources.append(('body_text', clean_text))
-    
+        bodies.append(('body_text', email_info['body_text'], False, 50))
     if email_info.get('body_html'):
-        clean_html = clean_email_content(email_info['body_html'])
-        if clean_html and len(clean_html) > 50:
-            content_sources.append(('body_html', clean_html))
+        bodies.append(('body_html', email_info['body_html'], True, 50))
+    bodies.sort(key=lambda candidate: len(candidate[1]))
     
     if email_info.get('snippet'):
-        clean_snippet = clean_email_content(email_info['snippet'])
-        if clean_snippet and len(clean_snippet) > 20:
-            content_sources.append(('snippet', clean_snippet))
+        bodies.append(('snippet', email_info['snippet'], False, 20))
+    return bodies
+
+def extract_meaningful_content(email_info):
+    """Extract and clean the most meaningful content from an email.
+
+    Sources are cleaned one at a time in rank_content_sources order. The first
+    one reaching CONFIG['content_accept_length'] is used; otherwise the longest
+    cleaned result wins. Results are memoized in memory by message ID (LRU,
+    CONFIG['clean_content_memo_size']) so they never end up in the saved records.
+    """
+    message_id = email_info.get('id')
+    with clean_content_lock:
+        if message_id in clean_content_memo:
+            clean_content_memo.move_to_end(message_id)
+            return clean_content_memo[message_id]
+    
+    best_content, best_source = "", "none"
+    for source, raw_content, is_html, min_length in rank_content_sources(email_info):
+        cleaned = clean_email_content(raw_content, is_html=is_html)
+        if len(cleaned) > min_length and len(cleaned) > len(best_content):
+            best_content, best_source = cleaned, source
+        if len(best_content) >= CONFIG['content_accept_length']:
+            break
+    
+    if message_id:
+        with clean_content_lock:
+            clean_content_memo[message_id] = (best_content, best_source)
+            while len(clean_content_memo) > CONFIG['clean_content_memo_size']:
+                clean_content_memo.popitem(last=False)
+    return best_content, best_source
+
+# Reply history and signature markers, matched against cleaned lines
+_REPLY_HEADER_START_RE = re.compile(r'^On\s.+', re.IGNORECASE)
+_REPLY_HEADER_END_RE = re.compile(r'\bwrote:$', re.IGNORECASE)
+_OUTLOOK_SEPARATOR_RE = re.compile(r'^(?:-+\s*Original Message\s*-+|_{10,})$', re.IGNORECASE)
+_OUTLOOK_FROM_RE = re.compile(r'^\*?From:\*?\s', re.IGNORECASE)
+_OUTLOOK_SENT_RE = re.compile(r'^\*?(?:Sent|Date):\*?\s', re.IGNORECASE)
+_FORWARD_MARKER_RE = re.compile(r'^(?:-+\s*Forwarded message\s*-+|Begin forwarded message:)', re.IGNORECASE)
+_SIGNATURE_DELIMITER_RE = re.compile(r'^--$')
+_MOBILE_FOOTER_RE = re.compile(r'^(?:Sent from my \w+|Sent from (?:Mail|Outlook) for \w+|Get Outlook for \w+)', re.IGNORECASE)
+_SIGN_OFF_RE = re.compile(
+    r'^(?:(?:best|kind|warm|many)\s+)?(?:regards|thanks|thank you|cheers|sincerely|best)(?:\s+\w+)?[,!.]?$',
+    re.IGNORECASE
+)
+SIGNATURE_MAX_LINES = 8  # Longest block after a sign-off treated as a signature
+SIGNATURE_MAX_LINE_LENGTH = 80
+SIGNATURE_MAX_LINE_WORDS = 6  # Words (not numbers) on a name/title/company line
+_POSTSCRIPT_RE = re.compile(r'^p\.?\s?p?\.?s\b', re.IGNORECASE)
+_SIGNATURE_CONNECTORS = {'of', 'and', 'at', 'for'}  # "VP of Sales", "Head of Research and Development"
+
+def is_signature_line(line):
+    """Whether a line after a sign-off looks like part of a signature.
+
+    Signature lines are names, titles, company names and contact details:
+    short, capitalized words, numbers, e-mail addresses and URLs. A line with
+    ordinary lowercase words ("The server is down again") is message content.
+    """
+    if not line:
+        return True
+    if len(line) > SIGNATURE_MAX_LINE_LENGTH or line.endswith(':'):
+        return False
+    words = 0
+    for token in line.split():
+        token = token.strip('()[],;|"\'')
+        if not any(c.isalpha() for c in token) or '@' in token or '.' in token.strip('.'):
+            continue  # Numbers, separators, e-mail addresses and URLs
+        words += 1
+        if token.lower() not in _SIGNATURE_CONNECTORS and not next(c for c in token if c.isalpha()).isupper():
+            return False
+    return words <= SIGNATURE_MAX_LINE_WORDS
+
+def find_reply_history_start(lines):
+    """Return the index of the first line of quoted reply history, or None."""
+    for i, line in enumerate(lines):
+        # A forwarded message is new to the recipient, keep all of it
+        if _FORWARD_MARKER_RE.match(line):
+            return None
+        # "On <date>, <name> wrote:", possibly wrapped onto the next line
+        if _REPLY_HEADER_START_RE.match(line):
+            if _REPLY_HEADER_END_RE.search(line):
+                return i
+            if i + 1 < len(lines) and _REPLY_HEADER_END_RE.search(lines[i + 1]):
+                return i
+        # Outlook: separator line, or a From:/Sent: header block
+        if _OUTLOOK_SEPARATOR_RE.match(line):
+            return i
+        if _OUTLOOK_FROM_RE.match(line) and any(_OUTLOOK_SENT_RE.match(next_line) for next_line in lines[i + 1:i + 4]):
+            return i
+    return None
+
+def strip_quoted_content(content):
+    """Strip quoted reply history and the signature from cleaned email content.
+
+    Returns (new content, number of characters removed). Content that would
+    be left empty (e.g. only quoted text) is returned unchanged.
+    """
+    lines = content.split('\n')
     
-    if content_sources:
-        best_source = max(content_sources, key=lambda x: len(x[1]))
-        return best_source[1], best_source[0]
+    history_start = find_reply_history_start(lines)
+    if history_start is not None:
+        lines = lines[:history_start]
     
-    return "", "none"
+    # Interleaved '>' quoting and mobile client footers
+    lines = [line for line in lines if not line.startswith('>') and not _MOBILE_FOOTER_RE.match(line)]
+    
+    # "-- " signature delimiter (trailing space is gone after cleaning)
+    for i in range(len(lines) - 1, -1, -1):
+        if _SIGNATURE_DELIMITER_RE.match(lines[i]):
+            lines = lines[:i]
+            break
+    
+    # Sign-off followed only by a short block of name/title/contact lines up to
+    # the end (or a P.S., which is kept). Anything else after a "Thanks" means
+    # it wasn't a sign-off, and everything is kept.
+    sign_off = next((i for i in range(len(lines) - 1, -1, -1) if _SIGN_OFF_RE.match(lines[i])), None)
+    if sign_off is not None:
+        tail = lines[sign_off + 1:]
+        end = next((j for j, line in enumerate(tail) if _POSTSCRIPT_RE.match(line)), len(tail))
+        if end <= SIGNATURE_MAX_LINES and all(is_signature_line(line) for line in tail[:end]):
+            lines = lines[:sign_off + 1] + tail[end:]
+    
+    new_content = '\n'.join(lines).strip()
+    if not new_content:
+        return content, 0
+    return new_content, len(content) - len(new_content)
 
 def extract_email_info(message, service):
     """Extract relevant information from email message."""
@@ -467,21 +1359,22 @@ def extract_body_and_attachments(payload, email_info, service, message_id):
     def process_part(part):
         mime_type = part.get('mimeType', '')
         
-        if mime_type == 'text/plain':
-            if 'data' in part['body']:
+        if part.get('filename'):
+            # Attached .txt/.html files are attachments, not the message body
+            attachment_info = process_attachment(service, message_id, part)
+            if attachment_info:
+                email_info['attachments'].append(attachment_info)
+        
+        elif mime_type == 'text/plain':
+            if 'data' in part.get('body', {}):
                 data = part['body']['data']
                 email_info['body_text'] = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
         
         elif mime_type == 'text/html':
-            if 'data' in part['body']:
+            if 'data' in part.get('body', {}):
                 data = part['body']['data']
                 email_info['body_html'] = base64.urlsafe_b64decode(data).decode('utf-8', errors='ignore')
         
-        elif part.get('filename'):
-            attachment_info = process_attachment(service, message_id, part)
-            if attachment_info:
-                email_info['attachments'].append(attachment_info)
-        
         if 'parts' in part:
             for subpart in part['parts']:
                 process_part(subpart)
@@ -509,13 +1402,88 @@ def process_attachment(service, message_id, part):
             'filename': filename,
             'size_bytes': size,
             'mime_type': part.get('mimeType', 'unknown'),
-            'attachment_id': attachment_id
+            'attachment_id': attachment_id,
+            'part_id': part.get('partId')
         }
         
     except Exception as e:
         print(f"❌ Error processing attachment: {e}")
         return None
 
+def parse_raw_message(message):
+    """Build the email_info dict from a format='raw' Gmail message.
+
+    Produces the same fields as extract_email_info using the stdlib MIME
+    parser. Runs in a worker process, so it must only use its argument.
+    Raw MIME carries no Gmail attachmentId; attachments are identified by
+    their Gmail part_id instead and attachment_id is None.
+    """
+    mime = message_from_bytes(base64.urlsafe_b64decode(message['raw']), policy=email_policy.default)
+
+    email_info = {
+        'id': message['id'],
+        'thread_id': message['threadId'],
+        'snippet': message.get('snippet', ''),
+        'sender': None,
+        'recipient': None,
+        'subject': None,
+        'date': None,
+        'timestamp': None,
+        'body_text': '',
+        'body_html': '',
+        'attachments': [],
+        'summary': '',
+        'priority': None,
+        'events_extracted': [],
+        'summary_generated': False,
+        'has_been_read': False,
+        'processed_at': datetime.now().isoformat()
+    }
+
+    # Same header handling as extract_email_info (last occurrence wins)
+    for name, value in mime.items():
+        name = name.lower()
+        value = str(value)
+        if name == 'date':
+            email_info['date'] = value
+            try:
+                email_info['timestamp'] = parsedate_to_datetime(value).isoformat()
+            except:
+                email_info['timestamp'] = value
+        elif name == 'from':
+            email_info['sender'] = value
+        elif name == 'to':
+            email_info['recipient'] = value
+        elif name == 'subject':
+            email_info['subject'] = value
+
+    def process_part(part, part_id):
+        mime_type = part.get_content_type()
+        filename = part.get_filename()
+        # Attached .txt/.html files are attachments, not the message body
+        is_attachment = bool(filename) or part.get_content_disposition() == 'attachment'
+
+        if mime_type == 'text/plain' and not is_attachment:
+            email_info['body_text'] = (part.get_payload(decode=True) or b'').decode('utf-8', errors='ignore')
+        elif mime_type == 'text/html' and not is_attachment:
+            email_info['body_html'] = (part.get_payload(decode=True) or b'').decode('utf-8', errors='ignore')
+        elif filename and not part.is_multipart():
+            email_info['attachments'].append({
+                'filename': filename,
+                'size_bytes': len(part.get_payload(decode=True) or b''),
+                'mime_type': mime_type,
+                'attachment_id': None,
+                'part_id': part_id
+            })
+
+        if part.is_multipart():
+            # Gmail numbers top-level parts "0", "1", ... and nested ones "1.0", ...
+            for index, subpart in enumerate(part.iter_parts()):
+                process_part(subpart, f"{part_id}.{index}" if part_id else str(index))
+
+    process_part(mime, '')
+    return email_info
+
 def load_events_data():
     """Load existing events data from JSON file."""
     if os.path.exists(CONFIG['events_json_file']):
@@ -547,23 +1515,251 @@ def save_events_data(events_data):
         print(f"❌ Error saving events data: {e}")
         return False
 
-def parse_ai_response(response_text):
-    """Parse the AI response to extract summary, priority, and events."""
-    try:
-        # Try to parse as JSON first
-        response_data = json.loads(response_text)
-        return response_data
-    except json.JSONDecodeError:
-        # Fallback to text parsing if JSON fails
-        print("   ⚠️  AI response not in JSON format, attempting text parsing...")
-        
-        lines = response_text.strip().split('\n')
-        result = {
-            'summary': '',
-            'priority': 5,  # Default priority
-            'events': []
+EVENT_TYPES = ['meeting', 'deadline', 'event', 'appointment', 'conference', 'other']
+
+def summary_result_schema(include_thread_summary=False):
+    """JSON schema of one summary result, as asked for in the prompts."""
+    properties = {
+        'summary': {'type': 'string'},
+        'priority': {'type': 'integer', 'minimum': 1, 'maximum': 10},
+        'events': {
+            'type': 'array',
+            'items': {
+                'type': 'object',
+                'properties': {
+                    'description': {'type': 'string'},
+                    'date': {'type': 'string'},
+                    'time': {'type': 'string'},
+                    'location': {'type': 'string'},
+                    'type': {'type': 'string', 'enum': EVENT_TYPES}
+                },
+                'required': ['description', 'date', 'time', 'location', 'type'],
+                'additionalProperties': False
+            }
         }
-        
+    }
+    if include_thread_summary:
+        properties['thread_summary'] = {'type': 'string'}
+    return {
+        'type': 'object',
+        'properties': properties,
+        'required': list(properties),
+        'additionalProperties': False
+    }
+
+def build_response_format(result_schema, name):
+    """response_format argument for chat.completions.create, per CONFIG['summary_response_format']."""
+    if CONFIG['summary_response_format'] == 'json_schema':
+        return {'type': 'json_schema', 'json_schema': {'name': name, 'strict': True, 'schema': result_schema}}
+    if CONFIG['summary_response_format'] == 'json_object':
+        return {'type': 'json_object'}
+    return None
+
+def summary_request_options(result_schema, name):
+    """Extra create() keyword arguments for structured output, if enabled."""
+    response_format = build_response_format(result_schema, name)
+    return {'response_format': response_format} if response_format else {}
+
+def apply_response_format_override(request_kwargs):
+    """Copy of request_kwargs with response_format lowered to what the model is known to accept."""
+    model = request_kwargs.get('model')
+    request_kwargs = dict(request_kwargs)
+    if 'response_format' not in request_kwargs or model not in response_format_overrides:
+        return request_kwargs
+    accepted = response_format_overrides[model]
+    if accepted is None:
+        del request_kwargs['response_format']
+    elif request_kwargs['response_format'].get('type') == 'json_schema':
+        request_kwargs['response_format'] = {'type': accepted}
+    return request_kwargs
+
+_RESPONSE_FORMAT_ERROR_RE = re.compile(r'response_format|json_schema|json_object', re.IGNORECASE)
+
+def fall_back_response_format(request_kwargs, error):
+    """After a 400 rejecting response_format, lower response_format one step in place.
+
+    json_schema falls back to json_object, json_object to no response_format
+    (the prompt still asks for JSON). Only 400s whose error message is about
+    the response format count; other bad requests fail as usual. Returns
+    True if the request should be retried.
+    """
+    if getattr(error, 'status_code', None) != 400 or 'response_format' not in request_kwargs:
+        return False
+    error_text = f"{error} {json.dumps(getattr(error, 'body', None), default=str)}"
+    if not _RESPONSE_FORMAT_ERROR_RE.search(error_text):
+        return False
+    if request_kwargs['response_format'].get('type') == 'json_schema':
+        request_kwargs['response_format'] = {'type': 'json_object'}
+    else:
+        del request_kwargs['response_format']
+    fallback = request_kwargs.get('response_format', {}).get('type', 'no response_format')
+    print(f"   ⚠️  {request_kwargs.get('model')} rejected the response format (HTTP 400), retrying with {fallback}")
+    return True
+
+def remember_response_format(planned_format, sent_kwargs):
+    """Keep a response_format fallback that worked for the rest of the run."""
+    if sent_kwargs.get('response_format') != planned_format:
+        accepted = sent_kwargs.get('response_format', {}).get('type')
+        response_format_overrides[sent_kwargs.get('model')] = accepted
+        print(f"   📝 Using {accepted or 'no response_format'} for {sent_kwargs.get('model')} from now on")
+
+_CODE_FENCE_RE = re.compile(r'^```[a-zA-Z]*\s*|\s*```\s*$')
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+
+def close_truncated_json(text):
+    """Close the strings, arrays and objects left open by a cut-off JSON document."""
+    stack = []
+    in_string = False
+    escaped = False
+    last_complete = 0  # End of the last complete value/entry outside a string
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+                last_complete = i + 1
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            last_complete = i + 1
+        elif char == ',':
+            last_complete = i
+    
+    if not stack:
+        return text
+    if in_string:
+        text += '"'
+    else:
+        text = text[:max(last_complete, 1)]
+    # A dangling "key": or trailing comma can't be closed into valid JSON
+    text = re.sub(r'(?:,\s*"[^"]*"\s*:?\s*|,\s*)$', '', text.rstrip())
+    text = re.sub(r':\s*$', ': null', text)
+    
+    # Recount what is still open after trimming
+    stack = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+    return text + ''.join(reversed(stack))
+
+def repair_json_text(response_text):
+    """Fix the usual defects of model JSON output: code fences, surrounding
+    prose, trailing commas and a cut-off end. Returns (parsed value, whether
+    a cut-off end had to be closed) or raises ValueError."""
+    text = _CODE_FENCE_RE.sub('', response_text.strip())
+    
+    starts = [index for index in (text.find('{'), text.find('[')) if index >= 0]
+    if not starts:
+        raise ValueError("No JSON object or array in response")
+    text = text[min(starts):]
+    
+    # raw_decode stops at the end of the first complete value, so prose after
+    # it is ignored even if it contains brackets of its own
+    decoder = json.JSONDecoder()
+    candidate = _TRAILING_COMMA_RE.sub(r'\1', text)
+    for attempt, truncated in ((text, False), (candidate, False), (close_truncated_json(candidate), True)):
+        try:
+            return decoder.raw_decode(_TRAILING_COMMA_RE.sub(r'\1', attempt))[0], truncated
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("Response could not be repaired into valid JSON")
+
+def validate_summary_result(data, include_thread_summary=False):
+    """Check a summary result against the schema, coercing what can be fixed.
+
+    Returns the cleaned result; raises ValueError if a required key is
+    missing or has no usable value. Malformed events are dropped.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Summary result is not a JSON object")
+    
+    missing = [key for key in summary_result_schema(include_thread_summary)['required'] if key not in data]
+    if missing:
+        raise ValueError(f"Summary result is missing {', '.join(missing)}")
+    
+    summary = data['summary']
+    if not isinstance(summary, str) or not summary.strip():
+        raise ValueError("Summary result has no summary")
+    
+    try:
+        priority = int(data['priority'])
+    except (TypeError, ValueError):
+        raise ValueError(f"Summary result has an invalid priority: {data['priority']!r}")
+    
+    if not isinstance(data['events'], list):
+        raise ValueError("Summary result events is not a list")
+    
+    events = []
+    for event in data['events']:
+        if not isinstance(event, dict) or not event.get('description'):
+            continue
+        event_type = str(event.get('type') or 'other').lower()
+        events.append({
+            'description': str(event['description']),
+            'date': str(event.get('date') or ''),
+            'time': str(event.get('time') or ''),
+            'location': str(event.get('location') or ''),
+            'type': event_type if event_type in EVENT_TYPES else 'other'
+        })
+    
+    result = {'summary': summary.strip(), 'priority': min(10, max(1, priority)), 'events': events}
+    if isinstance(data.get('thread_summary'), str) and data['thread_summary'].strip():
+        result['thread_summary'] = data['thread_summary'].strip()
+    if 'id' in data:
+        result['id'] = data['id']
+    return result
+
+def parse_ai_response(response_text, include_thread_summary=False):
+    """Parse the AI response to extract summary, priority, and events.
+
+    Invalid JSON is repaired locally and the result validated against the
+    schema. A result whose cut-off end had to be closed is flagged with
+    truncated. If that fails, the raw text becomes the summary and the result
+    is flagged with parse_failed.
+    """
+    try:
+        truncated = False
+        try:
+            response_data = json.loads(response_text)
+        except json.JSONDecodeError:
+            response_data, truncated = repair_json_text(response_text)
+            print("   🩹 Repaired malformed JSON in AI response")
+        result = validate_summary_result(response_data, include_thread_summary)
+        if truncated:
+            result['truncated'] = True
+        return result
+    except ValueError as e:
+        # Fallback to text parsing if JSON fails
+        print(f"   ⚠️  AI response not usable as JSON ({e}), attempting text parsing...")
+        
+        lines = response_text.strip().split('\n')
+        result = {
+            'summary': '',
+            'priority': 5,  # Default priority
+            'events': [],
+            'parse_failed': True
+        }
+        
         # Simple text parsing as fallback
         result['summary'] = response_text.strip()
         
@@ -586,7 +1782,7 @@ def add_events_to_database(events, email_info, events_data):
             'event_time': event.get('time', ''),
             'event_location': event.get('location', ''),
             'event_type': event.get('type', 'unknown'),
-            'priority': email_info.get('priority', 5),
+            'priority': email_info.get('priority') or 5,
             'extracted_at': datetime.now().isoformat()
         }
         
@@ -597,35 +1793,1047 @@ def add_events_to_database(events, email_info, events_data):
     if save_events_data(events_data):
         print(f"   📅 Added {len(events)} events to events database")
 
-def generate_email_summary(email_info, cerebras_client):
-    """Generate a summary of the email using Cerebras API with priority and events extraction."""
-    if not CONFIG['enable_summary'] or not cerebras_client:
-        return
+# Local event extraction: explicit dates and times resolved without the model
+_MONTH_NAME = r'(jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|sept?(?:ember)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?)\b\.?'
+_MONTH_NUMBERS = {'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12}
+_WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+_ISO_DATE_RE = re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b')
+_MONTH_DAY_RE = re.compile(_MONTH_NAME + r'\s+(\d{1,2})(?:st|nd|rd|th)?\b(?!:)(?:,?\s+(\d{4})\b)?', re.IGNORECASE)
+_DAY_MONTH_RE = re.compile(r'\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?' + _MONTH_NAME + r'(?:,?\s+(\d{4})\b)?', re.IGNORECASE)
+_RELATIVE_DATE_RE = re.compile(r'\b(today|tonight|tomorrow|(?:(next|this|last|past|previous)\s+)?(' + '|'.join(_WEEKDAYS) + r'))\b(?![\'’])', re.IGNORECASE)
+# Past-tense wording: a weekday or date in such a sentence may be history, not an event
+_PAST_TENSE_RE = re.compile(
+    r'\b(?:was|were|had|did|ago|yesterday|earlier|went|met|discussed|talked|spoke|happened|attended|missed|'
+    r'placed|shipped|delivered|received|sent|paid|processed|completed|signed|submitted|recorded|recording)\b',
+    re.IGNORECASE
+)
+# Words before "may" that make it the verb ("I may", "it may"), not the month
+_MAY_VERB_CONTEXT = {
+    'i', 'you', 'we', 'they', 'he', 'she', 'it', 'who', 'that', 'this', 'there', 'which', 'what',
+    'can', 'could', 'will', 'would', 'shall', 'should', 'might', 'must', 'also', 'still', 'not'
+}
+_LOCAL_TIME_RE = re.compile(
+    r'\b(?:(\d{1,2})(?::([0-5]\d))?\s*([ap])\.?m\b\.?|([01]?\d|2[0-3]):([0-5]\d)(?![\d:])|(noon|midnight))',
+    re.IGNORECASE
+)
+_TIME_RANGE_RE = re.compile(r'\b(\d{1,2})(?::([0-5]\d))?\s*(?:-|–|to)\s*(\d{1,2})(?::[0-5]\d)?\s*([ap])\.?m\b\.?', re.IGNORECASE)
+_TIMEZONE_SUFFIX_RE = re.compile(r'\s*\(?(?:[A-Z]{1,4}T|UTC|GMT)\b')
+# Date references that can't be pinned to a single day without judgement
+_AMBIGUOUS_DATE_RE = re.compile(
+    r'\b(?:\d{1,2}/\d{1,2}(?:/\d{2,4})?|the\s+\d{1,2}(?:st|nd|rd|th)|'
+    r'(?:next|this)\s+(?:week|weekend|month|year)|end\s+of\s+(?:the\s+)?(?:day|week|month|quarter|year)|'
+    r'in\s+(?:a\s+few|a|\d+)\s+(?:days?|weeks?|months?)|eod|eow|tbd|tba)\b',
+    re.IGNORECASE
+)
+_LOCATION_LABEL_RE = re.compile(r'^\s*(?:location|where|venue|address)\s*:\s*(.+?)\s*$', re.IGNORECASE | re.MULTILINE)
+_LOCATION_RE = re.compile(r"\b(?:at|in)\s+((?:the\s+)?(?:(?:[Rr]oom|[Bb]uilding|[Ss]uite|[Ff]loor)\s+[\w-]+|[A-Z][\w'&-]*(?:\s+[A-Z0-9][\w'&-]*){0,4}))")
+_VIDEO_CALL_LOCATIONS = [('zoom.us', 'Zoom'), ('meet.google.com', 'Google Meet'), ('teams.microsoft.com', 'Microsoft Teams')]
+_EVENT_TYPE_RES = [
+    ('deadline', re.compile(r'\b(?:deadline|due|expires?|expiring|submit|no later than)\b', re.IGNORECASE)),
+    ('meeting', re.compile(r'\b(?:meeting|meet|call|sync|standup|interview)\b', re.IGNORECASE)),
+    ('appointment', re.compile(r'\b(?:appointment|reservation|booking|check-in)\b', re.IGNORECASE)),
+    ('conference', re.compile(r'\b(?:conference|summit|workshop|webinar|seminar)\b', re.IGNORECASE)),
+]
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+(?=[A-Z])|\n+')
+
+def get_user_timezone():
+    """Return the user's timezone from CONFIG['userinfo_file'], loading it on first use."""
+    global user_timezone
+    if user_timezone is None:
+        user_timezone = parse_timezone_offset(load_user_info().get('default_tz', 'UTC'))
+    return user_timezone
+
+def _explicit_date(year, month, day, reference):
+    """Build a date, taking a missing year from the reference. None if invalid."""
+    try:
+        if year:
+            return datetime(int(year), month, int(day)).date()
+        resolved = datetime(reference.year, month, int(day)).date()
+        # A year-less date long before the email is about next year
+        if resolved < reference.date() - timedelta(days=180):
+            resolved = resolved.replace(year=reference.year + 1)
+        return resolved
+    except ValueError:
+        return None
+
+def find_date_mentions(sentence, reference):
+    """Find the dates mentioned in a sentence.
+
+    Returns ([(start, end, date or None, relative)], ambiguous). A None date
+    is a mention that was found but couldn't be resolved. "may" is read as
+    the month only when a day number follows and it isn't the verb ("I may").
+    """
+    mentions = []
+    for match in _ISO_DATE_RE.finditer(sentence):
+        mentions.append((match.start(), match.end(), _explicit_date(match.group(1), int(match.group(2)), match.group(3), reference), False))
+    for match in _MONTH_DAY_RE.finditer(sentence):
+        if match.group(1).lower() == 'may':
+            previous_words = sentence[:match.start()].split()
+            if previous_words and previous_words[-1].lower().strip(',') in _MAY_VERB_CONTEXT:
+                continue
+        month = _MONTH_NUMBERS[match.group(1)[:3].lower()]
+        mentions.append((match.start(), match.end(), _explicit_date(match.group(3), month, match.group(2), reference), False))
+    for match in _DAY_MONTH_RE.finditer(sentence):
+        if any(start <= match.start() < end for start, end, _, _ in mentions):
+            continue
+        # "at 5 may be late": "may" after a number is only the month with a year
+        if match.group(2).lower() == 'may' and not match.group(3):
+            continue
+        month = _MONTH_NUMBERS[match.group(2)[:3].lower()]
+        mentions.append((match.start(), match.end(), _explicit_date(match.group(3), month, match.group(1), reference), False))
+    
+    for match in _RELATIVE_DATE_RE.finditer(sentence):
+        # "Wednesday, Sept 24" names the weekday of an explicit date
+        if any(0 <= start - match.end() <= 2 for start, _, _, _ in mentions):
+            continue
+        word = match.group(1).lower()
+        if word in ('today', 'tonight'):
+            resolved = reference.date()
+        elif word == 'tomorrow':
+            resolved = reference.date() + timedelta(days=1)
+        else:
+            days_ahead = (_WEEKDAYS.index(match.group(3).lower()) - reference.weekday()) % 7
+            # "Friday" sent on a Friday, "next Friday", "last Friday" or a
+            # weekday in a past-tense sentence could mean either week
+            if days_ahead == 0 or match.group(2) or _PAST_TENSE_RE.search(sentence):
+                resolved = None
+            else:
+                resolved = reference.date() + timedelta(days=days_ahead)
+        mentions.append((match.start(), match.end(), resolved, True))
     
-    content_to_summarize, content_source = extract_meaningful_content(email_info)
+    mentions.sort()
+    ambiguous = any(
+        not any(start <= match.start() < end for start, end, _, _ in mentions)
+        for match in _AMBIGUOUS_DATE_RE.finditer(sentence)
+    )
+    return mentions, ambiguous
+
+def find_time_mentions(sentence, date_spans):
+    """Find the times mentioned in a sentence as "HH:MM" strings.
+
+    Returns (times, ambiguous); a time with a timezone of its own, or an
+    invalid one, makes the sentence ambiguous. Matches inside date mentions
+    are skipped.
+    """
+    times = []
+    ambiguous = False
+    skip_spans = list(date_spans)
+    for match in _TIME_RANGE_RE.finditer(sentence):
+        start_hour, end_hour = int(match.group(1)), int(match.group(3))
+        if not (1 <= start_hour <= 12 and 1 <= end_hour <= 12):
+            continue
+        # The start is the latest hour before the end: "3-4pm" is 15:00, "11-1pm" is 11:00
+        end = end_hour % 12 + (12 if match.group(4).lower() == 'p' else 0)
+        earlier = [hour for hour in (start_hour % 12 + 12, start_hour % 12) if hour < end]
+        start = earlier[0] if earlier else end
+        times.append(f"{start:02d}:{match.group(2) or '00'}")
+        skip_spans.append((match.start(), match.end()))
+        if _TIMEZONE_SUFFIX_RE.match(sentence, match.end()):
+            ambiguous = True
+    for match in _LOCAL_TIME_RE.finditer(sentence):
+        if any(start <= match.start() < end for start, end in skip_spans):
+            continue
+        hour_12, minute_12, meridiem, hour_24, minute_24, word = match.groups()
+        if word:
+            times.append('12:00' if word.lower() == 'noon' else '00:00')
+        elif meridiem:
+            hour = int(hour_12)
+            if not 1 <= hour <= 12:
+                ambiguous = True
+                continue
+            hour = hour % 12 + (12 if meridiem.lower() == 'p' else 0)
+            times.append(f"{hour:02d}:{minute_12 or '00'}")
+        else:
+            times.append(f"{int(hour_24):02d}:{minute_24}")
+        if _TIMEZONE_SUFFIX_RE.match(sentence, match.end()):
+            ambiguous = True
+    return times, ambiguous
+
+def find_event_location(sentence, default_location):
+    """A place named after "at"/"in" in the sentence, else the email-wide location."""
+    for match in _LOCATION_RE.finditer(sentence):
+        words = match.group(1).split()
+        first_word = (words[1] if words[0].lower() == 'the' and len(words) > 1 else words[0]).lower()
+        if not re.fullmatch(_MONTH_NAME, first_word) and first_word not in _WEEKDAYS + ['today', 'tonight', 'tomorrow']:
+            return match.group(1)
+    return default_location
+
+def classify_event(sentence):
+    for event_type, pattern in _EVENT_TYPE_RES:
+        if pattern.search(sentence):
+            return event_type
+    return 'event'
+
+def extract_local_events(content, reference):
+    """Extract events with explicit dates and times from email content.
+
+    reference is the email's date in the user's timezone; relative dates
+    ("tomorrow", "on Friday") are resolved against it. A date counts as an
+    event only with a time or an event keyword ("deadline", "meeting"...) in
+    its sentence; dates before the email are ignored. Returns (events,
+    confident). confident is False when anything date-like could not be
+    resolved with certainty: numeric dates (US or European?), relative
+    ranges ("next week"), dates in past-tense sentences ("order placed on
+    Sept 3"), times without a date or with their own timezone, several dates
+    sharing times, or more than CONFIG['local_event_max_events'] events,
+    since those need the model's judgement.
+    """
+    default_location = ''
+    labelled = _LOCATION_LABEL_RE.findall(content)
+    if len(labelled) == 1:
+        default_location = labelled[0][:100]
+    else:
+        lowered = content.lower()
+        for marker, name in _VIDEO_CALL_LOCATIONS:
+            if marker in lowered:
+                default_location = name
+                break
     
-    if not content_to_summarize:
-        print("   ⚠️  No meaningful content found to summarize")
-        return
+    events = []
+    ambiguous = False
+    for sentence in _SENTENCE_SPLIT_RE.split(content):
+        sentence = ' '.join(sentence.split())
+        if not sentence:
+            continue
+        mentions, sentence_ambiguous = find_date_mentions(sentence, reference)
+        times, time_ambiguous = find_time_mentions(sentence, [(start, end) for start, end, _, _ in mentions])
+        event_type = classify_event(sentence)
+        if not times:
+            # "Ships tomorrow" or "today's picks" aren't events without a time,
+            # nor is "Version 2025-09-01" without an event keyword
+            mentions = [mention for mention in mentions if not mention[3] and event_type != 'event']
+        # "Order placed on Sept 3", "We met on Sept 15 at 2pm"
+        if any(not relative for _, _, _, relative in mentions) and _PAST_TENSE_RE.search(sentence):
+            ambiguous = True
+            continue
+        mentions = [mention for mention in mentions if mention[2] is None or mention[2] >= reference.date()]
+        if sentence_ambiguous or time_ambiguous or any(mention[2] is None for mention in mentions):
+            ambiguous = True
+            continue
+        if not mentions:
+            if times:
+                ambiguous = True  # A time on an unknown day
+            continue
+        if len(mentions) > 1 and times or len(times) > 2:
+            ambiguous = True
+            continue
+        
+        description = sentence if len(sentence) <= 120 else sentence[:117] + '...'
+        location = find_event_location(sentence, default_location)
+        for _, _, resolved, _ in mentions:
+            events.append({
+                'description': description,
+                'date': resolved.isoformat(),
+                'time': times[0] if times else '',  # A range ("3-4pm") starts at its first time
+                'location': location,
+                'type': event_type
+            })
     
-    if len(content_to_summarize) > CONFIG['max_content_length']:
-        content_to_summarize = content_to_summarize[:CONFIG['max_content_length']] + "..."
+    confident = bool(events) and not ambiguous and len(events) <= CONFIG['local_event_max_events']
+    return events, confident
+
+def local_event_text(email_info, content_source):
+    """The text of the chosen content source for the local event extractor.
+
+    clean_email_content drops standalone numbers ("Sept 24 at 3 pm" becomes
+    "Sept at pm"), so the extractor reads the source before that step.
+    """
+    text = email_info.get(content_source) or ''
+    if content_source == 'body_html':
+        text = html_to_text(text, CONFIG['max_content_length'])
+    else:
+        text = text[:CONFIG['max_content_length']]
+    if CONFIG['strip_quoted_replies']:
+        text, _ = strip_quoted_content(text)
+    return text
+
+def apply_local_events(email_info, content_source):
+    """Fill in the email's events locally when the extractor is confident.
+
+    The events are stored on the email and in the events database right
+    away and email_info['events_source'] is set to 'local', so the model is
+    then only asked for the summary and priority. Returns whether the events
+    are local.
+    """
+    if email_info.get('events_source') == 'local':
+        return True  # Extracted on an earlier attempt (e.g. a deferred summary)
+    if not CONFIG['local_event_extraction']:
+        return False
     
-    # Retry logic for AI summary generation
-    max_attempts = CONFIG['summary_retry_attempts']
-    retry_delay = CONFIG['summary_retry_delay']
+    reference = parse_email_timestamp(email_info.get('timestamp'))
+    if reference == datetime.min.replace(tzinfo=pytz.UTC):
+        reference = datetime.now(pytz.UTC)
+    content = local_event_text(email_info, content_source)
+    events, confident = extract_local_events(content, reference.astimezone(get_user_timezone()))
+    if not confident:
+        return False
     
-    for attempt in range(1, max_attempts + 1):
+    email_info['events_extracted'] = events
+    email_info['events_source'] = 'local'
+    print(f"   📅 {len(events)} events extracted locally")
+    with events_lock:
+        events_data = load_events_data()
+        add_events_to_database(events, email_info, events_data)
+    return True
+
+def load_threads_data():
+    """Load the thread state store from JSON file."""
+    if os.path.exists(CONFIG['threads_json_file']):
         try:
-            if attempt > 1:
-                print(f"   🔄 Retry attempt {attempt}/{max_attempts} for AI summary...")
-            else:
-                print(f"   🧠 Generating AI summary with priority and events from {content_source} ({len(content_to_summarize)} chars)...")
+            with open(CONFIG['threads_json_file'], 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"⚠️  Error loading thread data: {e}")
+    
+    return {
+        "database_created": datetime.now().isoformat(),
+        "last_updated": datetime.now().isoformat(),
+        "total_threads": 0,
+        "threads": {}
+    }
+
+def save_threads_data(threads_data):
+    """Save the thread state store to JSON file."""
+    try:
+        threads_data['last_updated'] = datetime.now().isoformat()
+        
+        with open(CONFIG['threads_json_file'], 'w', encoding='utf-8') as f:
+            json.dump(threads_data, f, indent=2, default=str, ensure_ascii=False)
+        
+        return True
+    except Exception as e:
+        print(f"❌ Error saving thread data: {e}")
+        return False
+
+def parse_email_timestamp(timestamp):
+    """Parse an email_info timestamp for ordering; unparseable ones sort first."""
+    try:
+        parsed = datetime.fromisoformat(timestamp)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=pytz.UTC)
+        return parsed
+    except (TypeError, ValueError):
+        return datetime.min.replace(tzinfo=pytz.UTC)
+
+def get_thread_context(email_info):
+    """Return the stored thread record to summarize this email against, or None.
+
+    Only an earlier summarized message on the same thread counts; the email
+    itself (e.g. on a retry) or a thread without a summary does not.
+    """
+    if not CONFIG['thread_summaries'] or not email_info.get('thread_id'):
+        return None
+    
+    with threads_lock:
+        thread = load_threads_data()['threads'].get(email_info['thread_id'])
+    
+    if not thread or not thread.get('summary') or email_info['id'] in thread.get('message_ids', []):
+        return None
+    return thread
+
+def update_thread_state(email_info, thread_summary=None):
+    """Record a summarized email in the thread state store.
+
+    thread_summary is the model's updated summary of the whole thread; for the
+    first message of a thread the message summary is used. A message older
+    than the thread's latest one is added without replacing the summary.
+    """
+    thread_id = email_info.get('thread_id')
+    if not thread_id:
+        return
+    
+    with threads_lock:
+        threads_data = load_threads_data()
+        thread = threads_data['threads'].setdefault(thread_id, {
+            'thread_id': thread_id,
+            'subject': email_info.get('subject'),
+            'summary': '',
+            'priority': None,
+            'message_ids': [],
+            'message_count': 0,
+            'last_message_id': None,
+            'last_message_timestamp': None,
+            'created_at': datetime.now().isoformat()
+        })
+        
+        if email_info['id'] in thread['message_ids']:
+            return
+        thread['message_ids'].append(email_info['id'])
+        thread['message_count'] = len(thread['message_ids'])
+        
+        is_latest = (
+            not thread['last_message_timestamp'] or
+            parse_email_timestamp(email_info.get('timestamp')) >= parse_email_timestamp(thread['last_message_timestamp'])
+        )
+        if is_latest or not thread['summary']:
+            thread['summary'] = thread_summary or email_info.get('summary', '')
+            thread['priority'] = email_info.get('priority')
+            thread['last_message_id'] = email_info['id']
+            thread['last_message_timestamp'] = email_info.get('timestamp')
+        thread['updated_at'] = datetime.now().isoformat()
+        
+        threads_data['total_threads'] = len(threads_data['threads'])
+        save_threads_data(threads_data)
+
+SUMMARY_PROMPT_VERSION = 1  # Bump when build_summary_messages changes, so cached summaries are redone
+
+class SummaryCache:
+    """Persistent LRU/TTL cache of summary results keyed by content hash.
+
+    Entries live in an OrderedDict (least recently used first). Changes,
+    including used_at updates from hits, are written to
+    CONFIG['summary_cache_file'] at most every save_interval seconds and by
+    save() at shutdown; the file is written outside the entries lock.
+    """
+
+    def __init__(self, cache_file, max_entries, ttl, save_interval=0):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.dirty = False
+        self.last_save = time.time()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                stored = json.load(f)
+            now = time.time()
+            for key, entry in sorted(stored.get('entries', {}).items(), key=lambda item: item[1].get('used_at', 0)):
+                if now - entry.get('created_at', 0) < self.ttl:
+                    self.entries[key] = entry
+            print(f"🗄️  Loaded summary cache: {len(self.entries)} entries")
+        except Exception as e:
+            print(f"⚠️  Error loading summary cache: {e}")
+
+    def save(self):
+        """Write the cache file if anything changed since the last write."""
+        with self.save_lock:
+            with self.lock:
+                if not self.dirty:
+                    return
+                snapshot = {key: dict(entry) for key, entry in self.entries.items()}
+                self.dirty = False
+                self.last_save = time.time()
+            try:
+                with open(self.cache_file, 'w', encoding='utf-8') as f:
+                    json.dump({'entries': snapshot}, f, default=str, ensure_ascii=False)
+            except Exception as e:
+                print(f"❌ Error saving summary cache: {e}")
+                with self.lock:
+                    self.dirty = True
+
+    def save_if_due(self):
+        """Write pending changes once save_interval has passed since the last write."""
+        if self.dirty and time.time() - self.last_save >= self.save_interval:
+            self.save()
+
+    def get(self, key):
+        """Return the cached result for key, or None if missing or expired."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and time.time() - entry['created_at'] >= self.ttl:
+                del self.entries[key]
+                entry = None
+            if not entry:
+                self.misses += 1
+                return None
             
-            messages = [
-                {
-                    "role": "system",
-                    "content": """You are an expert email analyzer that provides comprehensive analysis including summaries, priority scoring, and event extraction. 
+            self.entries.move_to_end(key)
+            entry['used_at'] = time.time()
+            entry['hits'] = entry.get('hits', 0) + 1
+            self.hits += 1
+            self.dirty = True
+            result = entry['result']
+        self.save_if_due()
+        return result
+
+    def put(self, key, result):
+        with self.lock:
+            now = time.time()
+            self.entries[key] = {'result': result, 'created_at': now, 'used_at': now, 'hits': 0}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+        self.save_if_due()
+
+    def status(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None
+        }
+
+def get_summary_cache():
+    """Return the shared summary cache, creating it on first use."""
+    global summary_cache
+    if summary_cache is None:
+        summary_cache = SummaryCache(
+            CONFIG['summary_cache_file'],
+            CONFIG['summary_cache_max_entries'],
+            CONFIG['summary_cache_ttl'],
+            CONFIG['summary_cache_save_interval']
+        )
+    return summary_cache
+
+def summary_cache_key(content_to_summarize, subject=None, sender=None, events_local=False, model=None):
+    """Hash of the whitespace/case-normalized content, subject, sender, model and prompt version.
+
+    model is the model the email was routed to (default CONFIG['summary_model']),
+    so small-model and large-model summaries are cached separately.
+
+    Subject and sender are part of the prompt, so the same body from another
+    sender or under another subject can get a different summary and priority.
+    events_local marks results for emails whose events were extracted
+    locally; the model returned no events for those, so they aren't reused
+    for emails that need the model's events.
+    """
+    normalized = ' '.join(content_to_summarize.lower().split())
+    subject = ' '.join((subject or '').lower().split())
+    sender = (sender or '').strip().lower()
+    key_source = f"{model or CONFIG['summary_model']}\n{SUMMARY_PROMPT_VERSION}\n{'local-events' if events_local else ''}\n{subject}\n{sender}\n{normalized}"
+    return hashlib.sha256(key_source.encode('utf-8')).hexdigest()
+
+def lookup_cached_summary(email_info, content_to_summarize, content_source, thread_context, model=None):
+    """Apply a cached summary to the email if there is one.
+
+    model is the routed model, so look up after routing. Returns (handled,
+    cache key to store the new result under). Replies on a known thread
+    depend on the thread summary and are never cached.
+    """
+    if not CONFIG['summary_cache_enabled'] or thread_context:
+        return False, None
+    
+    cache_key = summary_cache_key(
+        content_to_summarize,
+        email_info.get('subject'),
+        email_info.get('sender'),
+        email_info.get('events_source') == 'local',
+        model
+    )
+    cached = get_summary_cache().get(cache_key)
+    if not cached:
+        return False, cache_key
+    
+    store_summary_result(email_info, dict(cached, events=[]), content_source, 0)
+    email_info['summary_cached'] = True
+    print(f"   ⚡ Summary for {email_info['id']} served from cache")
+    return True, cache_key
+
+def remember_summary(cache_key, parsed_response):
+    """Cache a summary result unless it is unsafe to reuse for other emails.
+
+    Results with events are skipped, since dates like "tomorrow" depend on
+    the email's own date; so are responses that weren't valid JSON or were
+    cut off.
+    """
+    if not cache_key or parsed_response.get('parse_failed') or parsed_response.get('truncated') or parsed_response.get('events'):
+        return
+    get_summary_cache().put(cache_key, {
+        'summary': parsed_response.get('summary', ''),
+        'priority': parsed_response.get('priority', 5),
+        'events': []
+    })
+
+# Date/time mentions, used to guess how many events the model will return
+_EVENT_HINT_RE = re.compile(
+    r'\b(?:\d{4}-\d{2}-\d{2}|\d{1,2}:\d{2}|\d{1,2}\s?(?:am|pm)|'
+    r'(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?\s+\d{1,2}|'
+    r'monday|tuesday|wednesday|thursday|friday|saturday|sunday|tomorrow|tonight|deadline|due)\b',
+    re.IGNORECASE
+)
+MAX_EXPECTED_EVENTS = 10
+
+def estimate_text_tokens(text):
+    """Estimate the token count of text without a tokenizer.
+
+    About 4 characters per token for ASCII text; other characters (accents,
+    CJK, emoji) are counted as a token each.
+    """
+    if text.isascii():
+        return (len(text) + 3) // 4
+    ascii_chars = sum(1 for char in text if char.isascii())
+    return (ascii_chars + 3) // 4 + (len(text) - ascii_chars)
+
+def fit_to_token_budget(text, max_tokens):
+    """Truncate text to about max_tokens estimated tokens. Returns (text, truncated)."""
+    tokens = estimate_text_tokens(text)
+    if tokens <= max_tokens:
+        return text, False
+    # Scale by this text's own characters-per-token ratio, then trim any overshoot
+    cut = int(len(text) * max_tokens / tokens)
+    while cut > 0 and estimate_text_tokens(text[:cut]) > max_tokens:
+        cut = int(cut * 0.95)
+    return text[:cut] + "...", True
+
+def get_reasoning_tokens(model):
+    """Reasoning headroom for a model: its CONFIG value, or more once its answers were cut off."""
+    if model == CONFIG['summary_model']:
+        base = CONFIG['summary_reasoning_tokens']
+    else:
+        base = CONFIG['small_model_reasoning_tokens']
+    with reasoning_lock:
+        return max(base, reasoning_allowances.get(model, 0))
+
+def note_cut_off_response(model, response):
+    """Raise the model's reasoning headroom after a first attempt ran out of max_tokens.
+
+    gpt-oss spends part of max_tokens on reasoning, so a reasoning-heavy
+    answer gets cut off and its retry costs a full call. Later calls to the
+    model start with double the headroom, up to what summary_max_output_tokens
+    leaves after the JSON fields.
+    """
+    if not CONFIG['summary_reasoning_adaptive']:
+        return
+    choices = getattr(response, 'choices', None)
+    if not choices or getattr(choices[0], 'finish_reason', None) != 'length':
+        return
+    
+    current = get_reasoning_tokens(model)
+    raised = min(max(current * 2, 256), CONFIG['summary_max_output_tokens'] - CONFIG['summary_output_base_tokens'])
+    if raised <= current:
+        return
+    with reasoning_lock:
+        reasoning_allowances[model] = max(raised, reasoning_allowances.get(model, 0))
+    print(f"   📈 {model} answer was cut off, reasoning headroom raised to {raised} tokens")
+
+def plan_summary_budget(content_to_summarize, thread_context=None, events_known=False, small_model=False):
+    """Size the max_tokens reservation for one email from its content.
+
+    Reasoning headroom (per model), the fixed JSON fields, one slot per
+    expected event (from the date/time mentions in the content, none if the
+    events were extracted locally) and, for thread replies, the updated
+    thread summary.
+    """
+    expected_events = 0 if events_known else min(len(_EVENT_HINT_RE.findall(content_to_summarize)), MAX_EXPECTED_EVENTS)
+    output_tokens = (
+        CONFIG['summary_output_base_tokens'] +
+        expected_events * CONFIG['summary_tokens_per_event'] +
+        (150 if thread_context else 0)
+    )
+    reasoning_tokens = get_reasoning_tokens(CONFIG['summary_small_model'] if small_model else CONFIG['summary_model'])
+    max_tokens = min(reasoning_tokens + output_tokens, CONFIG['summary_max_output_tokens'])
+    return {
+        'input_tokens': estimate_text_tokens(content_to_summarize),
+        'expected_events': expected_events,
+        'output_tokens': output_tokens,
+        'max_tokens': max_tokens,
+        # A retry may have failed on a cut-off response, so it gets the full allowance
+        'retry_max_tokens': CONFIG['summary_max_output_tokens']
+    }
+
+_NOTIFICATION_SENDER_RE = re.compile(r'no[-_.]?reply|do[-_.]?not[-_.]?reply|notifications?@|alerts?@|mailer-daemon', re.IGNORECASE)
+_ESCALATION_KEYWORD_RE = re.compile(
+    r'\b(?:' + '|'.join(re.escape(keyword) for keyword in CONFIG['model_escalation_keywords']) + r')\b',
+    re.IGNORECASE
+) if CONFIG['model_escalation_keywords'] else None
+
+def route_summary_model(email_info, content_to_summarize, thread_context=None, events_known=False):
+    """Pick the model for an email's summary. Returns (model, reason).
+
+    Long content and mail mentioning CONFIG['model_escalation_keywords'] go
+    to the large model. Notifications (bulk mail, no-reply senders) go to the
+    small one. Thread replies and mail with dates the local extractor
+    couldn't resolve also need the large model; other short mail is
+    low-signal and goes to the small model.
+    """
+    small_model = CONFIG['summary_small_model']
+    if not small_model:
+        return CONFIG['summary_model'], 'single model'
+    
+    if estimate_text_tokens(content_to_summarize) > CONFIG['small_model_max_input_tokens']:
+        return CONFIG['summary_model'], 'long'
+    if _ESCALATION_KEYWORD_RE and (_ESCALATION_KEYWORD_RE.search(email_info.get('subject') or '')
+                                   or _ESCALATION_KEYWORD_RE.search(content_to_summarize)):
+        return CONFIG['summary_model'], 'high-stakes'
+    if email_info.get('triage', {}).get('category') == 'bulk' or _NOTIFICATION_SENDER_RE.search(email_info.get('sender') or ''):
+        return small_model, 'notification'
+    if thread_context:
+        return CONFIG['summary_model'], 'thread reply'
+    if not events_known and _EVENT_HINT_RE.search(content_to_summarize):
+        return CONFIG['summary_model'], 'unresolved dates'
+    return small_model, 'short'
+
+def plan_summary_request(email_info, content_to_summarize, thread_context=None, events_known=False):
+    """Route the email to a model and size its token budget. Returns (model, budget).
+
+    The choice is recorded in email_info['summary_model'] and ['model_route'].
+    """
+    model, route = route_summary_model(email_info, content_to_summarize, thread_context, events_known)
+    budget = plan_summary_budget(content_to_summarize, thread_context, events_known, small_model=model != CONFIG['summary_model'])
+    email_info['token_budget'] = budget
+    email_info['summary_model'] = model
+    email_info['model_route'] = route
+    return model, budget
+
+class TokenBucket:
+    """Continuously refilling per-minute quota.
+
+    reserve() takes the amount right away, letting the level go negative, and
+    returns how long the caller must wait for the quota to cover it. Callers
+    are therefore served in the order they reserved.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount, now):
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount, now):
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+class LLMUnavailableError(Exception):
+    """Raised instead of calling Cerebras while the circuit breaker is open."""
+    pass
+
+def is_llm_outage_error(error):
+    """Whether an error means Cerebras is down or overloaded, rather than a bad request."""
+    if isinstance(error, (LLMUnavailableError, APIConnectionError)):
+        return True
+    status = getattr(error, 'status_code', None)
+    return isinstance(status, int) and (status >= 500 or status in (408, 429))
+
+class CircuitBreaker:
+    """Stops calls to a failing service until it has had time to recover.
+
+    After failure_threshold consecutive outage errors the breaker opens and
+    callers are refused right away. Once reset_timeout seconds have passed a
+    single trial call is let through (half-open): success closes the breaker,
+    failure opens it for another reset_timeout.
+    """
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def allow_request(self):
+        """Whether a call may be made now. Claims the trial call when half-open."""
+        with self.lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self.trial_in_flight = False
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def is_open(self):
+        """Whether calls would be refused right now, without claiming the trial call."""
+        with self.lock:
+            if self.state == 'open':
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == 'half_open' and self.trial_in_flight
+
+    def record_success(self):
+        with self.lock:
+            if self.state != 'closed':
+                print("   🔌 Cerebras is responding again, circuit breaker closed")
+            self.state = 'closed'
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.failure_threshold):
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+                self.trial_in_flight = False
+                self.times_opened += 1
+                print(f"   🔌 Circuit breaker opened after {self.failures} Cerebras failures, pausing AI calls for {self.reset_timeout}s")
+
+    def status(self):
+        with self.lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'rejected_calls': self.rejected,
+                'retry_in_seconds': round(max(0.0, self.opened_at + self.reset_timeout - time.monotonic()), 1) if self.state == 'open' else None
+            }
+
+class LLMDispatcher:
+    """Front for chat.completions.create calls on Cerebras clients.
+
+    Limits in-flight calls to CONFIG['llm_max_concurrency'] and paces them
+    with request and token buckets sized to the per-minute quotas. A 429
+    pauses every caller until its Retry-After has passed, then the call is
+    retried; connection errors are retried with a short backoff. A failed
+    attempt gives its token reservation back. A 400 on a structured output
+    request retries with a looser response_format, and a fallback that
+    works is kept for the model. Outage errors feed a CircuitBreaker; while it is open calls
+    raise LLMUnavailableError without reaching Cerebras. Works for both
+    Cerebras (create) and AsyncCerebras (create_async) clients.
+    """
+
+    def __init__(self, max_concurrency, requests_per_minute, tokens_per_minute):
+        self.max_concurrency = max_concurrency
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+        self.async_semaphores = {}  # One asyncio.Semaphore per event loop
+        self.lock = threading.Lock()
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.blocked_until = 0.0  # time.monotonic() before which no call is made
+        self.breaker = CircuitBreaker(CONFIG['llm_breaker_failure_threshold'], CONFIG['llm_breaker_reset_timeout'])
+        self.calls = 0
+        self.calls_by_model = {}
+        self.rate_limited = 0
+        self.wait_seconds = 0.0
+
+    @staticmethod
+    def estimate_tokens(request_kwargs):
+        """Rough prompt + completion token count."""
+        prompt_tokens = sum(estimate_text_tokens(str(message.get('content', ''))) for message in request_kwargs.get('messages', []))
+        return prompt_tokens + request_kwargs.get('max_tokens', 0)
+
+    def _reserve(self, tokens):
+        """Reserve quota for one call and return the seconds to wait before making it."""
+        with self.lock:
+            now = time.monotonic()
+            wait = max(0.0, self.blocked_until - now)
+            if self.request_bucket:
+                wait = max(wait, self.request_bucket.reserve(1, now))
+            if self.token_bucket:
+                wait = max(wait, self.token_bucket.reserve(tokens, now))
+            self.wait_seconds += wait
+            return wait
+
+    def _settle(self, estimated_tokens, response, model):
+        """Give back the part of the token reservation the call didn't use."""
+        usage = getattr(response, 'usage', None)
+        used = getattr(usage, 'total_tokens', None)
+        with self.lock:
+            self.calls += 1
+            self.calls_by_model[model] = self.calls_by_model.get(model, 0) + 1
+            if self.token_bucket and isinstance(used, int) and used < estimated_tokens:
+                self.token_bucket.refund(estimated_tokens - used, time.monotonic())
+
+    def _refund(self, estimated_tokens):
+        """Give back the token reservation of an attempt that failed."""
+        if self.token_bucket:
+            with self.lock:
+                self.token_bucket.refund(estimated_tokens, time.monotonic())
+
+    def _check_breaker(self):
+        if not self.breaker.allow_request():
+            raise LLMUnavailableError("Cerebras circuit breaker is open")
+
+    def _record_outcome(self, error=None):
+        """Tell the breaker how a call ended; only outage errors count as failures."""
+        if error is not None and is_llm_outage_error(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _rate_limit_delay(self, error, attempt):
+        """Seconds to back off if error is a 429, else None. Pauses all callers."""
+        if getattr(error, 'status_code', None) != 429:
+            return None
+        
+        headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+        delay = None
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            try:
+                delay = float(retry_after)
+            except ValueError:
+                try:
+                    delay = (parsedate_to_datetime(retry_after) - datetime.now(pytz.UTC)).total_seconds()
+                except (TypeError, ValueError):
+                    delay = None
+        if delay is None:
+            delay = CONFIG['llm_rate_limit_backoff'] * attempt
+        delay = max(delay, 1.0)
+        
+        with self.lock:
+            self.rate_limited += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        print(f"   🚦 Cerebras rate limit hit, pausing LLM calls for {delay:.0f}s")
+        return delay
+
+    @staticmethod
+    def _connection_retry_delay(error, attempt):
+        """Seconds to wait before retrying a connection error or timeout, else None.
+
+        The clients are created with max_retries=0, so these transport
+        retries are done here instead of by the SDK.
+        """
+        if not isinstance(error, APIConnectionError) or attempt > CONFIG['llm_connection_retries']:
+            return None
+        delay = 0.5 * 2 ** (attempt - 1)
+        print(f"   🔁 Cerebras connection error, retrying in {delay:.1f}s: {error}")
+        return delay
+
+    def create(self, client, **request_kwargs):
+        """Rate-limited client.chat.completions.create for a Cerebras client."""
+        request_kwargs = apply_response_format_override(request_kwargs)
+        planned_format = request_kwargs.get('response_format')
+        estimated_tokens = self.estimate_tokens(request_kwargs)
+        max_attempts = CONFIG['llm_rate_limit_retries'] + 1
+        self._check_breaker()
+        
+        for attempt in range(1, max_attempts + 1):
+            wait = self._reserve(estimated_tokens)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                with self.semaphore:
+                    response = client.chat.completions.create(**request_kwargs)
+            except Exception as e:
+                self._refund(estimated_tokens)
+                if attempt < max_attempts:
+                    if fall_back_response_format(request_kwargs, e):
+                        continue
+                    if self._rate_limit_delay(e, attempt) is not None:
+                        continue
+                    delay = self._connection_retry_delay(e, attempt)
+                    if delay is not None:
+                        time.sleep(delay)
+                        continue
+                self._record_outcome(e)
+                raise
+            self._record_outcome()
+            self._settle(estimated_tokens, response, request_kwargs.get('model'))
+            remember_response_format(planned_format, request_kwargs)
+            return response
+
+    async def create_async(self, client, **request_kwargs):
+        """Rate-limited client.chat.completions.create for an AsyncCerebras client."""
+        loop = asyncio.get_running_loop()
+        semaphore = self.async_semaphores.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+        request_kwargs = apply_response_format_override(request_kwargs)
+        planned_format = request_kwargs.get('response_format')
+        estimated_tokens = self.estimate_tokens(request_kwargs)
+        max_attempts = CONFIG['llm_rate_limit_retries'] + 1
+        self._check_breaker()
+        
+        for attempt in range(1, max_attempts + 1):
+            wait = self._reserve(estimated_tokens)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            try:
+                async with semaphore:
+                    response = await client.chat.completions.create(**request_kwargs)
+            except Exception as e:
+                self._refund(estimated_tokens)
+                if attempt < max_attempts:
+                    if fall_back_response_format(request_kwargs, e):
+                        continue
+                    if self._rate_limit_delay(e, attempt) is not None:
+                        continue
+                    delay = self._connection_retry_delay(e, attempt)
+                    if delay is not None:
+                        await asyncio.sleep(delay)
+                        continue
+                self._record_outcome(e)
+                raise
+            self._record_outcome()
+            self._settle(estimated_tokens, response, request_kwargs.get('model'))
+            remember_response_format(planned_format, request_kwargs)
+            return response
+
+    def status(self):
+        with self.lock:
+            now = time.monotonic()
+            return {
+                'calls': self.calls,
+                'calls_by_model': dict(self.calls_by_model),
+                'rate_limited': self.rate_limited,
+                'total_wait_seconds': round(self.wait_seconds, 1),
+                'paused_for_seconds': round(max(0.0, self.blocked_until - now), 1),
+                'max_concurrency': self.max_concurrency,
+                'circuit_breaker': self.breaker.status()
+            }
+
+def get_llm_dispatcher():
+    """Return the shared LLM dispatcher, creating it on first use."""
+    global llm_dispatcher
+    if llm_dispatcher is None:
+        llm_dispatcher = LLMDispatcher(
+            CONFIG['llm_max_concurrency'],
+            CONFIG['llm_requests_per_minute'],
+            CONFIG['llm_tokens_per_minute']
+        )
+    return llm_dispatcher
+
+def prepare_summary_content(email_info, prepared_content=None):
+    """Pick, strip and truncate the content to summarize. Returns (content, source).
+
+    Content is cut to CONFIG['summary_input_token_budget'] estimated tokens.
+    """
+    if prepared_content is None:
+        prepared_content = extract_meaningful_content(email_info)
+    content_to_summarize, content_source = prepared_content
+    
+    if CONFIG['strip_quoted_replies'] and content_to_summarize:
+        new_content, removed_chars = strip_quoted_content(content_to_summarize)
+        if removed_chars:
+            content_to_summarize = (
+                f"[Only the new part of this message is shown; {removed_chars} characters of quoted "
+                f"earlier messages and signature were removed]\n\n{new_content}"
+            )
+    
+    content_to_summarize, _ = fit_to_token_budget(content_to_summarize, CONFIG['summary_input_token_budget'])
+    
+    return content_to_summarize, content_source
+
+def build_summary_messages(email_info, content_to_summarize, thread_context=None):
+    """Build the chat messages for the summary, priority and events prompt.
+
+    With thread_context (a record from the thread state store) the email is
+    presented as a new reply, and the model also returns an updated
+    "thread_summary" for the whole thread.
+    """
+    thread_instructions = ""
+    if thread_context:
+        thread_instructions = f"""
+
+This email is a new reply in an ongoing thread (earlier messages: {thread_context.get('message_count', 1)}).
+Summary of the thread so far:
+{thread_context['summary']}
+
+Summarize only what this reply adds in "summary", and also return "thread_summary": an updated summary of the whole thread under 80 words."""
+    
+    event_instructions = "Extract EVERY date, time, meeting, event, deadline, or scheduled item mentioned in the email. Include partial dates/times even if incomplete."
+    if email_info.get('events_source') == 'local':
+        event_instructions = "The events in this email have already been extracted, so return an empty \"events\" list."
+    
+    return [
+        {
+            "role": "system",
+            "content": """You are an expert email analyzer that provides comprehensive analysis including summaries, priority scoring, and event extraction. 
 
 CRITICAL: You must extract ALL dates, times, meetings, events, deadlines, appointments, and schedule-related information from emails. This includes:
 - Meeting dates and times
@@ -651,10 +2859,10 @@ Your response must be valid JSON with this exact structure:
     }
   ]
 }"""
-                },
-                {
-                    "role": "user", 
-                    "content": f"""Analyze this email and provide a JSON response with summary, priority (1-10), and ALL calendar events/dates/meetings/deadlines found in the content.
+        },
+        {
+            "role": "user", 
+            "content": f"""Analyze this email and provide a JSON response with summary, priority (1-10), and ALL calendar events/dates/meetings/deadlines found in the content.
 
 Email Subject: {email_info.get('subject', 'No Subject')}
 Email From: {email_info.get('sender', 'Unknown')}
@@ -663,63 +2871,444 @@ Email Date: {email_info.get('date', 'Unknown')}
 Email Content:
 {content_to_summarize}
 
-Remember: Extract EVERY date, time, meeting, event, deadline, or scheduled item mentioned in the email. Include partial dates/times even if incomplete."""
-                }
-            ]
-            
-            response = cerebras_client.chat.completions.create(
-                model="gpt-oss-120b",
-                messages=messages,
-                max_tokens=4000,
-                temperature=0.4
-            )
-            
-            if hasattr(response, 'choices') and len(response.choices) > 0:
-                response_text = response.choices[0].message.content.strip()
-                
-                if response_text:
-                    # Parse the AI response
-                    parsed_response = parse_ai_response(response_text)
-                    
-                    # Update email info with parsed data
-                    email_info['summary'] = parsed_response.get('summary', 'Summary generation failed')
-                    email_info['priority'] = parsed_response.get('priority', 5)
-                    email_info['events_extracted'] = parsed_response.get('events', [])
-                    email_info['summary_generated'] = True
-                    email_info['content_source'] = content_source
-                    email_info['summary_attempts'] = attempt
-                    
-                    print(f"   ✅ Analysis generated successfully on attempt {attempt}")
-                    print(f"   📊 Priority: {email_info['priority']}/10")
-                    print(f"   📅 Events found: {len(email_info['events_extracted'])}")
-                    
-                    # Add events to separate database
-                    if email_info['events_extracted']:
-                        events_data = load_events_data()
-                        add_events_to_database(email_info['events_extracted'], email_info, events_data)
-                    
-                    return  # Success - exit the retry loop
-                else:
-                    raise Exception("Empty response returned")
-            else:
-                raise Exception("No valid response from API")
-                
+Remember: {event_instructions}{thread_instructions}"""
+        }
+    ]
+
+def apply_summary_response(email_info, response, content_source, attempt, thread_context=None):
+    """Store a completion's summary, priority and events on the email.
+
+    Returns the parsed response. Raises an exception for an empty or invalid
+    response so the caller retries.
+    """
+    if not (hasattr(response, 'choices') and len(response.choices) > 0):
+        raise Exception("No valid response from API")
+    
+    if attempt == 1:
+        note_cut_off_response(email_info.get('summary_model') or CONFIG['summary_model'], response)
+    
+    # A cut-off answer is retried with the retry allowance while attempts remain
+    cut_off = getattr(response.choices[0], 'finish_reason', None) == 'length'
+    if cut_off and attempt < CONFIG['summary_retry_attempts']:
+        raise Exception("AI response was cut off at max_tokens")
+    
+    response_text = response.choices[0].message.content.strip()
+    if not response_text:
+        raise Exception("Empty response returned")
+    
+    # Parse the AI response
+    parsed_response = parse_ai_response(response_text, thread_context is not None)
+    if parsed_response.get('parse_failed') and attempt < CONFIG['summary_retry_attempts']:
+        raise Exception("AI response could not be parsed or repaired")
+    if cut_off:
+        parsed_response['truncated'] = True
+    store_summary_result(email_info, parsed_response, content_source, attempt, thread_context)
+    return parsed_response
+
+def store_summary_result(email_info, parsed_response, content_source, attempt, thread_context=None):
+    """Store a parsed summary result on the email and in the events and thread stores."""
+    # Update email info with parsed data
+    events_known = email_info.get('events_source') == 'local'
+    email_info['summary'] = parsed_response.get('summary', 'Summary generation failed')
+    email_info['priority'] = parsed_response.get('priority', 5)
+    if not events_known:
+        email_info['events_extracted'] = parsed_response.get('events', [])
+    email_info['summary_generated'] = True
+    email_info['content_source'] = content_source
+    email_info['summary_attempts'] = attempt
+    email_info['thread_context_used'] = thread_context is not None
+    
+    if attempt:
+        print(f"   ✅ Analysis generated successfully on attempt {attempt}")
+    print(f"   📊 Priority: {email_info['priority']}/10")
+    print(f"   📅 Events found: {len(email_info['events_extracted'])}")
+    
+    # Add events to separate database (local events were added when they were extracted)
+    if email_info['events_extracted'] and not events_known:
+        with events_lock:
+            events_data = load_events_data()
+            add_events_to_database(email_info['events_extracted'], email_info, events_data)
+    
+    if CONFIG['thread_summaries']:
+        thread_summary = parsed_response.get('thread_summary') if thread_context else None
+        update_thread_state(email_info, thread_summary)
+
+def apply_summary_failure(email_info, max_attempts, error_msg):
+    """Record that every summary attempt failed."""
+    email_info['summary'] = f"Analysis generation failed after {max_attempts} attempts: {error_msg}"
+    email_info['priority'] = 5  # Default priority
+    if email_info.get('events_source') != 'local':
+        email_info['events_extracted'] = []
+    email_info['summary_generated'] = False
+    email_info['summary_attempts'] = max_attempts
+    print(f"   ❌ Analysis generation failed after {max_attempts} attempts")
+
+def defer_email_summary(email_info, content_source, reason):
+    """Store the email without a summary and queue it for the deferred summary worker."""
+    email_info['summary'] = "Summary pending: the AI service is unavailable, it will be generated once it recovers"
+    email_info['priority'] = 5  # Default priority
+    if email_info.get('events_source') != 'local':
+        email_info['events_extracted'] = []
+    email_info['summary_generated'] = False
+    email_info['summary_deferred'] = True
+    email_info['content_source'] = content_source
+    get_deferred_summary_queue().add(email_info['id'], reason)
+    print(f"   ⏸️  Summary for {email_info['id']} deferred: {reason}")
+
+def should_defer_summary(error, attempt, max_attempts):
+    """Whether a failed summary attempt should go to the deferred queue instead of retrying here.
+
+    Retrying in place is pointless while the circuit breaker is open, and
+    after the last attempt an outage error is worth another try later.
+    """
+    if isinstance(error, LLMUnavailableError) or get_llm_dispatcher().breaker.is_open():
+        return True
+    return attempt >= max_attempts and is_llm_outage_error(error)
+
+def begin_email_summary(email_info, prepared_content=None):
+    """Set-up shared by generate_email_summary and generate_email_summary_async.
+
+    Prepares the content, applies local events, reads the thread context,
+    routes the model and checks the summary cache. Does blocking file I/O.
+    Returns the request plan, or None if there is nothing left to do (no
+    content, or the summary came from the cache).
+    """
+    content_to_summarize, content_source = prepare_summary_content(email_info, prepared_content)
+    
+    if not content_to_summarize:
+        print("   ⚠️  No meaningful content found to summarize")
+        return None
+    
+    events_known = apply_local_events(email_info, content_source)
+    thread_context = get_thread_context(email_info)
+    model, budget = plan_summary_request(email_info, content_to_summarize, thread_context, events_known)
+    handled, cache_key = lookup_cached_summary(email_info, content_to_summarize, content_source, thread_context, model)
+    if handled:
+        return None
+    
+    return {
+        'content': content_to_summarize,
+        'content_source': content_source,
+        'thread_context': thread_context,
+        'budget': budget,
+        'cache_key': cache_key
+    }
+
+def summary_attempt_kwargs(email_info, plan, attempt):
+    """create() keyword arguments for one summary attempt.
+
+    Retries go to the large model, in case the small one was the problem,
+    with the full output allowance.
+    """
+    if attempt == 1:
+        print(f"   🧠 Generating AI summary for {email_info['id']} with priority and events using {email_info['summary_model']} ({email_info['model_route']}) from {plan['content_source']} ({len(plan['content'])} chars)...")
+    else:
+        print(f"   🔄 Retry attempt {attempt}/{CONFIG['summary_retry_attempts']} for AI summary of {email_info['id']}...")
+        email_info['summary_model'] = CONFIG['summary_model']
+    budget = plan['budget']
+    return dict(
+        model=email_info['summary_model'],
+        messages=build_summary_messages(email_info, plan['content'], plan['thread_context']),
+        max_tokens=budget['max_tokens'] if attempt == 1 else budget['retry_max_tokens'],
+        temperature=0.4,
+        **summary_request_options(summary_result_schema(plan['thread_context'] is not None), 'email_summary')
+    )
+
+def finish_email_summary(email_info, plan, response, attempt):
+    """Store a summary response and cache it. Raises for a response that should be retried."""
+    parsed_response = apply_summary_response(email_info, response, plan['content_source'], attempt, plan['thread_context'])
+    remember_summary(plan['cache_key'], parsed_response)
+
+def handle_summary_error(email_info, plan, error, attempt):
+    """Record a failed summary attempt. Returns True if the email is done (deferred or out of attempts)."""
+    error_msg = str(error)
+    max_attempts = CONFIG['summary_retry_attempts']
+    print(f"   ❌ Analysis generation attempt {attempt} for {email_info['id']} failed: {error_msg}")
+    if should_defer_summary(error, attempt, max_attempts):
+        defer_email_summary(email_info, plan['content_source'], error_msg)
+        return True
+    if attempt >= max_attempts:
+        apply_summary_failure(email_info, max_attempts, error_msg)
+        return True
+    return False
+
+def summary_retry_delay(attempt):
+    """Seconds to wait before the next attempt (exponential backoff)."""
+    return CONFIG['summary_retry_delay'] * 1.5 ** (attempt - 1)
+
+async def generate_email_summary_async(email_info, async_cerebras_client, prepared_content=None):
+    """asyncio version of generate_email_summary for AsyncCerebras clients.
+
+    Retries wait with asyncio.sleep, so other emails keep going meanwhile.
+    The thread store, events database and cache files are read and written
+    in worker threads, off the event loop.
+    """
+    if not CONFIG['enable_summary'] or not async_cerebras_client:
+        return
+    
+    plan = await asyncio.to_thread(begin_email_summary, email_info, prepared_content)
+    if not plan:
+        return
+    
+    for attempt in range(1, CONFIG['summary_retry_attempts'] + 1):
+        try:
+            response = await get_llm_dispatcher().create_async(
+                async_cerebras_client, **summary_attempt_kwargs(email_info, plan, attempt))
+            await asyncio.to_thread(finish_email_summary, email_info, plan, response, attempt)
+            return
         except Exception as e:
-            error_msg = str(e)
-            print(f"   ❌ Analysis generation attempt {attempt} failed: {error_msg}")
-            if attempt < max_attempts:
-                print(f"   ⏳ Waiting {retry_delay} seconds before retry...")
-                time.sleep(retry_delay)
-                # Increase delay for next attempt (exponential backoff)
-                retry_delay *= 1.5
-            else:
-                # All attempts failed
-                email_info['summary'] = f"Analysis generation failed after {max_attempts} attempts: {error_msg}"
-                email_info['priority'] = 5  # Default priority
-                email_info['events_extracted'] = []
-                email_info['summary_generated'] = False
-                email_info['summary_attempts'] = max_attempts
-                print(f"   ❌ Analysis generation failed after {max_attempts} attempts")
+            if await asyncio.to_thread(handle_summary_error, email_info, plan, e, attempt):
+                return
+            await asyncio.sleep(summary_retry_delay(attempt))
+
+def generate_email_summary(email_info, cerebras_client, prepared_content=None):
+    """Generate a summary of the email using Cerebras API with priority and events extraction.
+
+    prepared_content is an optional (content, source) tuple from
+    extract_meaningful_content, computed earlier by the pipeline's clean stage.
+    While Cerebras is unavailable the email is deferred rather than retried
+    in place, so ingestion doesn't wait on the LLM.
+    """
+    if not CONFIG['enable_summary'] or not cerebras_client:
+        return
+    
+    plan = begin_email_summary(email_info, prepared_content)
+    if plan:
+        run_summary_attempts(email_info, plan, cerebras_client)
+
+def run_summary_attempts(email_info, plan, cerebras_client):
+    """Request the summary planned by begin_email_summary, with retries."""
+    for attempt in range(1, CONFIG['summary_retry_attempts'] + 1):
+        try:
+            response = get_llm_dispatcher().create(cerebras_client, **summary_attempt_kwargs(email_info, plan, attempt))
+            finish_email_summary(email_info, plan, response, attempt)
+            return  # Success - exit the retry loop
+        except Exception as e:
+            if handle_summary_error(email_info, plan, e, attempt):
+                return
+            delay = summary_retry_delay(attempt)
+            print(f"   ⏳ Waiting {delay:.1f} seconds before retry...")
+            time.sleep(delay)
+
+def is_batchable_email(email_info, prepared_content=None):
+    """Whether an email is short enough to be summarized in a batch.
+
+    Replies on a known thread need their own prompt with the thread summary.
+    """
+    if not CONFIG['summary_batch_enabled']:
+        return False
+    content_to_summarize, _ = prepare_summary_content(email_info, prepared_content)
+    if not content_to_summarize or estimate_text_tokens(content_to_summarize) > CONFIG['summary_batch_token_threshold']:
+        return False
+    return get_thread_context(email_info) is None
+
+def build_batch_summary_messages(entries):
+    """Build the chat messages for summarizing several short emails at once."""
+    blocks = []
+    for entry in entries:
+        email_info = entry['email_info']
+        events_note = "\nEvents: already extracted, return an empty list" if email_info.get('events_source') == 'local' else ""
+        blocks.append(f"""### Email ID: {email_info['id']}
+Subject: {email_info.get('subject', 'No Subject')}
+From: {email_info.get('sender', 'Unknown')}
+Date: {email_info.get('date', 'Unknown')}{events_note}
+Content:
+{entry['content']}""")
+    email_blocks = "\n\n".join(blocks)
+    
+    return [
+        {
+            "role": "system",
+            "content": """You are an expert email analyzer. For each email you receive, provide a summary, a priority score and ALL dates, times, meetings, events, deadlines and appointments it mentions.
+
+Your response must be a valid JSON object with one entry per email in "emails", in this exact structure:
+{
+  "emails": [
+    {
+      "id": "the Email ID given for the email",
+      "summary": "Concise summary under 50 words focusing on key information and action items",
+      "priority": integer from 1-10 (1=lowest, 10=highest urgency/importance),
+      "events": [
+        {
+          "description": "Event/meeting/deadline description",
+          "date": "YYYY-MM-DD or extracted date format",
+          "time": "HH:MM or extracted time format",
+          "location": "Location if mentioned",
+          "type": "meeting|deadline|event|appointment|conference|other"
+        }
+      ]
+    }
+  ]
+}"""
+        },
+        {
+            "role": "user",
+            "content": f"""Analyze each of these {len(entries)} emails independently and return the JSON object, with one entry for every Email ID.
+
+{email_blocks}"""
+        }
+    ]
+
+def batch_result_schema():
+    """JSON schema of a batched summary response."""
+    item_schema = summary_result_schema()
+    item_schema['properties'] = dict({'id': {'type': 'string'}}, **item_schema['properties'])
+    item_schema['required'] = list(item_schema['properties'])
+    return {
+        'type': 'object',
+        'properties': {'emails': {'type': 'array', 'items': item_schema}},
+        'required': ['emails'],
+        'additionalProperties': False
+    }
+
+def parse_batch_response(response, email_ids):
+    """Parse a batched completion into {email ID: result}. Raises ValueError if malformed.
+
+    Invalid JSON is repaired locally first, and entries that fail schema
+    validation are left out (their emails are retried). Results from a
+    cut-off response are flagged with truncated.
+    """
+    if not (hasattr(response, 'choices') and len(response.choices) > 0):
+        raise ValueError("No valid response from API")
+    
+    response_text = response.choices[0].message.content.strip()
+    truncated = getattr(response.choices[0], 'finish_reason', None) == 'length'
+    try:
+        response_data = json.loads(response_text)
+    except json.JSONDecodeError:
+        response_data, repaired_end = repair_json_text(response_text)
+        truncated = truncated or repaired_end
+    if isinstance(response_data, dict):
+        response_data = response_data.get('emails', response_data.get('results'))
+    if not isinstance(response_data, list):
+        raise ValueError("Batch response has no list of results")
+    
+    results = {}
+    for entry in response_data:
+        if not isinstance(entry, dict) or str(entry.get('id')) not in email_ids:
+            continue
+        try:
+            results[str(entry['id'])] = validate_summary_result(entry)
+        except ValueError:
+            continue
+        if truncated:
+            results[str(entry['id'])]['truncated'] = True
+    if not results:
+        raise ValueError("Batch response has no results for the requested emails")
+    return results
+
+def summarize_batch_entry(entry, cerebras_client):
+    """Summarize one batch entry on its own, with generate_email_summary's retries.
+
+    The entry's content, local events and cache lookup are already done by
+    generate_batch_summaries, so only the request is planned again.
+    """
+    email_info = entry['email_info']
+    _, budget = plan_summary_request(email_info, entry['content'], None, email_info.get('events_source') == 'local')
+    run_summary_attempts(email_info, {
+        'content': entry['content'],
+        'content_source': entry['content_source'],
+        'thread_context': None,
+        'budget': budget,
+        'cache_key': entry['cache_key']
+    }, cerebras_client)
+
+def summarize_email_batch(entries, cerebras_client, model=None):
+    """Summarize prepared batch entries with one completion.
+
+    A malformed response splits the batch in half and retries each half; a
+    result missing for some emails retries just those. Single emails and API
+    failures fall back to generate_email_summary with its retry handling.
+    model defaults to CONFIG['summary_model'].
+    """
+    model = model or CONFIG['summary_model']
+    if len(entries) == 1:
+        summarize_batch_entry(entries[0], cerebras_client)
+        return
+    
+    email_ids = [entry['email_info']['id'] for entry in entries]
+    # One reasoning allowance for the completion plus each email's own output
+    output_tokens = 0
+    small_model = model != CONFIG['summary_model']
+    for entry in entries:
+        entry['budget'] = plan_summary_budget(entry['content'], events_known=entry['email_info'].get('events_source') == 'local', small_model=small_model)
+        output_tokens += entry['budget']['output_tokens']
+    max_tokens = min(get_reasoning_tokens(model) + output_tokens, CONFIG['summary_max_output_tokens'])
+    
+    print(f"   🧠 Generating AI summaries for {len(entries)} short emails in one completion with {model}...")
+    try:
+        response = get_llm_dispatcher().create(
+            cerebras_client,
+            model=model,
+            messages=build_batch_summary_messages(entries),
+            max_tokens=max_tokens,
+            temperature=0.4,
+            **summary_request_options(batch_result_schema(), 'email_summary_batch')
+        )
+    except Exception as e:
+        print(f"   ❌ Batched summary request failed: {e}; summarizing individually")
+        for entry in entries:
+            summarize_batch_entry(entry, cerebras_client)
+        return
+    
+    note_cut_off_response(model, response)
+    try:
+        results = parse_batch_response(response, set(email_ids))
+    except (ValueError, KeyError, TypeError) as e:
+        middle = len(entries) // 2
+        print(f"   ⚠️  Malformed batch response ({e}); splitting into {middle} + {len(entries) - middle}")
+        summarize_email_batch(entries[:middle], cerebras_client, model)
+        summarize_email_batch(entries[middle:], cerebras_client, model)
+        return
+    
+    missing = []
+    for entry in entries:
+        result = results.get(entry['email_info']['id'])
+        if not result:
+            missing.append(entry)
+            continue
+        store_summary_result(entry['email_info'], result, entry['content_source'], 1)
+        entry['email_info']['summary_batch_size'] = len(entries)
+        entry['email_info']['token_budget'] = dict(entry['budget'], batch_max_tokens=max_tokens)
+        entry['email_info']['summary_model'] = model
+        entry['email_info']['model_route'] = entry['model_route']
+        remember_summary(entry['cache_key'], result)
+    
+    if missing:
+        print(f"   🔄 Batch response missed {len(missing)} emails, retrying them")
+        summarize_email_batch(missing, cerebras_client, model)
+
+def generate_batch_summaries(emails, cerebras_client):
+    """Summarize several short emails, batching the ones not in the summary cache.
+
+    emails is a list of (email_info, prepared_content) pairs, where
+    prepared_content is as for generate_email_summary. Emails are routed as
+    in route_summary_model and batched per model.
+    """
+    if not CONFIG['enable_summary'] or not cerebras_client:
+        return
+    
+    entries_by_model = {}
+    for email_info, prepared_content in emails:
+        content_to_summarize, content_source = prepare_summary_content(email_info, prepared_content)
+        if not content_to_summarize:
+            continue
+        events_known = apply_local_events(email_info, content_source)
+        model, route = route_summary_model(email_info, content_to_summarize, None, events_known)
+        handled, cache_key = lookup_cached_summary(email_info, content_to_summarize, content_source, None, model)
+        if handled:
+            continue
+        entries_by_model.setdefault(model, []).append({
+            'email_info': email_info,
+            'content': content_to_summarize,
+            'content_source': content_source,
+            'cache_key': cache_key,
+            'model_route': route
+        })
+    
+    for model, entries in entries_by_model.items():
+        for start in range(0, len(entries), CONFIG['summary_batch_size']):
+            summarize_email_batch(entries[start:start + CONFIG['summary_batch_size']], cerebras_client, model)
 
 def load_existing_data():
     """Load existing email data from JSON file using proper file handling."""
@@ -728,6 +3317,10 @@ def load_existing_data():
             # Use context manager to ensure file is properly closed
             with open(CONFIG['json_file'], 'r', encoding='utf-8') as f:
                 data = json.load(f)
+                # Older versions saved the cleaned-content memo with each record
+                for email in data.get('emails', []):
+                    email.pop('clean_content', None)
+                    email.pop('clean_content_source', None)
                 print(f"📄 Loaded existing data: {data.get('total_emails', 0)} emails")
                 return data
         except Exception as e:
@@ -756,46 +3349,582 @@ def save_data(data):
         print(f"❌ Error saving data: {e}")
         return False
 
-def process_new_email(service, message_id, cerebras_client, processed_label_id, data):
-    """Process a single new email."""
-    try:
-        print(f"\n📧 Processing new email: {message_id}")
-        
-        # Get full message details
-        msg = service.users().messages().get(
-            userId='me', 
-            id=message_id,
-            format='full'
-        ).execute()
-        
-        # Extract email information
-        email_info = extract_email_info(msg, service)
-        
-        print(f"   📋 Subject: {email_info.get('subject', 'No Subject')}")
-        print(f"   👤 From: {email_info.get('sender', 'Unknown')}")
-        print(f"   📖 Has been read: {email_info.get('has_been_read', False)}")
-        
-        # Generate AI summary with priority and events extraction
-        if cerebras_client:
-            generate_email_summary(email_info, cerebras_client)
-        
-        # Add label to mark as processed
-        if add_label_to_email(service, message_id, processed_label_id):
-            print(f"   🏷️  Added 'processed' label")
-        
-        # Add to data structure
+def insert_email_record(data, email_info):
+    """Add a processed email to the data structure and save it. Returns save_data's result."""
+    with data_lock:
         data['emails'].insert(0, email_info)  # Insert at beginning (newest first)
         data['total_emails'] = len(data['emails'])
+        saved = save_data(data)
+    with attachment_index_lock:
+        if attachment_index is not None and email_info.get('attachments'):
+            attachment_index[email_info['id']] = email_info['attachments']
+    return saved
+
+# =============================================================================
+# DEFERRED SUMMARIES
+# =============================================================================
+
+class DeferredSummaryQueue:
+    """Persistent queue of email IDs whose summary was deferred.
+
+    Entries are keyed by email ID and written to
+    CONFIG['deferred_summaries_file'] on every change, so deferred emails
+    survive a restart. Each retry pushes next_attempt_at out by an
+    exponentially growing, jittered delay.
+    """
+
+    def __init__(self, queue_file):
+        self.queue_file = queue_file
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.recovered = 0
+        self.dropped = 0
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.queue_file):
+            return
+        try:
+            with open(self.queue_file, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f).get('entries', {})
+            print(f"⏸️  Loaded deferred summary queue: {len(self.entries)} emails")
+        except Exception as e:
+            print(f"⚠️  Error loading deferred summary queue: {e}")
+
+    def _save(self):
+        try:
+            with open(self.queue_file, 'w', encoding='utf-8') as f:
+                json.dump({'entries': self.entries}, f, indent=2, default=str, ensure_ascii=False)
+        except Exception as e:
+            print(f"❌ Error saving deferred summary queue: {e}")
+
+    @staticmethod
+    def retry_delay(attempts):
+        """Jittered exponential backoff: between half and all of the capped delay."""
+        delay = min(CONFIG['deferred_retry_max_delay'], CONFIG['deferred_retry_base_delay'] * 2 ** attempts)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def add(self, email_id, reason):
+        """Queue an email, keeping its retry count if it is already queued."""
+        with self.lock:
+            entry = self.entries.get(email_id)
+            if entry is None:
+                entry = self.entries[email_id] = {
+                    'email_id': email_id,
+                    'enqueued_at': datetime.now().isoformat(),
+                    'attempts': 0,
+                    'next_attempt_at': time.time() + self.retry_delay(0)
+                }
+            entry['last_error'] = reason
+            self._save()
+
+    def due(self):
+        """IDs whose next attempt is due, oldest first."""
+        with self.lock:
+            now = time.time()
+            due_entries = [entry for entry in self.entries.values() if entry['next_attempt_at'] <= now]
+            return [entry['email_id'] for entry in sorted(due_entries, key=lambda entry: entry['next_attempt_at'])]
+
+    def retry_later(self, email_id, reason):
+        """Back off an entry after a failed attempt. Returns False if it was dropped."""
+        with self.lock:
+            entry = self.entries.get(email_id)
+            if entry is None:
+                return False
+            entry['attempts'] += 1
+            entry['last_error'] = reason
+            if entry['attempts'] >= CONFIG['deferred_max_attempts']:
+                del self.entries[email_id]
+                self.dropped += 1
+                kept = False
+            else:
+                entry['next_attempt_at'] = time.time() + self.retry_delay(entry['attempts'])
+                kept = True
+            self._save()
+            return kept
+
+    def remove(self, email_id, recovered=True):
+        with self.lock:
+            if self.entries.pop(email_id, None) is not None:
+                if recovered:
+                    self.recovered += 1
+                self._save()
+
+    def status(self):
+        with self.lock:
+            now = time.time()
+            return {
+                'pending': len(self.entries),
+                'due': sum(1 for entry in self.entries.values() if entry['next_attempt_at'] <= now),
+                'recovered': self.recovered,
+                'dropped': self.dropped
+            }
+
+def get_deferred_summary_queue():
+    """Return the shared deferred summary queue, creating it on first use."""
+    global deferred_summary_queue
+    if deferred_summary_queue is None:
+        deferred_summary_queue = DeferredSummaryQueue(CONFIG['deferred_summaries_file'])
+    return deferred_summary_queue
+
+class DeferredSummaryWorker:
+    """Background thread that summarizes deferred emails once Cerebras is back.
+
+    Works on a copy of the stored email so the data lock is only held while
+    the result is written back. While the circuit breaker is open the worker
+    just waits; its first call after the reset timeout is the breaker's trial.
+    """
+
+    def __init__(self, cerebras_client, data):
+        self.cerebras_client = cerebras_client
+        self.data = data
+        self.queue = get_deferred_summary_queue()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='deferred-summaries', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def _find_record(self, email_id):
+        for record in self.data['emails']:
+            if record.get('id') == email_id:
+                return record
+        return None
+
+    def _retry(self, email_id):
+        with data_lock:
+            record = self._find_record(email_id)
+            email_info = dict(record) if record else None
+        if email_info is None:
+            # Not persisted yet (or removed); look again later
+            if not self.queue.retry_later(email_id, 'email not found in the database'):
+                print(f"   ⚠️  Dropped deferred summary for {email_id}: email not found")
+            return
         
-        # Save updated data with proper file handling
-        if save_data(data):
-            print(f"   💾 Saved to {CONFIG['json_file']}")
+        print(f"\n🔁 Retrying deferred summary for {email_id} ({email_info.get('subject', 'No Subject')})")
+        email_info.pop('summary_deferred', None)
+        generate_email_summary(email_info, self.cerebras_client)
         
-        return True
+        if email_info.get('summary_deferred'):
+            if not self.queue.retry_later(email_id, email_info.get('summary', '')):
+                print(f"   ⚠️  Gave up on deferred summary for {email_id} after {CONFIG['deferred_max_attempts']} retries")
+            return
         
-    except Exception as e:
-        print(f"❌ Error processing email {message_id}: {e}")
-        return False
+        with data_lock:
+            record = self._find_record(email_id)
+            if record is not None:
+                record.pop('summary_deferred', None)
+                record.update(email_info)
+                save_data(self.data)
+        self.queue.remove(email_id, recovered=email_info.get('summary_generated', False))
+
+    def _run(self):
+        breaker = get_llm_dispatcher().breaker
+        while not self.stop_event.wait(timeout=5):
+            for email_id in self.queue.due():
+                if self.stop_event.is_set() or breaker.is_open():
+                    break
+                try:
+                    self._retry(email_id)
+                except Exception as e:
+                    print(f"❌ Error retrying deferred summary for {email_id}: {e}")
+                    self.queue.retry_later(email_id, str(e))
+
+def fetch_messages_batch(service, message_ids, msg_format='full', metadata_headers=None):
+    """Fetch messages through the Gmail HTTP batch endpoint.
+
+    Sends one HTTP request per CONFIG['fetch_batch_size'] messages and returns
+    (messages, errors), both keyed by message ID, so each failure is reported
+    for its own message. metadata_headers limits the headers returned for
+    msg_format='metadata'.
+    """
+    messages = {}
+    errors = {}
+
+    def handle_response(request_id, response, exception):
+        if exception is not None:
+            errors[request_id] = exception
+        else:
+            messages[request_id] = response
+
+    batch_size = CONFIG['fetch_batch_size']
+    for start in range(0, len(message_ids), batch_size):
+        chunk = message_ids[start:start + batch_size]
+        batch = service.new_batch_http_request(callback=handle_response)
+        for message_id in chunk:
+            get_kwargs = {'userId': 'me', 'id': message_id, 'format': msg_format}
+            if metadata_headers:
+                get_kwargs['metadataHeaders'] = metadata_headers
+            batch.add(service.users().messages().get(**get_kwargs), request_id=message_id)
+
+        try:
+            batch.execute()
+        except Exception as e:
+            # The whole batch request failed, so every message in it failed
+            for message_id in chunk:
+                if message_id not in messages:
+                    errors[message_id] = e
+
+    return messages, errors
+
+def triage_message(message):
+    """Classify a 'metadata' format message as bulk or personal mail.
+
+    Bulk mail (newsletters, mailing lists, automated notifications) is
+    recognised from its list headers and is not worth downloading in full.
+    """
+    headers = {h['name'].lower(): h['value'] for h in message.get('payload', {}).get('headers', [])}
+    reasons = []
+
+    if 'list-unsubscribe' in headers:
+        reasons.append('list-unsubscribe')
+    if 'list-id' in headers:
+        reasons.append('list-id')
+    if headers.get('precedence', '').strip().lower() in ('bulk', 'list', 'junk'):
+        reasons.append(f"precedence:{headers['precedence'].strip().lower()}")
+    if headers.get('auto-submitted', 'no').strip().lower() != 'no':
+        reasons.append('auto-submitted')
+
+    return {
+        'category': 'bulk' if reasons else 'personal',
+        'reasons': reasons,
+        'size_estimate': message.get('sizeEstimate', 0)
+    }
+
+def extract_bulk_email_info(message, triage):
+    """Build the email record for bulk mail from its metadata alone."""
+    email_info = extract_email_info(message, service=None)
+    email_info['triage'] = triage
+    email_info['body_fetched'] = False
+    if not CONFIG['summarize_bulk_mail']:
+        email_info['summary'] = html.unescape(email_info['snippet'])
+        email_info['priority'] = CONFIG['bulk_priority']
+    return email_info
+
+# =============================================================================
+# INGESTION PIPELINE
+# =============================================================================
+
+# Sentinel that tells a stage worker to exit
+_STAGE_STOP = object()
+
+class EmailPipeline:
+    """Staged concurrent ingestion: fetch -> clean -> summarize -> label -> persist.
+
+    Stages are connected by bounded queues, so a slow stage (usually the LLM)
+    blocks the ones feeding it instead of letting work pile up in memory.
+    Each stage has its own worker count from CONFIG. Persisting uses a single
+    worker because it owns the shared data structure and JSON file.
+    """
+
+    def __init__(self, service, cerebras_client, processed_label_id, data):
+        self.service = service
+        self.cerebras_client = cerebras_client
+        self.processed_label_id = processed_label_id
+        self.data = data
+        self.labeler = LabelCoalescer(service, processed_label_id)
+        self.parse_pool = None
+
+        queue_size = CONFIG['pipeline_queue_size']
+        self.fetch_queue = queue.Queue(maxsize=queue_size)
+        self.clean_queue = queue.Queue(maxsize=queue_size)
+        self.summarize_queue = queue.Queue(maxsize=queue_size)
+        self.label_queue = queue.Queue(maxsize=queue_size)
+        self.persist_queue = queue.Queue(maxsize=queue_size)
+
+        # (name, input queue, handler, worker count) in pipeline order
+        self.stages = [
+            ('fetch', self.fetch_queue, self._fetch, CONFIG['pipeline_fetch_workers']),
+            ('clean', self.clean_queue, self._clean, CONFIG['pipeline_clean_workers']),
+            ('summarize', self.summarize_queue, self._summarize, CONFIG['llm_max_concurrency']),
+            ('label', self.label_queue, self._label, CONFIG['pipeline_label_workers']),
+            ('persist', self.persist_queue, self._persist, 1),
+        ]
+        self.threads = {}
+
+        # Completion tracking for the messages submitted by process()
+        self.cycle_lock = threading.Condition()
+        self.pending = 0
+        self.failed_ids = []
+
+        # Short emails waiting to be summarized together
+        self.short_batch = []
+        self.short_batch_started = 0
+        self.batch_lock = threading.Lock()
+        self.batch_stop = threading.Event()
+        self.batch_thread = None
+
+    def start(self):
+        """Start the worker threads for every stage."""
+        self.labeler.start()
+        if CONFIG['fetch_format'] == 'raw':
+            self.parse_pool = ProcessPoolExecutor(max_workers=CONFIG['raw_parse_workers'])
+        for name, stage_queue, handler, workers in self.stages:
+            self.threads[name] = []
+            for i in range(max(1, workers)):
+                thread = threading.Thread(
+                    target=self._run_stage,
+                    args=(stage_queue, handler),
+                    name=f"pipeline-{name}-{i}",
+                    daemon=True
+                )
+                thread.start()
+                self.threads[name].append(thread)
+
+        if CONFIG['summary_batch_enabled']:
+            self.batch_stop.clear()
+            self.batch_thread = threading.Thread(target=self._run_batch_timer, name='pipeline-batch-timer', daemon=True)
+            self.batch_thread.start()
+
+        print("🏭 Ingestion pipeline started: " + ", ".join(
+            f"{name}×{len(threads)}" for name, threads in self.threads.items()))
+
+    def flush_labels(self):
+        """Apply queued 'processed' labels now, e.g. before a checkpoint commit."""
+        self.labeler.flush()
+
+    def shutdown(self):
+        """Stop the stages in pipeline order, letting in-flight emails drain."""
+        for name, stage_queue, _, _ in self.stages:
+            if name == 'summarize':
+                # Cleaning is done, so no more short emails will join a batch
+                self.batch_stop.set()
+                if self.batch_thread:
+                    self.batch_thread.join()
+                    self.batch_thread = None
+                self._flush_short_batch(force=True)
+            for _ in self.threads.get(name, []):
+                stage_queue.put(_STAGE_STOP)
+            for thread in self.threads.get(name, []):
+                thread.join()
+        self.threads = {}
+        self.labeler.stop()
+        if self.parse_pool:
+            self.parse_pool.shutdown(wait=True)
+            self.parse_pool = None
+        print("🏭 Ingestion pipeline stopped")
+
+    def process(self, message_ids):
+        """Push message IDs through the pipeline and wait for them to finish.
+
+        Returns the IDs that failed at any stage (or were dropped because the
+        monitor is stopping) so the caller can retry them.
+        """
+        with self.cycle_lock:
+            self.pending += len(message_ids)
+            self.failed_ids = []
+
+        batch_size = CONFIG['fetch_batch_size']
+        for start in range(0, len(message_ids), batch_size):
+            # Blocks while the fetch queue is full
+            self.fetch_queue.put(message_ids[start:start + batch_size])
+
+        with self.cycle_lock:
+            while self.pending > 0:
+                self.cycle_lock.wait(timeout=1)
+            return list(self.failed_ids)
+
+    def _finish(self, message_id, success):
+        """Mark one message as done with the pipeline."""
+        with self.cycle_lock:
+            if not success:
+                self.failed_ids.append(message_id)
+            self.pending -= 1
+            if self.pending <= 0:
+                self.cycle_lock.notify_all()
+
+    def _run_stage(self, stage_queue, handler):
+        """Worker loop for one stage."""
+        while True:
+            item = stage_queue.get()
+            if item is _STAGE_STOP:
+                break
+            handler(item)
+
+    def _fetch_batch(self, message_ids, **fetch_kwargs):
+        """Batch fetch messages, finishing the ones that failed.
+
+        Returns the fetched messages keyed by ID.
+        """
+        try:
+            fetched, fetch_errors = fetch_messages_batch(self.service, message_ids, **fetch_kwargs)
+        except Exception as e:
+            fetched, fetch_errors = {}, {message_id: e for message_id in message_ids}
+        print(f"   📥 Fetched {len(fetched)}/{len(message_ids)} emails "
+              f"({fetch_kwargs.get('msg_format', 'full')}) in one batch request")
+
+        for message_id, error in fetch_errors.items():
+            report_quota_error(error)
+            print(f"❌ Error fetching email {message_id}: {error}")
+            # Deleted messages (404) are gone for good; retry everything else
+            self._finish(message_id, isinstance(error, HttpError) and error.resp.status == 404)
+        return fetched
+
+    def _fetch(self, message_ids):
+        """Fetch a chunk of messages in batch requests and extract them.
+
+        With triage enabled, metadata is fetched first and the full payload
+        only for mail that will be summarized; bulk mail is recorded from its
+        metadata.
+        """
+        if not RUNNING:
+            # Shutting down: don't start new work, leave it for the next run
+            for message_id in message_ids:
+                self._finish(message_id, False)
+            return
+
+        triaged = {}
+        triage_results = {}
+        full_ids = message_ids
+        if CONFIG['triage_enabled']:
+            metadata = self._fetch_batch(
+                message_ids,
+                msg_format='metadata',
+                metadata_headers=CONFIG['triage_metadata_headers']
+            )
+            full_ids = []
+            for message_id in message_ids:
+                if message_id not in metadata:
+                    continue
+                triage = triage_results[message_id] = triage_message(metadata[message_id])
+                if triage['category'] == 'bulk':
+                    triaged[message_id] = (metadata[message_id], triage)
+                else:
+                    full_ids.append(message_id)
+
+        fetched = self._fetch_batch(full_ids, msg_format=CONFIG['fetch_format']) if full_ids else {}
+
+        # Raw MIME is parsed in the process pool, all of the chunk at once
+        parsed = {}
+        if self.parse_pool:
+            parsed = {message_id: self.parse_pool.submit(parse_raw_message, message)
+                      for message_id, message in fetched.items()}
+
+        for message_id in message_ids:
+            if message_id not in fetched and message_id not in triaged:
+                continue  # Already finished by _fetch_batch
+
+            try:
+                if message_id in triaged:
+                    message, triage = triaged[message_id]
+                    email_info = extract_bulk_email_info(message, triage)
+                else:
+                    if message_id in parsed:
+                        email_info = parsed[message_id].result()
+                    else:
+                        email_info = extract_email_info(fetched[message_id], self.service)
+                    if message_id in triage_results:
+                        email_info['triage'] = triage_results[message_id]
+            except Exception as e:
+                print(f"❌ Error processing email {message_id}: {e}")
+                self._finish(message_id, False)
+                continue
+
+            print(f"\n📧 Processing new email: {message_id}")
+            print(f"   📋 Subject: {email_info.get('subject', 'No Subject')}")
+            print(f"   👤 From: {email_info.get('sender', 'Unknown')}")
+            if message_id in triaged:
+                print(f"   📰 Bulk mail ({', '.join(triage['reasons'])}), skipped full body download")
+            self.clean_queue.put({
+                'message_id': message_id,
+                'email_info': email_info,
+                'skip_summary': message_id in triaged and not CONFIG['summarize_bulk_mail']
+            })
+
+    def _clean(self, item):
+        """Select and clean the content the LLM will see.
+
+        Short emails are held back to be summarized in a batch.
+        """
+        try:
+            if self.cerebras_client and CONFIG['enable_summary'] and not item['skip_summary']:
+                item['content'] = extract_meaningful_content(item['email_info'])
+                if is_batchable_email(item['email_info'], item['content']):
+                    with self.batch_lock:
+                        if not self.short_batch:
+                            self.short_batch_started = time.time()
+                        self.short_batch.append(item)
+                    self._flush_short_batch()
+                    return
+            self.summarize_queue.put(item)
+        except Exception as e:
+            print(f"❌ Error cleaning email {item['message_id']}: {e}")
+            self._finish(item['message_id'], False)
+
+    def _flush_short_batch(self, force=False):
+        """Send the waiting short emails to the summarize stage as one batch item.
+
+        Without force, only a full batch or one older than
+        CONFIG['summary_batch_max_wait'] is sent.
+        """
+        with self.batch_lock:
+            if not self.short_batch:
+                return
+            is_full = len(self.short_batch) >= CONFIG['summary_batch_size']
+            is_due = time.time() - self.short_batch_started >= CONFIG['summary_batch_max_wait']
+            if not (force or is_full or is_due):
+                return
+            batch, self.short_batch = self.short_batch, []
+        self.summarize_queue.put({'batch': batch})
+
+    def _run_batch_timer(self):
+        """Flush partly filled short-email batches once they have waited long enough."""
+        while not self.batch_stop.wait(0.5):
+            self._flush_short_batch()
+
+    def _summarize(self, item):
+        """Generate the AI summary with priority and events extraction."""
+        if 'batch' in item:
+            self._summarize_batch(item['batch'])
+            return
+        try:
+            if self.cerebras_client and not item['skip_summary']:
+                generate_email_summary(item['email_info'], self.cerebras_client, item.get('content'))
+            self.label_queue.put(item)
+        except Exception as e:
+            print(f"❌ Error summarizing email {item['message_id']}: {e}")
+            self._finish(item['message_id'], False)
+
+    def _summarize_batch(self, items):
+        """Summarize a batch of short emails with shared completions."""
+        try:
+            generate_batch_summaries(
+                [(batch_item['email_info'], batch_item.get('content')) for batch_item in items],
+                self.cerebras_client
+            )
+        except Exception as e:
+            print(f"❌ Error summarizing batch of {len(items)} emails: {e}")
+            for batch_item in items:
+                self._finish(batch_item['message_id'], False)
+            return
+        for batch_item in items:
+            self.label_queue.put(batch_item)
+
+    def _label(self, item):
+        """Queue the processed label; the coalescer applies it in bulk."""
+        try:
+            self.labeler.add(item['message_id'])
+            self.persist_queue.put(item)
+        except Exception as e:
+            print(f"❌ Error labelling email {item['message_id']}: {e}")
+            self._finish(item['message_id'], False)
+
+    def _persist(self, item):
+        """Add the email to the data structure and save it."""
+        try:
+            if insert_email_record(self.data, item['email_info']):
+                print(f"   💾 Saved {item['message_id']} to {CONFIG['json_file']}")
+            self._finish(item['message_id'], True)
+        except Exception as e:
+            print(f"❌ Error saving email {item['message_id']}: {e}")
+            self._finish(item['message_id'], False)
 
 # =============================================================================
 # FLASK API SERVER FUNCTIONS
@@ -851,6 +3980,219 @@ def send_message(service, user_id, message):
         print(f'An error occurred: {error}')
         return None
 
+GMAIL_ATTACHMENT_URL = 'https://gmail.googleapis.com/gmail/v1/users/me/messages/{message_id}/attachments/{attachment_id}'
+ATTACHMENT_CHUNK_SIZE = 64 * 1024  # Bytes read from Gmail per chunk while downloading
+
+class AttachmentCache:
+    """Size-bounded on-disk LRU cache of decoded attachments.
+
+    Files are named by a hash of the cache key; a file's mtime is its last
+    use. After each insert the least recently used files are deleted until
+    the cache fits in CONFIG['attachment_cache_max_bytes'].
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.key_locks = {}  # Key -> [lock, number of requests using it]; one download per key at a time
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get_or_download(self, key, download):
+        """Return the cached file path for key, calling download(file) on a miss."""
+        path = self._path(key)
+        with self.lock:
+            entry = self.key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        
+        try:
+            with entry[0]:
+                if os.path.exists(path):
+                    os.utime(path)  # Mark as recently used
+                    with self.lock:
+                        self.hits += 1
+                    return path
+                
+                with self.lock:
+                    self.misses += 1
+                temp_path = f"{path}.{threading.get_ident()}.part"
+                try:
+                    with open(temp_path, 'wb') as f:
+                        download(f)
+                    os.replace(temp_path, path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+        finally:
+            # Drop the per-key lock once no request holds or waits for it
+            with self.lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self.key_locks[key]
+        
+        with self.lock:
+            self._evict(keep=path)
+        return path
+
+    def _evict(self, keep):
+        """Delete least recently used files until the cache fits its size limit."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.part'):
+                continue
+            full_path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(full_path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, full_path))
+        
+        total = sum(size for _, size, _ in entries)
+        for _, size, full_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if full_path == keep:
+                continue
+            try:
+                os.remove(full_path)
+                total -= size
+            except FileNotFoundError:
+                pass
+
+    def status(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'directory': self.directory}
+
+def get_attachment_cache():
+    """Return the shared attachment cache, creating it on first use."""
+    global attachment_cache
+    if attachment_cache is None:
+        attachment_cache = AttachmentCache(CONFIG['attachment_cache_dir'], CONFIG['attachment_cache_max_bytes'])
+    return attachment_cache
+
+class AttachmentDataDecoder:
+    """Writes the base64url "data" field of a streamed attachments.get response to a file.
+
+    The JSON body is scanned chunk by chunk, so only one chunk of the
+    attachment is in memory at a time.
+    """
+
+    DATA_FIELD_RE = re.compile(rb'"data"\s*:\s*"')
+
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.buffer = b''  # Response bytes before the data field starts
+        self.carry = b''  # Base64 characters left over from the last 4-character group
+        self.in_data = False
+        self.done = False
+        self.bytes_written = 0
+
+    def feed(self, chunk):
+        """Process one chunk of the response. Returns True once the data field has ended."""
+        if self.done:
+            return True
+        
+        if not self.in_data:
+            self.buffer += chunk
+            match = self.DATA_FIELD_RE.search(self.buffer)
+            if not match:
+                # Keep enough bytes for a field name split across chunks
+                self.buffer = self.buffer[-32:]
+                return False
+            self.in_data = True
+            chunk = self.buffer[match.end():]
+            self.buffer = b''
+        
+        end = chunk.find(b'"')
+        if end >= 0:
+            chunk = chunk[:end]
+            self.done = True
+        self._write(chunk)
+        return self.done
+
+    def _write(self, data):
+        data = self.carry + data
+        usable = len(data) if self.done else len(data) - len(data) % 4
+        self.carry = data[usable:]
+        if usable:
+            decoded = base64.urlsafe_b64decode(data[:usable] + b'=' * (-usable % 4))
+            self.out_file.write(decoded)
+            self.bytes_written += len(decoded)
+
+    def finish(self):
+        if not self.done:
+            raise ValueError("Attachment response ended before the data field was complete")
+        return self.bytes_written
+
+def download_attachment(credentials, message_id, attachment_id, out_file):
+    """Stream an attachment from Gmail into out_file, decoding it on the fly. Returns the byte count."""
+    session = AuthorizedSession(credentials)
+    headers = {}
+    project_id = get_project_id_from_credentials()
+    if project_id:
+        headers['x-goog-user-project'] = project_id
+    
+    url = GMAIL_ATTACHMENT_URL.format(message_id=message_id, attachment_id=attachment_id)
+    with session.get(url, headers=headers, stream=True, timeout=60) as response:
+        if response.status_code >= 400:
+            raise GoogleApiError(response.status_code, response.text)
+        
+        decoder = AttachmentDataDecoder(out_file)
+        for chunk in response.iter_content(chunk_size=ATTACHMENT_CHUNK_SIZE):
+            if decoder.feed(chunk):
+                break
+        return decoder.finish()
+
+def find_stored_attachment(message_id, attachment_ref):
+    """Find attachment metadata in the local database by attachment_id or part_id.
+
+    Uses an in-memory index of the stored attachments, read from the JSON
+    file once and kept current by insert_email_record.
+    """
+    global attachment_index
+    with attachment_index_lock:
+        if attachment_index is None:
+            attachment_index = {
+                email['id']: email['attachments']
+                for email in load_existing_data().get('emails', [])
+                if email.get('id') and email.get('attachments')
+            }
+        attachments = attachment_index.get(message_id, [])
+    for attachment in attachments:
+        if attachment_ref in (attachment.get('attachment_id'), attachment.get('part_id')):
+            return attachment
+    return None
+
+def _attachment_part_fields(depth):
+    fields = 'partId,body/attachmentId'
+    return fields if depth == 0 else f'{fields},parts({_attachment_part_fields(depth - 1)})'
+
+def resolve_attachment_id(service, message_id, part_id):
+    """Look up the current Gmail attachmentId of a message part.
+
+    Records parsed in raw mode only know the part ID, and Gmail attachment IDs
+    are not stable across fetches anyway.
+    """
+    message = service.users().messages().get(
+        userId='me',
+        id=message_id,
+        format='full',
+        fields=f'payload({_attachment_part_fields(6)})'
+    ).execute()
+    
+    pending = [message.get('payload', {})]
+    while pending:
+        part = pending.pop()
+        if part.get('partId') == part_id:
+            return part.get('body', {}).get('attachmentId')
+        pending.extend(part.get('parts', []))
+    return None
+
 def get_primary_calendar_id():
     """Get the primary calendar ID from user's calendar list."""
     try:
@@ -858,7 +4200,10 @@ def get_primary_calendar_id():
             return None
         
         # Get calendar list
-        calendar_list = calendar_service.calendarList().list().execute()
+        if async_engine:
+            calendar_list = async_engine.run(async_engine.google.list_calendars())
+        else:
+            calendar_list = calendar_service.calendarList().list().execute()
         calendars = calendar_list.get('items', [])
         
         if not calendars:
@@ -883,14 +4228,17 @@ def create_calendar_event(calendar_id, event_data):
             return None
         
         # Create the event
-        event = calendar_service.events().insert(
-            calendarId=calendar_id,
-            body=event_data
-        ).execute()
+        if async_engine:
+            event = async_engine.run(async_engine.google.insert_calendar_event(calendar_id, event_data))
+        else:
+            event = calendar_service.events().insert(
+                calendarId=calendar_id,
+                body=event_data
+            ).execute()
         
         return event
         
-    except HttpError as error:
+    except (HttpError, GoogleApiError) as error:
         print(f"❌ Error creating calendar event: {error}")
         return None
 
@@ -1023,13 +4371,22 @@ def get_calendar_events_for_date(date_str=None, timezone='UTC'):
         print(f"   UTC range: {start_of_day_utc} to {end_of_day_utc}")
         
         # Get events from Google Calendar
-        events_result = calendar_service.events().list(
-            calendarId=calendar_id,
-            timeMin=start_of_day_utc,
-            timeMax=end_of_day_utc,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
+        if async_engine:
+            events_result = async_engine.run(async_engine.google.list_calendar_events(
+                calendar_id,
+                timeMin=start_of_day_utc,
+                timeMax=end_of_day_utc,
+                singleEvents='true',
+                orderBy='startTime'
+            ))
+        else:
+            events_result = calendar_service.events().list(
+                calendarId=calendar_id,
+                timeMin=start_of_day_utc,
+                timeMax=end_of_day_utc,
+                singleEvents=True,
+                orderBy='startTime'
+            ).execute()
         
         events = events_result.get('items', [])
         
@@ -1099,7 +4456,59 @@ def health_check():
         'timestamp': datetime.now().isoformat(),
         'gmail_authenticated': gmail_service is not None,
         'calendar_authenticated': calendar_service is not None,
-        'monitor_running': RUNNING
+        'monitor_running': RUNNING,
+        'poll_scheduler': poll_scheduler.status() if poll_scheduler else None,
+        'attachment_cache': attachment_cache.status() if attachment_cache else None,
+        'summary_cache': summary_cache.status() if summary_cache else None,
+        'llm_dispatcher': llm_dispatcher.status() if llm_dispatcher else None,
+        'deferred_summaries': deferred_summary_queue.status() if deferred_summary_queue else None
+    })
+
+@app.route('/gmail_push', methods=['POST'])
+def gmail_push():
+    """Receive a Gmail Pub/Sub push notification and wake the monitor.
+
+    Expects the Pub/Sub push envelope, whose message.data is base64 JSON
+    like {"emailAddress": "...", "historyId": "..."}.
+    """
+    token = CONFIG['push_verification_token']
+    if token and request.args.get('token') != token:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid verification token'
+        }), 403
+    
+    envelope = request.get_json(silent=True)
+    if not envelope or 'message' not in envelope:
+        return jsonify({
+            'success': False,
+            'error': 'Invalid Pub/Sub message format'
+        }), 400
+    
+    try:
+        payload = json.loads(base64.b64decode(envelope['message'].get('data', '')).decode('utf-8'))
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': f'Invalid notification data: {e}'
+        }), 400
+    
+    history_id = payload.get('historyId')
+    if history_id is None:
+        return jsonify({
+            'success': False,
+            'error': 'Notification has no historyId'
+        }), 400
+    
+    print(f"\n📡 Push notification for {payload.get('emailAddress', 'unknown')} (historyId {history_id})")
+    if poll_scheduler:
+        poll_scheduler.wake(history_id)
+    
+    # Pub/Sub retries anything that isn't a 2xx, so acknowledge right away
+    return jsonify({
+        'success': True,
+        'history_id': history_id,
+        'monitor_woken': poll_scheduler is not None
     })
 
 @app.route('/send_email', methods=['POST'])
@@ -1246,6 +4655,75 @@ def get_calendar_events():
         
         return jsonify(error_details), 500
 
+@app.route('/get_attachment/<message_id>/<attachment_id>', methods=['GET'])
+def get_attachment(message_id, attachment_id):
+    """Stream an attachment's bytes, with HTTP Range support and an on-disk cache.
+
+    attachment_id is the attachment_id or part_id stored in the email record.
+    Add ?download=1 to get it as a file download instead of inline.
+    """
+    try:
+        if not gmail_service:
+            return jsonify({
+                'error': 'Gmail service not authenticated',
+                'success': False
+            }), 500
+        
+        stored = find_stored_attachment(message_id, attachment_id) or {}
+        part_id = stored.get('part_id')
+        filename = stored.get('filename') or attachment_id
+        mime_type = stored.get('mime_type')
+        if not mime_type or mime_type == 'unknown':
+            mime_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        
+        def download(out_file):
+            gmail_attachment_id = attachment_id
+            if part_id and (attachment_id == part_id or not stored.get('attachment_id')):
+                gmail_attachment_id = resolve_attachment_id(gmail_service, message_id, part_id)
+                if not gmail_attachment_id:
+                    raise GoogleApiError(404, f"No attachment in part {part_id}")
+            size = download_attachment(gmail_credentials, message_id, gmail_attachment_id, out_file)
+            print(f"📎 Downloaded attachment {filename} ({size} bytes) from message {message_id}")
+        
+        # Part IDs are stable, Gmail attachment IDs are not
+        cache_key = f"{message_id}/{part_id or attachment_id}"
+        for _ in range(2):
+            path = get_attachment_cache().get_or_download(cache_key, download)
+            try:
+                return send_file(
+                    path,
+                    mimetype=mime_type,
+                    as_attachment=request.args.get('download', '0') == '1',
+                    download_name=filename,
+                    conditional=True  # Handles Range/If-Range with 206 responses
+                )
+            except FileNotFoundError:
+                # Evicted by another request between lookup and open; download it again
+                print(f"⚠️  Cached attachment {cache_key} was evicted before sending, retrying")
+        
+        return jsonify({
+            'error': 'Attachment was evicted from the cache before it could be sent',
+            'success': False
+        }), 404
+        
+    except (HttpError, GoogleApiError) as e:
+        status = e.resp.status if isinstance(e, HttpError) else e.status
+        if status == 404:
+            return jsonify({
+                'success': False,
+                'error': 'Attachment not found'
+            }), 404
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'error_type': type(e).__name__
+        }), 500
+
 @app.route('/get_emails', methods=['GET'])
 def get_emails():
     """Get recent emails from Gmail."""
@@ -1432,6 +4910,79 @@ def get_events():
             'error_type': type(e).__name__
         }), 500
 
+@app.route('/get_threads', methods=['GET'])
+def get_threads():
+    """Get per-thread summaries, most recently updated first."""
+    try:
+        with threads_lock:
+            threads_data = load_threads_data()
+        
+        # Get query parameters
+        max_results = request.args.get('max_results', 20, type=int)
+        max_results = min(max_results, 100)  # Limit to prevent abuse
+        
+        threads = sorted(
+            threads_data.get('threads', {}).values(),
+            key=lambda thread: thread.get('updated_at', ''),
+            reverse=True
+        )[:max_results]
+        
+        return jsonify({
+            'success': True,
+            'threads': threads,
+            'total_threads': threads_data.get('total_threads', 0),
+            'returned_count': len(threads)
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'error_type': type(e).__name__
+        }), 500
+
+@app.route('/get_thread/<thread_id>', methods=['GET'])
+def get_thread(thread_id):
+    """Get one thread's summary together with its per-message summaries."""
+    try:
+        with threads_lock:
+            thread = load_threads_data().get('threads', {}).get(thread_id)
+        
+        if not thread:
+            return jsonify({
+                'success': False,
+                'error': 'Thread not found'
+            }), 404
+        
+        messages = [
+            {
+                'id': email.get('id'),
+                'subject': email.get('subject'),
+                'sender': email.get('sender'),
+                'timestamp': email.get('timestamp'),
+                'summary': email.get('summary'),
+                'priority': email.get('priority'),
+                'events_extracted': email.get('events_extracted', []),
+                'thread_context_used': email.get('thread_context_used', False)
+            }
+            for email in load_existing_data().get('emails', [])
+            if email.get('thread_id') == thread_id
+        ]
+        messages.sort(key=lambda message: parse_email_timestamp(message['timestamp']))
+        
+        return jsonify({
+            'success': True,
+            'thread': thread,
+            'messages': messages
+        })
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'error_type': type(e).__name__
+        }), 500
+
 @app.route('/create_calendar_event', methods=['POST'])
 def create_calendar_event_endpoint():
     """Create a calendar event using Google Calendar API."""
@@ -1624,28 +5175,480 @@ def run_flask_server():
     except Exception as e:
         print(f"❌ Flask server error: {e}")
 
+# =============================================================================
+# ASYNCIO MONITOR ENGINE
+# =============================================================================
+
+class GoogleApiError(Exception):
+    """Error response from a Google REST API call made outside googleapiclient
+    (AsyncGoogleClient, streamed attachment downloads)."""
+
+    def __init__(self, status, message):
+        super().__init__(f"HTTP {status}: {message}")
+        self.status = status
+
+class AsyncGoogleClient:
+    """Minimal asyncio REST client for the Gmail and Calendar APIs.
+
+    Authorizes requests with the OAuth credentials from authenticate_gmail,
+    refreshing the token when it expires, and caps in-flight requests at
+    CONFIG['async_max_http_requests'].
+    """
+
+    GMAIL_API = 'https://gmail.googleapis.com/gmail/v1/users/me'
+    CALENDAR_API = 'https://www.googleapis.com/calendar/v3'
+
+    def __init__(self, credentials, project_id=None):
+        self.credentials = credentials
+        self.project_id = project_id
+        self.session = None
+        self.semaphore = asyncio.Semaphore(CONFIG['async_max_http_requests'])
+        self.refresh_lock = asyncio.Lock()
+
+    async def open(self):
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=60),
+            connector=aiohttp.TCPConnector(limit=CONFIG['async_max_http_requests'])
+        )
+
+    async def close(self):
+        if self.session:
+            await self.session.close()
+            self.session = None
+
+    async def _headers(self, force_refresh=False):
+        """Authorization headers, refreshing the access token if needed."""
+        async with self.refresh_lock:
+            if force_refresh or not self.credentials.valid:
+                await asyncio.to_thread(self.credentials.refresh, Request())
+        headers = {'Authorization': f'Bearer {self.credentials.token}'}
+        if self.project_id:
+            headers['x-goog-user-project'] = self.project_id
+        return headers
+
+    async def request(self, method, url, params=None, json_body=None):
+        """Make an authorized request and return the decoded JSON body."""
+        async with self.semaphore:
+            for attempt in range(2):
+                headers = await self._headers(force_refresh=attempt > 0)
+                async with self.session.request(method, url, params=params, json=json_body, headers=headers) as response:
+                    if response.status == 401 and attempt == 0:
+                        continue  # Token revoked or expired early; refresh once
+                    if response.status >= 400:
+                        raise GoogleApiError(response.status, await response.text())
+                    if response.status == 204:
+                        return {}
+                    return await response.json()
+
+    async def get_message(self, message_id, msg_format='full', metadata_headers=None):
+        params = [('format', msg_format)]
+        params += [('metadataHeaders', header) for header in metadata_headers or []]
+        return await self.request('GET', f'{self.GMAIL_API}/messages/{message_id}', params=params)
+
+    async def batch_modify(self, message_ids, add_label_ids):
+        return await self.request(
+            'POST',
+            f'{self.GMAIL_API}/messages/batchModify',
+            json_body={'ids': message_ids, 'addLabelIds': add_label_ids}
+        )
+
+    async def list_calendars(self):
+        return await self.request('GET', f'{self.CALENDAR_API}/users/me/calendarList')
+
+    async def list_calendar_events(self, calendar_id, **params):
+        return await self.request('GET', f'{self.CALENDAR_API}/calendars/{quote(calendar_id, safe="")}/events', params=params)
+
+    async def insert_calendar_event(self, calendar_id, event):
+        return await self.request('POST', f'{self.CALENDAR_API}/calendars/{quote(calendar_id, safe="")}/events', json_body=event)
+
+class AsyncEmailEngine:
+    """asyncio alternative to EmailPipeline with the same start/process/shutdown interface.
+
+    Runs an event loop on a background thread. Every message in a cycle is
+    handled by its own task: Gmail fetches go through AsyncGoogleClient and
+    summaries through AsyncCerebras (at most CONFIG['llm_max_concurrency']
+    at once), so hundreds of requests can be in flight without a thread per
+    request. Calendar calls from the API server run on the same loop (see
+    run). When RUNNING drops, tasks that haven't started writing are
+    cancelled and reported as failed; the rest finish so nothing is stored
+    twice.
+    """
+
+    def __init__(self, service, credentials, cerebras_client, processed_label_id, data):
+        self.service = service
+        self.credentials = credentials
+        self.async_cerebras_client = setup_async_cerebras_client() if cerebras_client else None
+        self.processed_label_id = processed_label_id
+        self.data = data
+        self.loop = None
+        self.thread = None
+        self.google = None
+        self.parse_pool = None
+        self.pending_label_ids = []
+
+    def start(self):
+        """Start the event loop thread and open the HTTP session."""
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='async-engine', daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._open(), self.loop).result()
+        print("⚡ Asyncio engine started")
+
+    def shutdown(self):
+        """Label what is still queued, close the session and stop the loop."""
+        asyncio.run_coroutine_threadsafe(self._close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        print("⚡ Asyncio engine stopped")
+
+    def process(self, message_ids):
+        """Process message IDs concurrently. Returns the IDs that failed."""
+        return asyncio.run_coroutine_threadsafe(self._process(message_ids), self.loop).result()
+
+    def flush_labels(self):
+        """Apply queued 'processed' labels now, e.g. before a checkpoint commit."""
+        asyncio.run_coroutine_threadsafe(self._flush_labels(), self.loop).result()
+
+    def run(self, coroutine, timeout=60):
+        """Run a coroutine on the engine loop from another thread (e.g. a Calendar call for Flask)."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout=timeout)
+
+    async def _open(self):
+        self.google = AsyncGoogleClient(self.credentials, get_project_id_from_credentials())
+        await self.google.open()
+        self.llm_semaphore = asyncio.Semaphore(CONFIG['llm_max_concurrency'])
+        self.save_lock = asyncio.Lock()
+        if CONFIG['fetch_format'] == 'raw':
+            self.parse_pool = ProcessPoolExecutor(max_workers=CONFIG['raw_parse_workers'])
+
+    async def _close(self):
+        await self._flush_labels()
+        await self.google.close()
+        if self.parse_pool:
+            self.parse_pool.shutdown(wait=True)
+
+    async def _process(self, message_ids):
+        tasks = [asyncio.create_task(self._handle(message_id)) for message_id in message_ids]
+        watcher = asyncio.create_task(self._cancel_on_stop(tasks))
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        watcher.cancel()
+
+        failed_ids = []
+        for message_id, result in zip(message_ids, results):
+            if result is True:
+                self.pending_label_ids.append(message_id)
+            elif result is not None:  # None means gone from Gmail, nothing to retry
+                if isinstance(result, asyncio.CancelledError):
+                    print(f"   ⏹️  Cancelled email {message_id}")
+                failed_ids.append(message_id)
+
+        await self._flush_labels()
+        return failed_ids
+
+    async def _cancel_on_stop(self, tasks):
+        """Cancel the cycle's tasks as soon as the monitor is stopping."""
+        while not all(task.done() for task in tasks):
+            if not RUNNING:
+                for task in tasks:
+                    task.cancel()
+                return
+            await asyncio.sleep(0.5)
+
+    async def _flush_labels(self):
+        """Label processed messages with batchModify, keeping failures for next time.
+
+        A failed chunk is retried one ID at a time, as in LabelCoalescer, so a
+        single bad ID (dropped on 400/404) can't fail the whole batch forever.
+        """
+        ids, self.pending_label_ids = self.pending_label_ids, []
+        for start in range(0, len(ids), BATCH_MODIFY_MAX_IDS):
+            chunk = ids[start:start + BATCH_MODIFY_MAX_IDS]
+            try:
+                await self.google.batch_modify(chunk, [self.processed_label_id])
+                print(f"   🏷️  Added 'processed' label to {len(chunk)} emails in bulk")
+            except Exception as e:
+                report_quota_error(e)
+                print(f"❌ Error adding label to {len(chunk)} emails: {e}")
+                if is_quota_error(e):
+                    self.pending_label_ids.extend(chunk)
+                else:
+                    await self._label_individually(chunk)
+
+    async def _label_individually(self, chunk):
+        """Label a chunk whose batchModify failed one message at a time."""
+        for message_id in chunk:
+            try:
+                await self.google.request(
+                    'POST',
+                    f'{self.google.GMAIL_API}/messages/{message_id}/modify',
+                    json_body={'addLabelIds': [self.processed_label_id]}
+                )
+            except GoogleApiError as e:
+                if e.status in (400, 404):
+                    print(f"   ⚠️  Dropping label for {message_id}: {e}")
+                else:
+                    self.pending_label_ids.append(message_id)
+            except Exception:
+                self.pending_label_ids.append(message_id)
+
+    async def _handle(self, message_id):
+        """Fetch, clean, summarize and persist one email.
+
+        Returns True on success, None if the message no longer exists and
+        False on any other failure.
+        """
+        try:
+            triage = None
+            if CONFIG['triage_enabled']:
+                metadata = await self.google.get_message(
+                    message_id, 'metadata', CONFIG['triage_metadata_headers'])
+                triage = triage_message(metadata)
+
+            if triage and triage['category'] == 'bulk':
+                email_info = extract_bulk_email_info(metadata, triage)
+                skip_summary = not CONFIG['summarize_bulk_mail']
+            else:
+                message = await self.google.get_message(message_id, CONFIG['fetch_format'])
+                if self.parse_pool:
+                    email_info = await self.loop.run_in_executor(self.parse_pool, parse_raw_message, message)
+                else:
+                    email_info = extract_email_info(message, self.service)
+                if triage:
+                    email_info['triage'] = triage
+                skip_summary = False
+
+            print(f"\n📧 Processing new email: {message_id} ({email_info.get('subject', 'No Subject')})")
+
+            if self.async_cerebras_client and CONFIG['enable_summary'] and not skip_summary:
+                # Content cleaning is CPU work, keep it off the event loop
+                content = await asyncio.to_thread(extract_meaningful_content, email_info)
+                async with self.llm_semaphore:
+                    return await self._complete(self._summarize_and_persist(email_info, content))
+            return await self._complete(self._persist(email_info))
+
+        except GoogleApiError as e:
+            report_quota_error(e)
+            print(f"❌ Error fetching email {message_id}: {e}")
+            return None if e.status == 404 else False
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Error processing email {message_id}: {e}")
+            return False
+
+    async def _complete(self, coroutine):
+        """Run the writing part of a message to the end, even if the cycle is cancelled.
+
+        Events and the email record are written from here on; cancelling
+        halfway would retry the message and store it twice.
+        """
+        task = asyncio.ensure_future(coroutine)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            return await task
+
+    async def _summarize_and_persist(self, email_info, content):
+        await generate_email_summary_async(email_info, self.async_cerebras_client, content)
+        return await self._persist(email_info)
+
+    async def _persist(self, email_info):
+        async with self.save_lock:
+            await asyncio.to_thread(insert_email_record, self.data, email_info)
+        return True
+
 # =============================================================================
 # EMAIL MONITORING FUNCTIONS
 # =============================================================================
 
+def is_quota_error(error):
+    """Check whether a Gmail HttpError (or async GoogleApiError) is a rate limit / quota error."""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+    elif isinstance(error, GoogleApiError):
+        status = error.status
+    else:
+        return False
+    if status == 429:
+        return True
+    return status == 403 and 'rateLimitExceeded' in str(error)
+
+def report_quota_error(error):
+    """Hand a Gmail quota error to the poll scheduler's backoff.
+
+    Gmail calls that recover from their own errors (listing, labelling,
+    batch fetches, pipeline threads) call this so the monitor still backs
+    off. Returns True if it was a quota error.
+    """
+    if not is_quota_error(error):
+        return False
+    if poll_scheduler:
+        poll_scheduler.record_quota_error()
+    return True
+
+class PollScheduler:
+    """Adaptive interval between monitor cycles.
+
+    Drops to CONFIG['poll_min_interval'] after a cycle that found mail, backs
+    off by CONFIG['poll_backoff_factor'] per idle cycle up to
+    CONFIG['poll_max_interval'], and waits out an exponential backoff after
+    Gmail quota errors (reported from any Gmail call, at most one backoff step
+    per cycle). A push notification wakes the wait immediately; while
+    pushes are arriving, polling slows to CONFIG['push_poll_interval'].
+    """
+
+    def __init__(self):
+        self.interval = CONFIG['poll_interval']
+        self.idle_cycles = 0
+        self.quota_errors = 0
+        self.quota_backoff = 0
+        self.quota_error_this_cycle = False
+        self.next_poll_at = None
+        self.last_push_at = None
+        self.last_push_history_id = None
+        self.push_count = 0
+        self.wake_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def record_cycle(self, found_count):
+        """Adapt the interval to whether the last cycle found new mail."""
+        with self.lock:
+            if not self.quota_error_this_cycle:
+                self.quota_errors = 0
+                self.quota_backoff = 0
+            if found_count > 0:
+                self.idle_cycles = 0
+                self.interval = CONFIG['poll_min_interval']
+            else:
+                self.idle_cycles += 1
+                self.interval = min(self.interval * CONFIG['poll_backoff_factor'], CONFIG['poll_max_interval'])
+            self.interval = max(self.interval, CONFIG['poll_min_interval'])
+
+    def record_quota_error(self):
+        """Back off exponentially after a Gmail quota error."""
+        with self.lock:
+            if self.quota_error_this_cycle:
+                return  # Already backing off for this cycle
+            self.quota_error_this_cycle = True
+            self.quota_errors += 1
+            self.quota_backoff = min(
+                CONFIG['poll_quota_backoff'] * 2 ** (self.quota_errors - 1),
+                CONFIG['poll_quota_max_backoff']
+            )
+            print(f"\n⚠️  Gmail quota exceeded, backing off {self.quota_backoff} seconds")
+
+    def push_active(self):
+        """Whether push notifications have arrived recently."""
+        return (self.last_push_at is not None
+                and time.time() - self.last_push_at < CONFIG['push_active_window'])
+
+    def wake(self, history_id=None):
+        """Start the next cycle now (push notification or shutdown)."""
+        if history_id is not None:
+            with self.lock:
+                self.last_push_at = time.time()
+                self.last_push_history_id = history_id
+                self.push_count += 1
+        self.wake_event.set()
+
+    def next_delay(self):
+        """Seconds to wait before the next cycle."""
+        with self.lock:
+            interval = CONFIG['push_poll_interval'] if self.push_active() else self.interval
+            return max(interval, self.quota_backoff)
+
+    def wait(self):
+        """Sleep until the next cycle is due or something wakes the monitor.
+
+        A wake during quota backoff is ignored until the backoff has passed.
+        """
+        delay = self.next_delay()
+        self.next_poll_at = datetime.now() + timedelta(seconds=delay)
+        deadline = time.time() + delay
+        not_before = time.time() + self.quota_backoff
+        while RUNNING and time.time() < deadline:
+            if self.wake_event.wait(timeout=min(1, deadline - time.time())):
+                self.wake_event.clear()
+                if time.time() >= not_before or not RUNNING:
+                    break
+        with self.lock:
+            self.quota_error_this_cycle = False
+
+    def status(self):
+        """Scheduler state for the /health endpoint."""
+        with self.lock:
+            return {
+                'current_interval': round(self.interval, 1),
+                'quota_backoff': self.quota_backoff,
+                'idle_cycles': self.idle_cycles,
+                'next_poll_at': self.next_poll_at.isoformat() if self.next_poll_at else None,
+                'push_active': self.push_active(),
+                'push_notifications': self.push_count,
+                'last_push_history_id': self.last_push_history_id
+            }
+
+def drain_catchup_backlog(service, processed_label_id, sync_state, pipeline):
+    """Process part of the catch-up backlog within this cycle's budget.
+
+    The backlog is drained newest first, in pipeline-sized chunks, until
+    CONFIG['catchup_cycle_messages'] emails or CONFIG['catchup_cycle_seconds']
+    are used up. Progress is checkpointed after every chunk. Returns the IDs
+    that failed so they can be retried; they are also saved to the retry list
+    before their chunk leaves the backlog, so a stop mid catch-up keeps them.
+    """
+    deadline = time.time() + CONFIG['catchup_cycle_seconds']
+    budget = CONFIG['catchup_cycle_messages']
+    catchup = sync_state['catchup']
+    failed_ids = []
+
+    listing_done = list_catchup_backlog(service, processed_label_id, sync_state, deadline)
+
+    processed = 0
+    while catchup['pending_ids'] and processed < budget and time.time() < deadline and RUNNING:
+        chunk = catchup['pending_ids'][:min(CONFIG['fetch_batch_size'], budget - processed)]
+        chunk_failed = pipeline.process(chunk)
+        failed_ids.extend(chunk_failed)
+        if chunk_failed:
+            retry_ids = sync_state.setdefault('retry_message_ids', [])
+            retry_ids.extend(message_id for message_id in chunk_failed if message_id not in retry_ids)
+        del catchup['pending_ids'][:len(chunk)]
+        processed += len(chunk)
+        save_sync_state(sync_state)
+
+    if processed:
+        print(f"\n⏩ Catch-up: processed {processed} backlog emails, {len(catchup['pending_ids'])} remaining"
+              + ("" if listing_done else " (still listing)"))
+
+    if listing_done and not catchup['pending_ids']:
+        print(f"\n✅ Catch-up complete (started {catchup['started_at']})")
+        del sync_state['catchup']
+        save_sync_state(sync_state)
+
+    return failed_ids
+
 def monitor_emails():
     """Main monitoring function that runs continuously."""
-    global gmail_service, calendar_service, cerebras_client
+    global gmail_service, calendar_service, cerebras_client, poll_scheduler, async_engine
     
     print("🔄 Starting Enhanced Gmail Email Monitor with API Server...")
     print(f"⚙️  Configuration:")
-    print(f"   📊 Poll interval: {CONFIG['poll_interval']} seconds")
+    print(f"   📊 Poll interval: adaptive {CONFIG['poll_min_interval']}-{CONFIG['poll_max_interval']} seconds (starting at {CONFIG['poll_interval']})")
     print(f"   🧠 AI Summary enabled: {CONFIG['enable_summary']}")
     print(f"   🔄 Summary retry attempts: {CONFIG['summary_retry_attempts']}")
     print(f"   ⏳ Summary retry delay: {CONFIG['summary_retry_delay']} seconds")
+    print(f"   🔌 Circuit breaker: opens after {CONFIG['llm_breaker_failure_threshold']} failures, trial call after {CONFIG['llm_breaker_reset_timeout']} seconds")
+    print(f"   📅 Local event extraction: {CONFIG['local_event_extraction']}")
     print(f"   🏷️  Processed label: {CONFIG['processed_label']}")
     print(f"   📄 Email database: {CONFIG['json_file']}")
     print(f"   📅 Events database: {CONFIG['events_json_file']}")
+    print(f"   🔖 Sync checkpoint: {CONFIG['sync_state_file']}")
     print(f"   🌐 API server: {CONFIG['api_server_host']}:{CONFIG['api_server_port']}")
+    print(f"   ⚙️  Engine: {CONFIG['monitor_engine']}")
     
     # Setup APIs
     gmail_service = authenticate_gmail()
-    calendar_service = authenticate_calendar(gmail_service._http.credentials)
+    calendar_service = authenticate_calendar(gmail_credentials)
     cerebras_client = setup_cerebras_client() if CONFIG['enable_summary'] else None
     
     print("✅ Gmail authentication successful")
@@ -1660,41 +5663,52 @@ def monitor_emails():
     # Load existing data
     data = load_existing_data()
     events_data = load_events_data()
+    sync_state = load_sync_state()
+    
+    if CONFIG['monitor_engine'] == 'asyncio' and aiohttp is None:
+        print("⚠️  aiohttp not installed, falling back to the threaded pipeline")
+    if CONFIG['monitor_engine'] == 'asyncio' and aiohttp is not None:
+        pipeline = AsyncEmailEngine(gmail_service, gmail_credentials, cerebras_client, processed_label_id, data)
+    else:
+        pipeline = EmailPipeline(gmail_service, cerebras_client, processed_label_id, data)
+    pipeline.start()
+    if isinstance(pipeline, AsyncEmailEngine):
+        async_engine = pipeline
+    deferred_worker = None
+    if cerebras_client:
+        deferred_worker = DeferredSummaryWorker(cerebras_client, data)
+        deferred_worker.start()
+    poll_scheduler = PollScheduler()
+    start_gmail_watch(gmail_service, sync_state)
     
     print(f"\n✅ Monitor started! Press Ctrl+C to stop.")
     print(f"🔍 Watching for new emails...")
     print(f"📧 Current email count: {data['total_emails']}")
     print(f"📅 Current events count: {events_data['total_events']}")
     
-    last_check = datetime.now()
-    
     while RUNNING:
         try:
-            # Get unprocessed emails
-            messages = get_unprocessed_emails(gmail_service, processed_label_id, since_time=last_check - timedelta(hours=1))
+            # Get unprocessed emails (incremental via historyId, full query only without a checkpoint)
+            messages, new_history_id = sync_unprocessed_emails(
+                gmail_service,
+                processed_label_id,
+                sync_state,
+                since_time=get_catchup_since_time()
+            )
+            failed_ids = []
             
             if messages:
                 print(f"\n📬 Found {len(messages)} unprocessed emails")
                 
-                # Process each email
-                for message in messages:
-                    if not RUNNING:  # Check if we should stop
-                        break
-                    
-                    success = process_new_email(
-                        gmail_service, 
-                        message['id'], 
-                        cerebras_client, 
-                        processed_label_id,
-                        data
-                    )
-                    
-                    if success:
-                        print(f"   ✅ Email processed successfully")
-                    
-                    # Small delay between processing emails
-                    time.sleep(1)
-                
+                # Push the whole cycle through the staged pipeline
+                failed_ids = pipeline.process([message['id'] for message in messages])
+            
+            # Work through any backlog left by downtime within the cycle budget
+            catching_up = bool(sync_state.get('catchup'))
+            if catching_up and RUNNING:
+                failed_ids += drain_catchup_backlog(gmail_service, processed_label_id, sync_state, pipeline)
+            
+            if messages or catching_up:
                 print(f"\n📊 Total emails in database: {data['total_emails']}")
                 
                 # Reload events data to show current count
@@ -1703,18 +5717,36 @@ def monitor_emails():
             else:
                 print(".", end="", flush=True)  # Show activity without cluttering output
             
-            last_check = datetime.now()
+            # Only advance the checkpoint once the whole batch was handled and labelled
+            if RUNNING:
+                pipeline.flush_labels()
+                commit_sync_checkpoint(sync_state, new_history_id, failed_ids)
+                start_gmail_watch(gmail_service, sync_state)  # Renews when close to expiry
+            if summary_cache:
+                summary_cache.save_if_due()  # Hits since the last write (used_at) go out too
             
-            # Wait before next check
-            time.sleep(CONFIG['poll_interval'])
+            # Wait before next check, sooner when mail is flowing or a backlog remains
+            poll_scheduler.record_cycle(len(messages) + len(sync_state.get('catchup', {}).get('pending_ids', [])))
+            poll_scheduler.wait()
             
         except KeyboardInterrupt:
             break
         except Exception as e:
+            if is_quota_error(e):
+                poll_scheduler.record_quota_error()
+                poll_scheduler.wait()
+                continue
             print(f"\n❌ Error in monitoring loop: {e}")
             print("⏸️  Waiting 60 seconds before retrying...")
             time.sleep(60)
     
+    async_engine = None
+    pipeline.shutdown()
+    if deferred_worker:
+        deferred_worker.stop()
+    if summary_cache:
+        summary_cache.save()
+    
     # Final statistics
     events_data = load_events_data()
     print(f"\n🛑 Email monitor stopped.")
@@ -1731,9 +5763,13 @@ def main():
         print(f"   GET  http://localhost:{CONFIG['api_server_port']}/get_calendar_events?date=YYYY-MM-DD&timezone=TZ")
         print(f"   GET  http://localhost:{CONFIG['api_server_port']}/get_emails")
         print(f"   GET  http://localhost:{CONFIG['api_server_port']}/get_email/<id>")
+        print(f"   GET  http://localhost:{CONFIG['api_server_port']}/get_attachment/<message_id>/<attachment_id>")
         print(f"   GET  http://localhost:{CONFIG['api_server_port']}/get_processed_emails")
         print(f"   GET  http://localhost:{CONFIG['api_server_port']}/get_events")
+        print(f"   GET  http://localhost:{CONFIG['api_server_port']}/get_threads")
+        print(f"   GET  http://localhost:{CONFIG['api_server_port']}/get_thread/<thread_id>")
         print(f"   GET  http://localhost:{CONFIG['api_server_port']}/health")
+        print(f"   POST http://localhost:{CONFIG['api_server_port']}/gmail_push  (Pub/Sub push endpoint)")
         print()
         print("📧 Send email example:")
         print(f'   curl -X POST http://localhost:{CONFIG["api_server_port"]}/send_email \\')